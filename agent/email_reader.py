@@ -9,17 +9,13 @@ load_dotenv()
 EMAIL = os.getenv("EMAIL")
 EMAIL_PASS = os.getenv("EMAIL_PASS")
 
-def fetch_support_emails(limit=150):
+def iter_support_emails(limit=150, output_dir="data"):
     """
-    Se connecte à la boîte Gmail du support et lit :
-    - les messages envoyés ([Gmail]/Sent Mail)
-    Enregistre les résultats(données brutes) dans sent_emails.csv + pièces jointes image
+    Se connecte à la boîte Gmail du support et produit les messages un par un
+    (pièces jointes image enregistrées au passage), sans attendre la fin du téléchargement.
     """
-    sent_emails = []
-
-    sent_dir = Path("data")
-    img_dir = Path("data")
-    sent_dir.mkdir(parents=True, exist_ok=True)
+    img_dir = Path(output_dir)
+    img_dir.mkdir(parents=True, exist_ok=True)
 
     print("- Connexion à Gmail (support)...")
 
@@ -37,7 +33,7 @@ def fetch_support_emails(limit=150):
                         f.write(att.payload)
                     image_paths.append(str(img_path))
 
-            sent_emails.append({
+            yield {
                 "uid": msg.uid,
                 "subject": msg.subject,
                 "from": msg.from_,
@@ -46,15 +42,26 @@ def fetch_support_emails(limit=150):
                 "content": msg.text or msg.html or "",
                 "image_paths": ", ".join(image_paths),
                 "folder": "SENT"
-            })
-
-        # === Sauvegarde CSV ===
-        csv_path = sent_dir / "sent_emails.csv"
-        with open(csv_path, "w", newline="", encoding="utf-8") as csvfile:
-            fieldnames = ["uid", "subject", "from", "to", "date", "content", "image_paths", "folder"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, quoting=csv.QUOTE_ALL)
-            writer.writeheader()
-            writer.writerows(sent_emails)
+            }
+
+def fetch_support_emails(limit=150, output_dir="data"):
+    """
+    Se connecte à la boîte Gmail du support et lit :
+    - les messages envoyés ([Gmail]/Sent Mail)
+    Enregistre les résultats(données brutes) dans sent_emails.csv + pièces jointes image
+    """
+    sent_dir = Path(output_dir)
+    sent_dir.mkdir(parents=True, exist_ok=True)
+
+    sent_emails = list(iter_support_emails(limit=limit, output_dir=output_dir))
+
+    # === Sauvegarde CSV ===
+    csv_path = sent_dir / "sent_emails.csv"
+    with open(csv_path, "w", newline="", encoding="utf-8") as csvfile:
+        fieldnames = ["uid", "subject", "from", "to", "date", "content", "image_paths", "folder"]
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        writer.writerows(sent_emails)
 
 
     print(f" {len(sent_emails)} e-mails envoyés sauvegardés dans : {csv_path}")
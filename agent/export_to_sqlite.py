@@ -1,40 +1,38 @@
-import sqlite3
 import pandas as pd
 import os
+import sys
+
+# Couche de stockage partagée avec le chatbot (rag_chatbot/storage.py)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'rag_chatbot'))
+from storage import QAPair, get_storage
 
 # Chemin du fichier CSV
 csv_file = os.path.join(os.path.dirname(__file__), '..', 'data', 'mails_data_cleaned_final.csv')
 
-# Charger les données
-df = pd.read_csv(csv_file)
-
-# Connexion à la base SQLite (elle sera créée si elle n'existe pas)
-db_path = os.path.join(os.path.dirname(__file__), '..','db', 'qa_database.db')
-conn = sqlite3.connect(db_path)
-cursor = conn.cursor()
-
-# Créer la table (si elle n'existe pas déjà)
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS qa_pairs (
-        uid INTEGER PRIMARY KEY AUTOINCREMENT,
-        logiciel TEXT,
-        probleme TEXT,
-        solution TEXT,
-        type_probleme TEXT
-    )
-''')
 
+def export_csv_to_sqlite(input_csv=csv_file):
+    # Charger les données
+    df = pd.read_csv(input_csv)
 
-# Insérer les données
-for _, row in df.iterrows():
-    cursor.execute('''
-    INSERT INTO qa_pairs (uid, logiciel, probleme, solution, type_probleme)
-    VALUES (?, ?, ?, ?, ?)
-''', (row['uid'], row['logiciel'], row['probleme'], row['solution'], row['type du probleme']))
+    # Base configurée par DB_PATH (créée et migrée si elle n'existe pas)
+    storage = get_storage()
+
+    # Insérer les données par lots (les doublons de contenu sont ignorés)
+    pairs = (
+        QAPair(
+            uid=int(row['uid']),
+            logiciel=row['logiciel'],
+            probleme=row['probleme'],
+            solution=row['solution'],
+            type_probleme=row['type du probleme']
+        )
+        for _, row in df.iterrows()
+    )
+    inserted = storage.insert_qa_pairs(pairs)
 
+    print(f" {inserted} données insérées avec succès dans {storage.db_path}")
+    return inserted
 
-# Valider et fermer
-conn.commit()
-conn.close()
 
-print(" Données insérées avec succès dans qa_database.db")
+if __name__ == "__main__":
+    export_csv_to_sqlite()
@@ -0,0 +1,309 @@
+"""
+ORCHESTRATEUR DU PIPELINE (fetch -> preprocess -> extract, load, kb_update -> index)
+
+Chaque étape déclare ses entrées, sorties, fichiers de code et paramètres.
+Une empreinte (SHA-256) de ces éléments est enregistrée après chaque succès :
+au passage suivant, une étape dont l'empreinte n'a pas changé et dont les
+sorties existent est sautée. Les étapes indépendantes tournent en parallèle.
+
+Usage:
+    python agent/pipeline_runner.py                 # ne fait que le nécessaire
+    python agent/pipeline_runner.py --dry-run       # affiche ce qui serait exécuté
+    python agent/pipeline_runner.py --force index   # force une étape
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Union
+
+ROOT = Path(__file__).resolve().parent.parent
+AGENT_DIR = ROOT / "agent"
+RAG_DIR = ROOT / "rag_chatbot"
+DATA_DIR = ROOT / "data"
+
+sys.path.append(str(AGENT_DIR))
+sys.path.append(str(RAG_DIR))
+
+# Une entrée est soit un fichier (empreinte de son contenu), soit une fonction
+# qui retourne une empreinte bon marché (ex: état de la base SQLite)
+StageInput = Union[Path, Callable[[], str]]
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[[], Any]
+    deps: List[str] = field(default_factory=list)
+    inputs: List[StageInput] = field(default_factory=list)
+    outputs: List[Path] = field(default_factory=list)
+    code: List[Path] = field(default_factory=list)
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str          # "ran", "skipped", "failed", "blocked"
+    duration: float = 0.0
+    error: Optional[str] = None
+
+
+def _file_digest(path: Path) -> str:
+    if not path.exists():
+        return "missing"
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def local_modules(*paths: Path) -> List[Path]:
+    """
+    Fichiers donnés et modules du dépôt (agent/, rag_chatbot/) qu'ils importent,
+    transitivement : le code d'une étape comprend tout ce qu'elle exécute.
+    """
+    found: Dict[Path, None] = {}
+    pending = list(paths)
+    while pending:
+        path = pending.pop()
+        if path in found or not path.exists():
+            continue
+        found[path] = None
+        tree = ast.parse(path.read_text(encoding="utf-8"), filename=str(path))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                for folder in (AGENT_DIR, RAG_DIR):
+                    candidate = folder.joinpath(*name.split(".")).with_suffix(".py")
+                    if candidate.exists():
+                        pending.append(candidate)
+                        break
+    return sorted(found)
+
+
+def env_params(*names: str) -> Dict[str, Optional[str]]:
+    """Variables d'environnement qui changent le résultat d'une étape (paramètres de l'empreinte)."""
+    return {name: os.getenv(name) for name in names}
+
+
+class PipelineRunner:
+    """Exécute un DAG d'étapes en sautant celles dont l'empreinte n'a pas changé"""
+
+    def __init__(self, stages: List[Stage], state_path: Path, max_workers: int = 4):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = Path(state_path)
+        self.max_workers = max_workers
+        self.state = self._load_state()
+        self._state_lock = threading.Lock()
+
+        for stage in stages:
+            unknown = set(stage.deps) - self.stages.keys()
+            if unknown:
+                raise ValueError(f"Étape {stage.name}: dépendances inconnues {sorted(unknown)}")
+
+    def _load_state(self) -> Dict[str, Dict[str, Any]]:
+        if not self.state_path.exists():
+            return {}
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f" État illisible ({e}), toutes les étapes seront exécutées")
+            return {}
+
+    def _save_state(self) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def fingerprint(self, stage: Stage) -> str:
+        """Empreinte des entrées, du code et des paramètres d'une étape"""
+        parts = {
+            "inputs": [item() if callable(item) else f"{item}:{_file_digest(item)}" for item in stage.inputs],
+            "code": [f"{path.relative_to(ROOT) if path.is_relative_to(ROOT) else path}:{_file_digest(path)}"
+                     for path in stage.code],
+            "params": stage.params,
+        }
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def is_up_to_date(self, stage: Stage, fingerprint: Optional[str] = None) -> bool:
+        recorded = self.state.get(stage.name, {}).get("fingerprint")
+        return (recorded == (fingerprint or self.fingerprint(stage))
+                and all(path.exists() for path in stage.outputs))
+
+    def _execute(self, stage: Stage, force: bool) -> StageResult:
+        # Empreinte prise avant l'exécution : une entrée modifiée pendant l'étape sera retraitée
+        fingerprint = self.fingerprint(stage)
+        if not force and self.is_up_to_date(stage, fingerprint):
+            return StageResult(stage.name, "skipped")
+
+        start = time.perf_counter()
+        try:
+            stage.func()
+        except Exception as e:
+            return StageResult(stage.name, "failed", time.perf_counter() - start, str(e))
+        duration = time.perf_counter() - start
+
+        with self._state_lock:
+            self.state[stage.name] = {
+                "fingerprint": fingerprint,
+                "finished_at": datetime.now().isoformat(),
+                "duration": round(duration, 3),
+            }
+            self._save_state()
+        return StageResult(stage.name, "ran", duration)
+
+    def run(self, force: Optional[Set[str]] = None) -> Dict[str, StageResult]:
+        """Exécute le DAG ; une étape démarre dès que ses dépendances sont terminées"""
+        force = force or set()
+        results: Dict[str, StageResult] = {}
+        pending = dict(self.stages)
+        running: Dict[Future, str] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    dep_results = [results.get(dep) for dep in stage.deps]
+                    if any(r is not None and r.status in ("failed", "blocked") for r in dep_results):
+                        results[name] = StageResult(name, "blocked", error="dépendance en échec")
+                        del pending[name]
+                    elif all(r is not None for r in dep_results):
+                        print(f" -> {name}")
+                        running[executor.submit(self._execute, stage, name in force)] = name
+                        del pending[name]
+
+                if not running:
+                    if pending:
+                        raise ValueError(f"Dépendances cycliques: {sorted(pending)}")
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    results[result.name] = result
+                    del running[future]
+                    print(f" <- {result.name}: {result.status} ({result.duration:.2f}s)"
+                          + (f" - {result.error}" if result.error else ""))
+
+        return results
+
+    def plan(self, force: Optional[Set[str]] = None) -> Dict[str, bool]:
+        """Étapes qui seraient exécutées, d'après l'état actuel des entrées"""
+        force = force or set()
+        return {name: name in force or not self.is_up_to_date(stage)
+                for name, stage in self.stages.items()}
+
+
+def build_stages(limit: int = 150) -> List[Stage]:
+    """Définition du pipeline de ce dépôt"""
+    sent_csv = DATA_DIR / "sent_emails.csv"
+    structured_input = DATA_DIR / "structured_input.csv"
+    structured_qr = DATA_DIR / "structured_qr.csv"
+    cleaned_csv = DATA_DIR / "mails_data_cleaned_final.csv"
+    knowledge_base = RAG_DIR / "knowledge_base.jsonl"
+    index_dir = Path(os.getenv("INDEX_DIR", str(RAG_DIR / "db" / "index")))
+    os.environ["INDEX_DIR"] = str(index_dir)
+
+    # Imports paresseux : qr_extractor initialise le client LLM à l'import
+    def fetch():
+        from email_reader import fetch_support_emails
+        fetch_support_emails(limit=limit, output_dir=str(DATA_DIR))
+
+    def preprocess():
+        from preprocessor import preprocess_sent_emails
+        preprocess_sent_emails(input_csv=str(sent_csv), output_csv=str(structured_input))
+
+    def extract():
+        from qr_extractor import extract_qr
+        extract_qr(input_csv=str(structured_input), output_csv=str(structured_qr))
+
+    def load():
+        from export_to_sqlite import export_csv_to_sqlite
+        export_csv_to_sqlite(input_csv=str(cleaned_csv))
+
+    def kb_update():
+        from update_rag_pipeline import RAGPipelineUpdater
+        if not RAGPipelineUpdater(knowledge_base_path=str(knowledge_base)).run(index=False):
+            raise RuntimeError("échec de la mise à jour depuis knowledge_base.jsonl")
+
+    model_name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+    def index():
+        from embed_and_index import DocumentEmbedder
+        DocumentEmbedder(model_name=model_name).update_index()
+
+    def db_fingerprint() -> str:
+        from storage import get_storage
+        return f"qa_pairs:{get_storage().fingerprint()}"
+
+    return [
+        # La boîte mail est distante : on la relit au plus une fois par jour
+        Stage("fetch", fetch, outputs=[sent_csv], code=local_modules(AGENT_DIR / "email_reader.py"),
+              params={"limit": limit, "day": date.today().isoformat()}),
+        Stage("preprocess", preprocess, deps=["fetch"], inputs=[sent_csv], outputs=[structured_input],
+              code=local_modules(AGENT_DIR / "preprocessor.py")),
+        Stage("extract", extract, deps=["preprocess"], inputs=[structured_input], outputs=[structured_qr],
+              code=local_modules(AGENT_DIR / "qr_extractor.py")),
+        # Le CSV final est validé à la main à partir de structured_qr.csv
+        Stage("load", load, inputs=[cleaned_csv], code=local_modules(AGENT_DIR / "export_to_sqlite.py"),
+              params=env_params("DB_PATH")),
+        Stage("kb_update", kb_update, inputs=[knowledge_base],
+              code=local_modules(RAG_DIR / "update_rag_pipeline.py"), params=env_params("DB_PATH")),
+        # Modèle, backend et type / codage d'index changent les vecteurs : reconstruction
+        Stage("index", index, deps=["load", "kb_update"], inputs=[db_fingerprint],
+              outputs=[index_dir / "CURRENT"], code=local_modules(RAG_DIR / "embed_and_index.py"),
+              params={"index_dir": str(index_dir), "model_name": model_name,
+                      **env_params("DB_PATH", "EMBEDDING_BACKEND", "ONNX_MODEL_DIR", "INDEX_TARGET",
+                                   "INDEX_TYPE", "INDEX_STORAGE", "INDEX_SHARDS", "LEXICAL_INDEX",
+                                   "TOMBSTONE_COMPACTION_RATIO")}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline e-mails -> base de connaissances -> index FAISS")
+    parser.add_argument("--force", nargs="*", default=[], help="étapes à exécuter même si elles sont à jour")
+    parser.add_argument("--dry-run", action="store_true", help="affiche les étapes à exécuter sans rien lancer")
+    parser.add_argument("--workers", type=int, default=4, help="nombre d'étapes exécutées en parallèle")
+    parser.add_argument("--limit", type=int, default=150, help="nombre d'e-mails à récupérer")
+    args = parser.parse_args()
+
+    runner = PipelineRunner(build_stages(limit=args.limit), DATA_DIR / ".pipeline_state.json",
+                            max_workers=args.workers)
+
+    if args.dry_run:
+        for name, needed in runner.plan(set(args.force)).items():
+            print(f" {name:<12} {'à exécuter' if needed else 'à jour'}")
+        return
+
+    start = time.perf_counter()
+    results = runner.run(force=set(args.force))
+
+    print("\n=== Résumé ===")
+    for name in runner.stages:
+        result = results[name]
+        print(f" {name:<12} {result.status:<8} {result.duration:7.2f}s")
+    print(f" Total: {time.perf_counter() - start:.2f}s")
+
+    sys.exit(1 if any(r.status in ("failed", "blocked") for r in results.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
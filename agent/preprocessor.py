@@ -26,6 +26,20 @@ def detect_logiciel(text):
             return l
     return ""
 
+def prepare_email(mail):
+    """Version unitaire du prétraitement : un e-mail brut -> une ligne de structured_input"""
+    subject = "" if pd.isna(mail.get("subject")) else str(mail.get("subject"))
+    content_clean = clean_content(mail.get("content"))
+    image_paths = mail.get("image_paths")
+
+    return {
+        "uid": mail["uid"],
+        "subject": subject,
+        "email_full": subject + "\n" + content_clean,
+        "has_image": False if pd.isna(image_paths) or str(image_paths).strip() == "" else True,
+        "logiciel_detecte": detect_logiciel(subject + " " + content_clean),
+    }
+
 def preprocess_sent_emails(input_csv="data/sent_emails.csv", output_csv="data/structured_input.csv"):
     df = pd.read_csv(input_csv)
 
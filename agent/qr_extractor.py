@@ -46,40 +46,44 @@ Retourne uniquement un JSON structuré :
 
 chain = LLMChain(llm=llm, prompt=prompt_template)
 
+# Extraction d'un seul e-mail (utilisée aussi par le pipeline en flux)
+def extract_one(uid, email_text, logiciel_detecte=""):
+    """Retourne la paire Q/R extraite d'un e-mail, ou None si l'e-mail est trop court ou illisible"""
+    if pd.isna(email_text) or len(email_text.strip()) < 30:
+        return None
+
+    try:
+        print(f"🟡 Traitement email UID {uid}...")
+        response = chain.run(email_full=email_text)
+
+        # Nettoyage + parsing JSON
+        response = response.strip().replace("“", "\"").replace("”", "\"")
+        json_start = response.find('{')
+        json_end = response.rfind('}') + 1
+        json_str = response[json_start:json_end]
+
+        data = json.loads(json_str)
+
+        return {
+            "uid": uid,
+            "logiciel": data.get("logiciel", logiciel_detecte),
+            "probleme": data.get("probleme", "").strip(),
+            "solution": data.get("solution", "").strip(),
+        }
+
+    except Exception as e:
+        print(f"❌ Erreur avec l’email UID {uid} : {e}")
+        return None
+
 # Extraction
 def extract_qr(input_csv="data/structured_input.csv", output_csv="data/structured_qr.csv"):
     df = pd.read_csv(input_csv)
     structured_results = []
 
     for idx, row in df.iterrows():
-        email_text = row["email_full"]
-        uid = row["uid"]
-
-        if pd.isna(email_text) or len(email_text.strip()) < 30:
-            continue
-
-        try:
-            print(f"🟡 Traitement email UID {uid}...")
-            response = chain.run(email_full=email_text)
-
-            # Nettoyage + parsing JSON
-            response = response.strip().replace("“", "\"").replace("”", "\"")
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            json_str = response[json_start:json_end]
-
-            data = json.loads(json_str)
-
-            structured_results.append({
-                "uid": uid,
-                "logiciel": data.get("logiciel", row.get("logiciel_detecte", "")),
-                "probleme": data.get("probleme", "").strip(),
-                "solution": data.get("solution", "").strip(),
-            })
-
-        except Exception as e:
-            print(f"❌ Erreur avec l’email UID {uid} : {e}")
-            continue
+        result = extract_one(row["uid"], row["email_full"], row.get("logiciel_detecte", ""))
+        if result:
+            structured_results.append(result)
 
     # Enregistrer dans un CSV final
     df_out = pd.DataFrame(structured_results)
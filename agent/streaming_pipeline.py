@@ -0,0 +1,317 @@
+"""
+PIPELINE EN FLUX (fetch -> clean -> extract -> load -> embed)
+
+Les étapes tournent en même temps, reliées par des files bornées : l'extraction
+LLM commence dès le premier e-mail téléchargé et l'index est mis à jour par
+petits lots pendant que le reste arrive. Une file pleine bloque l'étape
+précédente (contre-pression), la mémoire reste donc bornée quelle que soit
+la taille de la boîte mail.
+
+Contrairement à pipeline_runner.py, ce mode charge directement les paires
+extraites dans SQLite, sans passer par la validation manuelle du CSV.
+
+Usage:
+    python agent/streaming_pipeline.py --limit 150 --extract-workers 4
+"""
+
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+AGENT_DIR = ROOT / "agent"
+RAG_DIR = ROOT / "rag_chatbot"
+DATA_DIR = ROOT / "data"
+
+sys.path.append(str(AGENT_DIR))
+sys.path.append(str(RAG_DIR))
+
+# Marqueur de fin de flux, propagé d'une étape à l'autre
+_END = object()
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int = 1
+    processed: int = 0
+    emitted: int = 0
+    errors: int = 0
+    busy: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    first_output_at: Optional[float] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, duration: float, emitted: int, error: bool = False, count: int = 1) -> None:
+        with self._lock:
+            self.processed += count
+            self.emitted += emitted
+            self.errors += int(error)
+            self.busy += duration
+            if emitted and self.first_output_at is None:
+                self.first_output_at = time.perf_counter()
+
+    @property
+    def throughput(self) -> float:
+        """Éléments traités par seconde depuis le démarrage de l'étape"""
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def utilization(self) -> float:
+        """Part du temps où les workers de l'étape travaillaient (1.0 = goulot d'étranglement)"""
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return self.busy / (elapsed * self.workers) if elapsed > 0 else 0.0
+
+
+class StreamingPipeline:
+    """Chaîne d'étapes concurrentes reliées par des files bornées"""
+
+    def __init__(self, queue_size: int = 32):
+        self.queue_size = queue_size
+        self.stats: Dict[str, StageStats] = {}
+        self._threads: List[threading.Thread] = []
+        self._last_queue: Optional[queue.Queue] = None
+        self._stop = threading.Event()
+
+    def _new_queue(self) -> queue.Queue:
+        return queue.Queue(maxsize=self.queue_size)
+
+    def source(self, name: str, iterable_factory: Callable[[], Iterable[Any]]) -> "StreamingPipeline":
+        """Première étape : produit les éléments d'un itérable"""
+        out_q = self._new_queue()
+        stats = self.stats[name] = StageStats(name)
+
+        def run():
+            stats.started_at = time.perf_counter()
+            try:
+                iterator = iter(iterable_factory())
+                while not self._stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    stats.record(time.perf_counter() - start, 1)
+                    out_q.put(item)
+            except Exception as e:
+                stats.record(0.0, 0, error=True, count=0)
+                print(f"❌ [{name}] source interrompue : {e}")
+            finally:
+                stats.finished_at = time.perf_counter()
+                out_q.put(_END)
+
+        self._threads.append(threading.Thread(target=run, name=name, daemon=True))
+        self._last_queue = out_q
+        return self
+
+    def map(self, name: str, func: Callable[[Any], Any], workers: int = 1) -> "StreamingPipeline":
+        """Étape élément par élément ; un résultat None est filtré"""
+        in_q, out_q = self._last_queue, self._new_queue()
+        stats = self.stats[name] = StageStats(name, workers=workers)
+        remaining = [workers]
+        remaining_lock = threading.Lock()
+
+        def run():
+            if stats.started_at is None:
+                stats.started_at = time.perf_counter()
+            while True:
+                item = in_q.get()
+                if item is _END:
+                    in_q.put(_END)  # réveille les autres workers de l'étape
+                    break
+                start = time.perf_counter()
+                try:
+                    result = func(item)
+                except Exception as e:
+                    stats.record(time.perf_counter() - start, 0, error=True)
+                    print(f"❌ [{name}] {e}")
+                    continue
+                stats.record(time.perf_counter() - start, int(result is not None))
+                if result is not None:
+                    out_q.put(result)
+
+            # Le dernier worker à terminer ferme le flux en aval
+            with remaining_lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                stats.finished_at = time.perf_counter()
+                out_q.put(_END)
+
+        for i in range(workers):
+            self._threads.append(threading.Thread(target=run, name=f"{name}-{i}", daemon=True))
+        self._last_queue = out_q
+        return self
+
+    def batch(self, name: str, func: Callable[[List[Any]], Optional[List[Any]]],
+              max_items: int = 32, max_wait: float = 2.0) -> "StreamingPipeline":
+        """
+        Étape par lots : func reçoit jusqu'à max_items éléments, ou ce qui est
+        arrivé depuis max_wait secondes. Elle retourne les éléments à passer en aval.
+        """
+        in_q, out_q = self._last_queue, self._new_queue()
+        stats = self.stats[name] = StageStats(name)
+
+        def flush(pending: List[Any]) -> None:
+            start = time.perf_counter()
+            try:
+                results = func(pending) or []
+            except Exception as e:
+                stats.record(time.perf_counter() - start, 0, error=True, count=len(pending))
+                print(f"❌ [{name}] lot de {len(pending)} : {e}")
+                return
+            stats.record(time.perf_counter() - start, len(results), count=len(pending))
+            for result in results:
+                out_q.put(result)
+
+        def run():
+            stats.started_at = time.perf_counter()
+            pending: List[Any] = []
+            deadline = None
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+                try:
+                    item = in_q.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                if item is _END:
+                    break
+                if item is not None:
+                    pending.append(item)
+                    if deadline is None:
+                        deadline = time.perf_counter() + max_wait
+                if pending and (len(pending) >= max_items or time.perf_counter() >= deadline):
+                    flush(pending)
+                    pending, deadline = [], None
+            if pending:
+                flush(pending)
+            stats.finished_at = time.perf_counter()
+            out_q.put(_END)
+
+        self._threads.append(threading.Thread(target=run, name=name, daemon=True))
+        self._last_queue = out_q
+        return self
+
+    def report(self) -> str:
+        lines = []
+        for s in self.stats.values():
+            lines.append(f" {s.name:<8} traités={s.processed:<5} émis={s.emitted:<5} erreurs={s.errors:<3}"
+                         f" débit={s.throughput:6.2f}/s occupation={s.utilization:4.0%}")
+        return "\n".join(lines)
+
+    def run(self, report_interval: float = 10.0) -> Dict[str, StageStats]:
+        """Démarre toutes les étapes et attend la fin du flux"""
+        start = time.perf_counter()
+        for thread in self._threads:
+            thread.start()
+
+        # Vide la dernière file pour ne jamais bloquer la dernière étape
+        sink = self._last_queue
+        next_report = time.perf_counter() + report_interval
+        try:
+            while True:
+                try:
+                    if sink.get(timeout=0.5) is _END:
+                        break
+                except queue.Empty:
+                    pass
+                if report_interval and time.perf_counter() >= next_report:
+                    print(f"\n--- {time.perf_counter() - start:.0f}s ---\n{self.report()}")
+                    next_report += report_interval
+        except KeyboardInterrupt:
+            print(" Arrêt demandé, fin des éléments en cours...")
+            self._stop.set()
+            # La dernière file doit encore être vidée : sinon la dernière étape reste
+            # bloquée sur put() en vidant son lot et n'envoie jamais _END
+            while sink.get() is not _END:
+                pass
+            for thread in self._threads:
+                thread.join()
+            raise
+
+        for thread in self._threads:
+            thread.join()
+        return self.stats
+
+
+def build_pipeline(limit: int = 150, extract_workers: int = 4, queue_size: int = 32,
+                   embed_interval: float = 5.0, batch_size: int = 50) -> StreamingPipeline:
+    """Définition du pipeline en flux de ce dépôt"""
+    os.environ.setdefault("INDEX_DIR", str(RAG_DIR / "db" / "index"))
+
+    from email_reader import iter_support_emails
+    from preprocessor import prepare_email
+    # Import paresseux : qr_extractor initialise le client LLM à l'import
+    from qr_extractor import extract_one
+    from storage import QAPair, get_storage
+    from embed_and_index import DocumentEmbedder
+
+    storage = get_storage()
+    storage.init_db()
+    embedder = DocumentEmbedder()
+
+    def extract(mail: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        result = extract_one(mail["uid"], mail["email_full"], mail["logiciel_detecte"])
+        if not result or not result["probleme"] or not result["solution"]:
+            return None
+        return result
+
+    def load(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        pairs = [QAPair(logiciel=r["logiciel"] or "Inconnu", probleme=r["probleme"], solution=r["solution"])
+                 for r in results]
+        inserted = storage.insert_qa_pairs(pairs)
+        print(f" {inserted} nouvelles paires Q/R en base ({len(pairs) - inserted} doublons)")
+        return results if inserted else []
+
+    def embed(results: List[Dict[str, Any]]) -> List[int]:
+        added = embedder.update_index()
+        print(f" Index mis à jour : {added} entrées cherchables")
+        return [added] if added else []
+
+    return (StreamingPipeline(queue_size=queue_size)
+            .source("fetch", lambda: iter_support_emails(limit=limit, output_dir=str(DATA_DIR)))
+            .map("clean", prepare_email)
+            .map("extract", extract, workers=extract_workers)
+            .batch("load", load, max_items=batch_size, max_wait=embed_interval / 2)
+            .batch("embed", embed, max_items=batch_size * 4, max_wait=embed_interval))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline en flux e-mails -> SQLite -> index FAISS")
+    parser.add_argument("--limit", type=int, default=150, help="nombre d'e-mails à récupérer")
+    parser.add_argument("--extract-workers", type=int, default=4, help="appels LLM simultanés")
+    parser.add_argument("--queue-size", type=int, default=32, help="taille des files entre étapes")
+    parser.add_argument("--embed-interval", type=float, default=5.0,
+                        help="délai maximal (s) avant qu'une paire chargée soit indexée")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="fréquence des compteurs (s)")
+    args = parser.parse_args()
+
+    pipeline = build_pipeline(limit=args.limit, extract_workers=args.extract_workers,
+                              queue_size=args.queue_size, embed_interval=args.embed_interval)
+
+    start = time.perf_counter()
+    stats = pipeline.run(report_interval=args.report_interval)
+    total = time.perf_counter() - start
+
+    print("\n=== Résumé ===")
+    print(pipeline.report())
+    first = stats["embed"].first_output_at
+    if first is not None:
+        print(f" Première entrée cherchable après {first - start:.2f}s")
+    print(f" Total: {total:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,8 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 import time
-from chatbot import RAGChatbot
+from chatbot import CacheManager, RAGChatbot
+from settings_store import SettingsStore
 from utils.feedback_system import AdvancedFeedbackSystem
 from utils.data_form import DataEntryForm, render_data_entry_form
 from utils.auth_system import AuthSystem
@@ -313,7 +314,34 @@ def render_admin_dashboard(feedback_system, data_form, chatbot):
     st.subheader("Activité récente")
     render_recent_activity(feedback_system, perf_stats)
 
-def render_performance_dashboard(perf_stats):
+def render_startup_stats(chatbot):
+    """Démarrage du moteur de recherche : chargement, préchauffage, première question"""
+    if chatbot is None:
+        return
+    try:
+        stats = chatbot.searcher.startup_stats
+    except OSError as e:
+        st.warning(f"Service de recherche injoignable: {e}")
+        return
+    fmt = lambda value: f"{value:.2f}s" if value is not None else "—"
+    st.subheader("Démarrage du moteur de recherche")
+    if stats.get("error"):
+        st.error(f"Échec du démarrage: {stats['error']}")
+    elif not stats.get("ready"):
+        st.info("Chargement du modèle et de l'index en cours...")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Démarrage à froid", fmt(stats.get("cold_start")),
+                  f"modèle {fmt(stats.get('model_load'))} / index {fmt(stats.get('index_load'))}",
+                  delta_color="off")
+    with col2:
+        st.metric("Préchauffage", fmt(stats.get("warmup")))
+    with col3:
+        st.metric("Première question", fmt(stats.get("first_query")))
+    with col4:
+        st.metric("Chargement", "Arrière-plan" if stats.get("background") else "Synchrone")
+
+def render_performance_dashboard(perf_stats, chatbot=None):
     """Tableau de bord détaillé des performances"""
     st.markdown('<h1 class="admin-header">Dashboard Performance</h1>', unsafe_allow_html=True)
     
@@ -325,14 +353,16 @@ def render_performance_dashboard(perf_stats):
     with col2:
         if st.button(f"{ICONS['clear']} Vider le cache", use_container_width=True):
             try:
-                chatbot = RAGChatbot()
-                chatbot.cache.clear()
+                # Cache des réponses (fichiers JSON) : inutile de recharger modèle et index
+                CacheManager().clear()
                 st.success("Cache vidé avec succès!")
                 time.sleep(1)
                 st.rerun()
             except Exception as e:
                 st.error(f"Erreur: {e}")
     
+    render_startup_stats(chatbot)
+    
     if not perf_stats:
         # Valeurs par défaut démonstratives
         col1, col2, col3, col4 = st.columns(4)
@@ -362,6 +392,18 @@ def render_performance_dashboard(perf_stats):
         cache_rate = perf_stats.get('cache_hit_rate', 0)
         st.metric(f"{ICONS['cache']} Taux cache", f"{cache_rate:.1f}%")
     
+    # Réponses sans LLM (seuils de confiance)
+    st.subheader("Réponses sans appel au LLM")
+    gate_col1, gate_col2, gate_col3, gate_col4 = st.columns(4)
+    with gate_col1:
+        st.metric("Appels LLM évités", perf_stats.get('llm_calls_avoided', 0))
+    with gate_col2:
+        st.metric("Réponses directes", perf_stats.get('direct_answers', 0))
+    with gate_col3:
+        st.metric("Renvois au support", perf_stats.get('support_answers', 0))
+    with gate_col4:
+        st.metric("Appels LLM", perf_stats.get('llm_calls', 0))
+    
     # Détails du cache
     st.subheader("Statistiques détaillées du cache")
     
@@ -396,11 +438,18 @@ def render_system_settings():
         st.text_input("API Key OpenRouter", type="password", value=os.getenv("OPENROUTER_API_KEY", ""))
         st.number_input("Nombre max de résultats", min_value=1, max_value=10, value=3)
     
+    settings = SettingsStore()
     with col2:
-        st.slider("Seuil de confiance", min_value=0.0, max_value=1.0, value=0.3, step=0.1)
+        confidence_low, confidence_high = st.slider(
+            "Seuil de confiance", min_value=0.0, max_value=1.0,
+            value=(float(settings.get("confidence_low")), float(settings.get("confidence_high"))), step=0.05,
+            help="Similarité du meilleur résultat. En dessous du seuil bas : renvoi au support ; "
+                 "au-dessus du seuil haut : solution enregistrée renvoyée directement (sans appel au LLM)"
+        )
         st.toggle("Activer le cache", value=True)
     
     if st.button("Sauvegarder la configuration", type="primary"):
+        settings.update(confidence_low=confidence_low, confidence_high=confidence_high)
         st.success("Configuration sauvegardée avec succès!")
 
 def render_admin_login(auth_system):
@@ -485,7 +534,7 @@ def admin_app():
     elif admin_page == "analytics":
         render_advanced_analytics(feedback_system)
     elif admin_page == "performance":
-        render_performance_dashboard(perf_stats)
+        render_performance_dashboard(perf_stats, chatbot)
     elif admin_page == "feedback":
         render_feedback_analysis(feedback_system)
     elif admin_page == "system":
@@ -0,0 +1,81 @@
+"""
+BENCHMARK : encode() d'origine vs lots triés par longueur (budget de tokens)
+
+La référence est l'ancien chemin de code, un seul encoder.encode(textes,
+batch_size=32) : SentenceTransformer y trie déjà les textes par longueur
+(en caractères) avant de former ses lots, les encodeurs ONNX gardent l'ordre
+de la base. Le padding de référence est calculé sur ce même ordre.
+
+Mesure le débit, la part de padding et l'écart maximal entre les embeddings
+(doit rester au niveau du bruit numérique : le regroupement ne change pas le résultat).
+
+Usage:
+    python benchmarks/bench_batching.py --size 20000 --budgets 4096 8192 16384
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from bench_encoding import sample_texts  # noqa: E402
+from embedding_backend import load_encoder  # noqa: E402
+from embedding_scheduler import encode_bucketed, padding_ratio, plan_batches, token_lengths  # noqa: E402
+
+
+def reference_batches(encoder, texts: list, batch_size: int) -> list:
+    """Lots formés par encoder.encode(texts) : tri décroissant par longueur pour SentenceTransformer."""
+    text_length = getattr(encoder, "_text_length", None)
+    order = (np.argsort([-text_length(text) for text in texts]) if text_length is not None
+             else np.arange(len(texts)))
+    return [order[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+
+
+def encode_reference(encoder, texts: list, batch_size: int) -> np.ndarray:
+    """Référence : un seul appel à encode() sur toute la liste, comme l'ancien code."""
+    return np.asarray(encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                                     show_progress_bar=False), dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="encode() d'origine vs lots triés par longueur")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default=None, help="torch, onnx ou onnx-int8")
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=32, help="batch_size de l'appel encode() de référence")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[4096, 8192, 16384])
+    args = parser.parse_args()
+
+    encoder = load_encoder(args.model, args.backend, device="cpu")
+    texts = sample_texts(args.size)
+    lengths = token_lengths(encoder, texts)
+    print(f"{len(texts)} textes, tokens: p50={np.percentile(lengths, 50):.0f} "
+          f"p90={np.percentile(lengths, 90):.0f} p99={np.percentile(lengths, 99):.0f} max={lengths.max()}\n")
+
+    encode_reference(encoder, texts[:256], args.batch_size)  # préchauffage
+    start = time.perf_counter()
+    reference = encode_reference(encoder, texts, args.batch_size)
+    baseline = time.perf_counter() - start
+    batches = reference_batches(encoder, texts, args.batch_size)
+    ratio = padding_ratio(lengths, batches)
+
+    print(f"{'mode':<22} {'lots':>6} {'padding':>8} {'durée (s)':>10} {'textes/s':>9} {'accélération':>13} {'écart max':>10}")
+    print(f"{f'encode() ({args.batch_size})':<22} {len(batches):>6} {ratio:>8.1%} "
+          f"{baseline:>10.2f} {len(texts) / baseline:>9.0f} {'1.00x':>13} {'-':>10}")
+
+    for budget in args.budgets:
+        batches = plan_batches(lengths, token_budget=budget)
+        start = time.perf_counter()
+        embeddings = encode_bucketed(encoder, texts, token_budget=budget)
+        duration = time.perf_counter() - start
+        diff = np.abs(embeddings - reference).max()
+        print(f"{f'budget {budget} tokens':<22} {len(batches):>6} {padding_ratio(lengths, batches):>8.1%} "
+              f"{duration:>10.2f} {len(texts) / duration:>9.0f} {baseline / duration:>12.2f}x {diff:>10.1e}")
+
+
+if __name__ == "__main__":
+    main()
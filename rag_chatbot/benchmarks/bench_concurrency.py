@@ -0,0 +1,90 @@
+"""
+BENCHMARK : latence de queue avec plusieurs sessions simultanées
+
+Chaque utilisateur simulé pose ses questions l'une après l'autre avec
+SemanticSearcher.asearch ; 1, 4 puis 16 utilisateurs tournent en même temps sur
+la boucle d'événements. Par niveau : latence p50 / p99 par question et débit.
+
+Avec le budget de threads (défaut), au plus --workers recherches tournent en
+parallèle avec cœurs / workers threads chacune. --no-budget laisse torch / FAISS
+/ BLAS prendre tous les cœurs et autant de recherches que d'utilisateurs :
+comparer les deux p99 à 16 utilisateurs.
+
+Usage:
+    python benchmarks/bench_concurrency.py --workers 4
+    python benchmarks/bench_concurrency.py --no-budget --users 1 4 16
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from bench_hybrid import LABELS, load_labels  # noqa: E402
+from retriever import SemanticSearcher  # noqa: E402
+from thread_budget import apply_thread_budget, available_cores  # noqa: E402
+
+
+async def run_users(searcher: SemanticSearcher, queries: list, users: int, per_user: int, k: int) -> dict:
+    latencies = []
+
+    async def user(offset: int):
+        for i in range(per_user):
+            query = queries[(offset * per_user + i) % len(queries)]
+            start = time.perf_counter()
+            await searcher.asearch(query, k=k)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(users)))
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return {
+        "p50": float(np.percentile(latencies, 50)),
+        "p99": float(np.percentile(latencies, 99)),
+        "qps": len(latencies) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latence p50 / p99 selon le nombre de sessions simultanées")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default=None, help="torch, onnx ou onnx-int8")
+    parser.add_argument("--snapshot-dir", default="db/index")
+    parser.add_argument("--labels", type=Path, default=LABELS)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--per-user", type=int, default=20, help="Questions posées par utilisateur")
+    parser.add_argument("--workers", type=int, default=4, help="Recherches simultanées du budget")
+    parser.add_argument("--no-budget", action="store_true", help="Threads par défaut des bibliothèques")
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    # Budget appliqué avant le chargement du modèle, comme dans le chatbot et le service
+    if args.no_budget:
+        workers, threads = max(args.users), None
+    else:
+        budget = apply_thread_budget(args.workers)
+        workers, threads = budget.workers, budget.threads_per_worker
+
+    # Sans cache de requêtes : chaque question paie l'encodage, comme une question nouvelle
+    searcher = SemanticSearcher(args.model, "db/faiss_index.index", "db/metadata.pkl",
+                                snapshot_dir=args.snapshot_dir, embedding_backend=args.backend,
+                                query_cache_size=0, search_workers=workers, encoder_threads=threads)
+    queries = [label["query"] for label in load_labels(args.labels)]
+    searcher.search_batch(queries[:8], k=args.k)  # préchauffage
+
+    mode = "sans budget" if args.no_budget else f"budget {workers} x {threads} threads"
+    print(f"{available_cores()} cœurs, {mode}, {args.per_user} questions par utilisateur, k={args.k}\n")
+    print(f"{'utilisateurs':>12} {'p50 (ms)':>9} {'p99 (ms)':>9} {'questions/s':>12}")
+    for users in args.users:
+        result = asyncio.run(run_users(searcher, queries, users, args.per_user, args.k))
+        print(f"{users:>12} {result['p50']:>9.1f} {result['p99']:>9.1f} {result['qps']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
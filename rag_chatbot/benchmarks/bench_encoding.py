@@ -0,0 +1,90 @@
+"""
+BENCHMARK : encodage mono-processus vs pool multi-processus (CPU)
+
+Les textes sont tirés des problèmes de qa_pairs (répétés/variés pour atteindre
+la taille voulue), ou générés si la base est vide.
+
+Usage:
+    python benchmarks/bench_encoding.py --sizes 10000 100000 --processes 2 4 8
+    python benchmarks/bench_encoding.py --sizes 1000000 --processes 8 --skip-single
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from encoding_pool import EncodingPool  # noqa: E402
+from storage import get_storage  # noqa: E402
+
+
+def sample_texts(size: int, seed: int = 0) -> list:
+    """Corpus de `size` textes à la distribution de longueurs de la base réelle."""
+    rng = random.Random(seed)
+    try:
+        base = [p.probleme for p in get_storage().iter_qa_pairs() if p.probleme]
+    except Exception:
+        base = []
+    if not base:
+        words = "impossible de générer le rapport facture client erreur connexion base paramètre export".split()
+        base = [" ".join(rng.choices(words, k=rng.randint(5, 60))) for _ in range(1000)]
+    # Suffixe numérique : textes distincts, longueurs quasi identiques à l'original
+    return [f"{rng.choice(base)} #{i}" for i in range(size)]
+
+
+def bench_single(model_name: str, texts: list, threads: int) -> tuple:
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device="cpu")
+    start = time.perf_counter()
+    embeddings = model.encode(texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False)
+    return time.perf_counter() - start, embeddings.astype(np.float32)
+
+
+def bench_pool(model_name: str, texts: list, processes: int, threads_per_process: int) -> tuple:
+    with EncodingPool(model_name, processes=processes, threads_per_process=threads_per_process) as pool:
+        pool.encode(texts[:processes * 64])  # chargement des modèles hors chronométrage
+        start = time.perf_counter()
+        embeddings = pool.encode(texts)
+        return time.perf_counter() - start, embeddings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encodage mono vs multi-processus")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--processes", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1])
+    parser.add_argument("--threads-per-process", type=int, default=1)
+    parser.add_argument("--skip-single", action="store_true", help="ne pas mesurer le chemin mono-processus")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    print(f"CPU: {cores} cœurs, modèle: {args.model}\n")
+    print(f"{'textes':>9} {'mode':<16} {'durée (s)':>10} {'textes/s':>10} {'accélération':>13} {'écart max':>10}")
+
+    for size in args.sizes:
+        texts = sample_texts(size)
+        reference = None
+        baseline = None
+        if not args.skip_single:
+            baseline, reference = bench_single(args.model, texts, threads=cores)
+            print(f"{size:>9} {f'1 proc x {cores} thr':<16} {baseline:>10.2f} {size / baseline:>10.0f} {'1.00x':>13} {'-':>10}")
+
+        for processes in sorted(set(args.processes)):
+            duration, embeddings = bench_pool(args.model, texts, processes, args.threads_per_process)
+            speedup = f"{baseline / duration:.2f}x" if baseline else "-"
+            diff = f"{np.abs(embeddings - reference).max():.1e}" if reference is not None else "-"
+            label = f"{processes} proc x {args.threads_per_process} thr"
+            print(f"{size:>9} {label:<16} {duration:>10.2f} {size / duration:>10.0f} {speedup:>13} {diff:>10}")
+
+
+if __name__ == "__main__":
+    main()
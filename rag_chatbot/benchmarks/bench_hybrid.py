@@ -0,0 +1,104 @@
+"""
+BENCHMARK : recherche vectorielle vs BM25 vs hybride (fusion RRF)
+
+Questions annotées (benchmarks/labeled_queries.jsonl : question -> texte du
+problème attendu) cherchées dans l'instantané courant, une par une. Pour chaque
+mode : rappel@1, rappel@k, MRR@k et latence p50 / p99 par question.
+
+Usage:
+    python benchmarks/bench_hybrid.py --k 3
+    python benchmarks/bench_hybrid.py --labels mes_questions.jsonl --repeat 5
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from retriever import SemanticSearcher  # noqa: E402
+
+LABELS = Path(__file__).resolve().parent / "labeled_queries.jsonl"
+
+
+def load_labels(path: Path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def bm25_search(searcher: SemanticSearcher, query: str, k: int) -> list:
+    """Classement BM25 seul (tombstones écartées par le bitmap des entrées vivantes), en textes de problèmes."""
+    ids = searcher.lexical.search(query, k, searcher.filter_bitmaps.live())[0]
+    ids = ids[~searcher.tombstones.contains(ids)][:k].tolist()
+    records = searcher.metadata.get_many(ids)
+    return [records[i]["probleme"] for i in ids if i in records]
+
+
+def evaluate(search, labels: list, k: int, repeat: int) -> dict:
+    ranks, latencies = [], []
+    for label in labels:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            found = search(label["query"])
+            latencies.append(time.perf_counter() - start)
+        ranks.append(found.index(label["probleme"]) + 1 if label["probleme"] in found[:k] else None)
+    latencies = np.array(latencies) * 1000
+    return {
+        "recall@1": sum(r == 1 for r in ranks) / len(ranks),
+        f"recall@{k}": sum(r is not None for r in ranks) / len(ranks),
+        "mrr": sum(1 / r for r in ranks if r) / len(ranks),
+        "p50": float(np.percentile(latencies, 50)),
+        "p99": float(np.percentile(latencies, 99)),
+        "misses": [label["query"] for label, r in zip(labels, ranks) if r is None],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rappel et latence : vecteurs, BM25, hybride")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default=None, help="torch, onnx ou onnx-int8")
+    parser.add_argument("--snapshot-dir", default="db/index")
+    parser.add_argument("--labels", type=Path, default=LABELS)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3, help="Recherches par question (latence)")
+    parser.add_argument("--verbose", action="store_true", help="Affiche les questions manquées")
+    args = parser.parse_args()
+
+    # Sans cache de requêtes : chaque mode paie l'encodage, comme une question nouvelle
+    searcher = SemanticSearcher(args.model, "db/faiss_index.index", "db/metadata.pkl",
+                                snapshot_dir=args.snapshot_dir, embedding_backend=args.backend,
+                                query_cache_size=0, hybrid=True)
+    if searcher.lexical is None:
+        sys.exit("L'instantané courant n'a pas d'index BM25 : reconstruire l'index (LEXICAL_INDEX=1)")
+    labels = load_labels(args.labels)
+    searcher.search_batch([label["query"] for label in labels[:8]], k=args.k)  # préchauffage
+
+    def semantic(hybrid: bool):
+        def search(query):
+            searcher.hybrid = hybrid
+            return [r.probleme for r in searcher.search(query, k=args.k)]
+        return search
+
+    modes = {
+        "vecteurs": semantic(False),
+        "bm25": lambda query: bm25_search(searcher, query, args.k),
+        "hybride (rrf)": semantic(True),
+    }
+    print(f"{len(labels)} questions annotées, k={args.k}, index: {searcher.index.ntotal} vecteurs, "
+          f"{len(searcher.lexical)} documents BM25\n")
+    print(f"{'mode':<14} {'rappel@1':>9} {f'rappel@{args.k}':>9} {'MRR':>6} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for name, search in modes.items():
+        result = evaluate(search, labels, args.k, args.repeat)
+        print(f"{name:<14} {result['recall@1']:>9.2f} {result[f'recall@{args.k}']:>9.2f} {result['mrr']:>6.2f} "
+              f"{result['p50']:>9.1f} {result['p99']:>9.1f}")
+        if args.verbose:
+            for query in result["misses"]:
+                print(f"    manquée: {query}")
+
+
+if __name__ == "__main__":
+    main()
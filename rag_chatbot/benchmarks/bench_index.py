@@ -0,0 +1,98 @@
+"""
+BENCHMARK : types d'index FAISS (flat / hnsw / ivf_flat / ivf_pq)
+
+Vecteurs synthétiques regroupés en clusters (proches de la structure d'embeddings
+de phrases). Pour chaque taille et chaque type : temps de construction, mémoire,
+recall@k par rapport à la recherche exacte et latence par requête (p50/p99).
+
+Usage:
+    python benchmarks/bench_index.py --sizes 10000 100000 1000000 --k 3
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from index_factory import INDEX_TYPES, build_index, choose_index_spec, needs_training, training_size  # noqa: E402
+
+
+def synthetic_vectors(n: int, dimension: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(16, n // 200), dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def index_size_mb(index: faiss.Index) -> float:
+    with tempfile.NamedTemporaryFile(suffix=".faiss", delete=False) as f:
+        path = f.name
+    try:
+        faiss.write_index(index, path)
+        return os.path.getsize(path) / 1e6
+    finally:
+        os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall et latence des types d'index")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--target", default=None, help="balanced, recall, latency ou memory")
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES))
+    parser.add_argument("--threads", type=int, default=1, help="threads FAISS (1 = latence d'une requête isolée)")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    print(f"{'n':>9} {'type':<9} {'auto':>4} {'build (s)':>10} {'Mo':>8} {f'recall@{args.k}':>9} "
+          f"{'p50 (ms)':>9} {'p99 (ms)':>9}")
+
+    for n in args.sizes:
+        vectors = synthetic_vectors(n, args.dimension)
+        ids = np.arange(1, n + 1, dtype=np.int64)
+        queries = synthetic_vectors(args.queries, args.dimension, seed=1)
+        auto_type = choose_index_spec(n, args.dimension, target=args.target)["type"]
+
+        exact = faiss.IndexFlatL2(args.dimension)
+        exact.add(vectors)
+        _, truth = exact.search(queries, args.k)
+        truth += 1  # positions -> ids
+
+        for index_type in args.types:
+            spec = choose_index_spec(n, args.dimension, target=args.target, index_type=index_type)
+            if spec["type"] != index_type:
+                continue  # corpus trop petit pour ce type
+            start = time.perf_counter()
+            training = None
+            if needs_training(spec):
+                sample = np.random.default_rng(2).choice(n, min(n, training_size(spec)), replace=False)
+                training = vectors[sample]
+            index = build_index(spec, args.dimension, training)
+            index.add_with_ids(vectors, ids)
+            build = time.perf_counter() - start
+
+            latencies = []
+            found = np.empty_like(truth)
+            for i, query in enumerate(queries):
+                start = time.perf_counter()
+                _, result = index.search(query[None, :], args.k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found[i] = result[0]
+            recall = np.mean([len(set(t) & set(f)) / args.k for t, f in zip(truth, found)])
+
+            print(f"{n:>9} {index_type:<9} {'*' if index_type == auto_type else '':>4} {build:>10.2f} "
+                  f"{index_size_mb(index):>8.1f} {recall:>9.3f} {np.percentile(latencies, 50):>9.3f} "
+                  f"{np.percentile(latencies, 99):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
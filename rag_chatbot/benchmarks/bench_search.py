@@ -0,0 +1,59 @@
+"""
+BENCHMARK : recherche requête par requête (search) vs par lots (search_batch)
+
+Les questions sont tirées des problèmes de qa_pairs (voir bench_encoding.sample_texts)
+et cherchées dans l'instantané courant. Pour chaque taille de lot : débit, et
+nombre de questions dont les résultats diffèrent de la boucle sur search().
+
+Usage:
+    python benchmarks/bench_search.py --queries 2000 --batch-sizes 16 64 256
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from bench_encoding import sample_texts  # noqa: E402
+from retriever import SemanticSearcher  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="search() en boucle vs search_batch()")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default=None, help="torch, onnx ou onnx-int8")
+    parser.add_argument("--snapshot-dir", default="db/index")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 64, 256])
+    args = parser.parse_args()
+
+    searcher = SemanticSearcher(args.model, "db/faiss_index.index", "db/metadata.pkl",
+                                snapshot_dir=args.snapshot_dir, embedding_backend=args.backend)
+    queries = sample_texts(args.queries)
+    searcher.search_batch(queries[:64], k=args.k)  # préchauffage
+
+    start = time.perf_counter()
+    reference = [searcher.search(query, k=args.k) for query in queries]
+    baseline = time.perf_counter() - start
+
+    print(f"{len(queries)} questions, k={args.k}, index: {searcher.index.ntotal} vecteurs, "
+          f"{len(searcher.shards)} shards\n")
+    print(f"{'mode':<14} {'durée (s)':>10} {'requêtes/s':>11} {'accélération':>13} {'différences':>12}")
+    print(f"{'boucle':<14} {baseline:>10.2f} {len(queries) / baseline:>11.0f} {'1.00x':>13} {'-':>12}")
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        results = []
+        for i in range(0, len(queries), batch_size):
+            results.extend(searcher.search_batch(queries[i:i + batch_size], k=args.k))
+        duration = time.perf_counter() - start
+        differences = sum([r.uid for r in a] != [r.uid for r in b] for a, b in zip(results, reference))
+        print(f"{f'lots de {batch_size}':<14} {duration:>10.2f} {len(queries) / duration:>11.0f} "
+              f"{baseline / duration:>12.2f}x {differences:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+CALIBRATION DES SEUILS DE CONFIANCE (confidence_low / confidence_high)
+
+Questions annotées (benchmarks/labeled_queries.jsonl) cherchées dans
+l'instantané courant : pour chacune, similarité du meilleur résultat (celle
+qu'utilise ChatbotRAG._gate) et justesse de ce résultat.
+
+- confidence_high : plus petit seuil au-dessus duquel le meilleur résultat est
+  le bon dans au moins --precision des cas (réponse directe sans LLM).
+- confidence_low : seuil sous lequel au plus --max-refused des questions qui
+  ont une réponse en base seraient renvoyées au support.
+
+--off-topic (une question par ligne, sans réponse en base) affiche en plus la
+part de questions hors sujet effectivement renvoyées au support. --save
+enregistre les seuils dans db/chatbot_settings.json (comme l'administration).
+
+Usage:
+    python benchmarks/calibrate_confidence.py
+    python benchmarks/calibrate_confidence.py --precision 0.98 --off-topic hors_sujet.txt --save
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from bench_hybrid import LABELS, load_labels  # noqa: E402
+from chatbot import similarity  # noqa: E402
+from retriever import SemanticSearcher  # noqa: E402
+from settings_store import DEFAULT_SETTINGS, DEFAULT_SETTINGS_PATH, SettingsStore  # noqa: E402
+
+
+def best_hits(searcher: SemanticSearcher, queries: list, k: int) -> list:
+    """(similarité, problème) du meilleur résultat de chaque question ((0.0, None) sans résultat)."""
+    hits = []
+    for results in searcher.search_batch(queries, k=k):
+        best = max(results, key=lambda res: similarity(res.distance), default=None)
+        hits.append((0.0, None) if best is None else (similarity(best.distance), best.probleme))
+    return hits
+
+
+def high_threshold(scores: np.ndarray, correct: np.ndarray, precision: float, min_support: int) -> float:
+    """Plus petit seuil dont les questions au-dessus ont une précision top-1 >= precision (1.0 sinon)."""
+    for threshold in np.unique(scores):
+        above = scores >= threshold
+        if above.sum() >= min_support and correct[above].mean() >= precision:
+            return float(threshold)
+    return 1.0
+
+
+def low_threshold(scores: np.ndarray, max_refused: float) -> float:
+    """Seuil sous lequel au plus max_refused des questions ayant une réponse tombent."""
+    return float(np.quantile(scores, max_refused, method="lower"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seuils de confiance calibrés sur les questions annotées")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default=None, help="torch, onnx ou onnx-int8")
+    parser.add_argument("--snapshot-dir", default="db/index")
+    parser.add_argument("--labels", type=Path, default=LABELS)
+    parser.add_argument("--off-topic", type=Path, default=None, help="Questions sans réponse en base")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--precision", type=float, default=0.95, help="Précision visée des réponses directes")
+    parser.add_argument("--min-support", type=int, default=5, help="Questions minimales au-dessus du seuil haut")
+    parser.add_argument("--max-refused", type=float, default=0.02,
+                        help="Part maximale de questions avec réponse renvoyées au support")
+    parser.add_argument("--save", action="store_true", help="Enregistre les seuils calibrés")
+    parser.add_argument("--settings", default=DEFAULT_SETTINGS_PATH)
+    args = parser.parse_args()
+
+    searcher = SemanticSearcher(args.model, "db/faiss_index.index", "db/metadata.pkl",
+                                snapshot_dir=args.snapshot_dir, embedding_backend=args.backend,
+                                query_cache_size=0)
+    labels = load_labels(args.labels)
+    hits = best_hits(searcher, [label["query"] for label in labels], args.k)
+    scores = np.array([score for score, _ in hits])
+    correct = np.array([probleme == label["probleme"] for (_, probleme), label in zip(hits, labels)])
+
+    high = high_threshold(scores, correct, args.precision, args.min_support)
+    low = min(low_threshold(scores, args.max_refused), high)
+
+    print(f"{len(labels)} questions annotées, top-1 correct: {correct.mean():.0%}, k={args.k}")
+    print(f"similarité top-1 correcte   : médiane {np.median(scores[correct]) if correct.any() else 0:.3f}")
+    print(f"similarité top-1 incorrecte : médiane {np.median(scores[~correct]) if (~correct).any() else 0:.3f}\n")
+    print(f"{'':<16} {'actuel':>8} {'calibré':>8}")
+    for name, value in (("confidence_low", low), ("confidence_high", high)):
+        print(f"{name:<16} {DEFAULT_SETTINGS[name]:>8.2f} {value:>8.3f}")
+
+    direct = scores >= high
+    print(f"\nréponses directes : {direct.mean():.0%} des questions, "
+          f"{correct[direct].mean() if direct.any() else 0:.0%} correctes")
+    print(f"renvoyées au support à tort : {(scores < low).mean():.0%}")
+    if args.off_topic:
+        queries = [line.strip() for line in args.off_topic.read_text(encoding="utf-8").splitlines() if line.strip()]
+        off_scores = np.array([score for score, _ in best_hits(searcher, queries, args.k)])
+        print(f"hors sujet renvoyées au support : {(off_scores < low).mean():.0%} ({len(queries)} questions)")
+
+    if args.save:
+        SettingsStore(args.settings).update(confidence_low=round(low, 3), confidence_high=round(high, 3))
+        print(f"\nSeuils enregistrés dans {args.settings}")
+
+
+if __name__ == "__main__":
+    main()
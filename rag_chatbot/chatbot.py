@@ -1,8 +1,16 @@
 from retriever import SemanticSearcher #add rag_chatbot.retriever when use app if not no need to
 from generator import ResponseGenerator #add rag_chatbot.generator when use app
+from reranker import DEFAULT_RERANKER, CrossEncoderReranker
+from retrieval_server import RemoteSearcher
+from settings_store import DEFAULT_SETTINGS_PATH, SettingsStore
+from thread_budget import apply_thread_budget, limit_current_thread
+import asyncio
 import logging
+import os
+import threading
 import time
-from typing import Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
 import json
 import hashlib
 from pathlib import Path
@@ -10,6 +18,15 @@ from pathlib import Path
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SUPPORT_RESPONSE = ("Je n'ai pas trouvé d'informations pertinentes dans ma base de connaissances. "
+                    "Veuillez contacter le support technique.")
+DIRECT_RESPONSE_TEMPLATE = "**{logiciel}** — solution connue pour « {probleme} » :\n\n{solution}"
+
+
+def similarity(distance: float) -> float:
+    """Similarité cosinus d'un résultat : vecteurs normalisés, donc distance L2² = 2 - 2·cos."""
+    return max(0.0, min(1.0, 1 - distance / 2))
+
 class CacheManager:
     """Gestionnaire de cache simple avec fichiers JSON"""
     def __init__(self, cache_dir: str = "cache"):
@@ -44,8 +61,11 @@ class CacheManager:
         """Stocke une réponse dans le cache"""
         try:
             cache_file = self._get_cache_path(question)
-            with open(cache_file, 'w', encoding='utf-8') as f:
+            # Écriture atomique : deux sessions peuvent stocker la même question en même temps
+            tmp_file = cache_file.with_suffix(f".{threading.get_ident()}.tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, cache_file)
             logger.info(f"- Cache stored pour: {question[:50]}...")
         except Exception as e:
             logger.error(f"- Erreur écriture cache: {e}")
@@ -69,6 +89,10 @@ class RAGChatbot:
         """
         self.config = config or self._default_config()
         self.cache = CacheManager()
+        # Seuils de confiance réglés depuis l'administration (relus à chaque question)
+        self.settings = SettingsStore(self.config.get("settings_path", DEFAULT_SETTINGS_PATH))
+        self._stats_lock = threading.Lock()
+        self.answer_stats = {"llm": 0, "direct": 0, "support": 0}
         self._initialize_components()
         logger.info("🤖 Chatbot RAG initialisé (mode CLI)")
 
@@ -78,31 +102,103 @@ class RAGChatbot:
             "retriever": {
                 "model_name": "all-MiniLM-L6-v2",
                 "index_path": "db/faiss_index.index",
-                "metadata_path": "db/metadata.pkl"
+                "metadata_path": "db/metadata.pkl",
+                "snapshot_dir": "db/index",  # instantanés versionnés, rechargés à chaud
+                "embedding_cache_dir": "db/embedding_cache",
+                "embedding_backend": None,  # torch, onnx ou onnx-int8 (défaut: EMBEDDING_BACKEND)
+                "mmap_index": True,  # client et admin partagent les pages de l'index via le cache de l'OS
+                "route_by_logiciel": True,  # recherche limitée au logiciel cité dans la question
+                "fallback_distance": 1.0,  # au-delà, repli sur l'index global
+                "query_cache_size": 10000,  # embeddings des questions récentes (LRU)
+                "query_cache_path": "db/query_cache.npz",
+                "hybrid": True,  # BM25 + vecteurs fusionnés (codes transaction, messages d'erreur exacts)
+                "background_load": True,  # modèle et index chargés pendant l'affichage de l'interface
+                "warmup_queries": 8,  # questions de la base encodées et cherchées avant d'être prêt
+                "server_url": None,  # service partagé (retrieval_server.py), défaut: RETRIEVAL_SERVER_URL
+                "server_timeout": 30.0
+            },
+            "reranker": {
+                "enabled": False,  # cross-encoder CPU sur les candidats de la recherche
+                "model_name": DEFAULT_RERANKER,
+                "candidates": 20,  # résultats récupérés avant re-classement
+                "budget_ms": 150,  # au-delà, ordre de la recherche conservé
+                "cache_size": 50000  # scores (question, uid) en cache
             },
             "generator": {
                 "model_name": "meta-llama/llama-3.3-70b-instruct:free",
-                "device": None
+                "device": None,
+                "max_concurrent": 16  # appels API simultanés de aask (attente réseau)
             },
-            "cache_enabled": True
+            "cache_enabled": True,
+            "settings_path": "db/chatbot_settings.json",  # seuils de confiance (admin)
+            "direct_answer_template": True,  # met en forme la solution renvoyée sans LLM
+            "max_concurrent_queries": 4,  # aask: questions traitées en parallèle, cœurs répartis entre elles
+            "thread_budget": True  # limite les threads torch / FAISS / BLAS (voir thread_budget.py)
         }
 
+    def _remote_searcher(self, retriever_config: Dict[str, Any]):
+        """Client du service de recherche partagé s'il est configuré et joignable, sinon None (recherche locale)."""
+        url = retriever_config.get("server_url") or os.getenv("RETRIEVAL_SERVER_URL")
+        if not url:
+            return None
+        searcher = RemoteSearcher(url, timeout=retriever_config.get("server_timeout", 30.0))
+        try:
+            searcher.health()
+        except OSError as e:
+            logger.warning(f"- Service de recherche {url} injoignable ({e}), chargement local du modèle")
+            return None
+        logger.info(f"- Service de recherche partagé: {url}")
+        return searcher
+
     def _initialize_components(self):
         """Initialise les composants du système RAG"""
         try:
+            # Budget de threads appliqué avant le chargement des modèles (torch lit
+            # OMP_NUM_THREADS à l'import) : les questions simultanées ne se disputent pas les cœurs
+            workers = self.config.get("max_concurrent_queries", 4)
+            self.thread_budget = apply_thread_budget(workers) if self.config.get("thread_budget", True) else None
+            encoder_threads = self.thread_budget.threads_per_worker if self.thread_budget else None
+            # Recherche, gating et re-classement de aask (CPU), bornés à `workers` questions à la fois
+            self._query_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ask",
+                                                      initializer=limit_current_thread)
+
             # Initialisation du retriever
             retriever_config = self.config["retriever"]
-            self.searcher = SemanticSearcher(
+            self.searcher = self._remote_searcher(retriever_config) or SemanticSearcher(
                 model_name=retriever_config["model_name"],
                 index_path=retriever_config["index_path"],
-                metadata_path=retriever_config["metadata_path"]
+                metadata_path=retriever_config["metadata_path"],
+                snapshot_dir=retriever_config.get("snapshot_dir"),
+                embedding_cache_dir=retriever_config.get("embedding_cache_dir"),
+                embedding_backend=retriever_config.get("embedding_backend"),
+                mmap_index=retriever_config.get("mmap_index", False),
+                route_by_logiciel=retriever_config.get("route_by_logiciel", True),
+                fallback_distance=retriever_config.get("fallback_distance", 1.0),
+                query_cache_size=retriever_config.get("query_cache_size", 10000),
+                query_cache_path=retriever_config.get("query_cache_path"),
+                hybrid=retriever_config.get("hybrid", True),
+                background_load=retriever_config.get("background_load", False),
+                warmup_queries=retriever_config.get("warmup_queries", 8),
+                search_workers=workers,
+                encoder_threads=encoder_threads
             )
             
+            # Re-classement optionnel (absent des anciennes configurations)
+            reranker_config = self.config.get("reranker", {})
+            self.reranker = None
+            if reranker_config.get("enabled", False):
+                self.reranker = CrossEncoderReranker(
+                    model_name=reranker_config.get("model_name", DEFAULT_RERANKER),
+                    budget_ms=reranker_config.get("budget_ms", 150),
+                    cache_size=reranker_config.get("cache_size", 50000)
+                )
+
             # Initialisation du generator
             generator_config = self.config["generator"]
             self.generator = ResponseGenerator(
                 model_name=generator_config["model_name"],
-                device=generator_config["device"]
+                device=generator_config["device"],
+                max_concurrent=generator_config.get("max_concurrent", 16)
             )
             
             logger.info(" Composants RAG initialisés")
@@ -123,66 +219,161 @@ class RAGChatbot:
             Dictionnaire avec réponse, métriques et sources
         """
         # Vérifier le cache d'abord
-        if self.config["cache_enabled"]:
-            cached_response = self.cache.get(question)
-            if cached_response:
-                return {**cached_response, "cached": True}
+        cached_response = self._cached(question)
+        if cached_response:
+            return cached_response
         
         try:
             start_time = time.time()
-            
-            # Étape 1: Recherche sémantique
-            retrieval_start = time.time()
-            results = self.searcher.search(question, k=k)
-            retrieval_time = time.time() - retrieval_start
-            
+            results, answer_source, response, metrics = self._retrieve(question, k)
+
             # Étape 2: Génération de réponse
             generation_start = time.time()
-            response = self.generator.generate_response(question, results)
-            generation_time = time.time() - generation_start
-            
-            total_time = time.time() - start_time
-            
-            # Formatage de la réponse
-            result = {
-                "question": question,
-                "response": response,
-                "sources": [
-                    {
-                        "uid": res.uid,
-                        "logiciel": res.logiciel,
-                        "probleme": res.probleme,
-                        "solution": res.solution,
-                        "distance": res.distance,
-                        "confidence": (1 - res.distance) * 100
-                    } for res in results
-                ],
-                "metrics": {
-                    "total_time": round(total_time, 2),
-                    "retrieval_time": round(retrieval_time, 2),
-                    "generation_time": round(generation_time, 2),
-                    "results_count": len(results)
-                },
-                "success": True,
-                "cached": False
-            }
-            
-            # Stocker dans le cache
-            if self.config["cache_enabled"]:
-                self.cache.set(question, result)
-            
-            return result
+            if answer_source == "llm":
+                response = self.generator.generate_response(question, results)
+            metrics["generation_time"] = round(time.time() - generation_start, 2)
+            return self._finish(question, response, results, answer_source, metrics, start_time)
             
         except Exception as e:
-            logger.error(f"- Erreur lors de la génération: {e}")
-            return {
-                "question": question,
-                "response": f"Erreur: {str(e)}",
-                "sources": [],
-                "metrics": {},
-                "success": False,
-                "cached": False
-            }
+            return self._error_result(question, e)
+
+    async def aask(self, question: str, k: int = 3) -> Dict[str, Any]:
+        """
+        Version asynchrone de ask() pour servir plusieurs sessions depuis une boucle
+        d'événements : la recherche (CPU) passe par l'exécuteur borné à
+        max_concurrent_queries, l'appel au LLM (réseau) par celui du générateur.
+        """
+        cached_response = self._cached(question)
+        if cached_response:
+            return cached_response
+
+        try:
+            start_time = time.time()
+            loop = asyncio.get_running_loop()
+            results, answer_source, response, metrics = await loop.run_in_executor(
+                self._query_executor, self._retrieve, question, k)
+
+            generation_start = time.time()
+            if answer_source == "llm":
+                response = await self.generator.agenerate(question, results)
+            metrics["generation_time"] = round(time.time() - generation_start, 2)
+            return self._finish(question, response, results, answer_source, metrics, start_time)
+
+        except Exception as e:
+            return self._error_result(question, e)
+
+    def _cached(self, question: str) -> Optional[Dict[str, Any]]:
+        if self.config["cache_enabled"]:
+            cached_response = self.cache.get(question)
+            if cached_response:
+                return {**cached_response, "cached": True}
+        return None
+
+    def _retrieve(self, question: str, k: int) -> Tuple[List, str, Optional[str], Dict[str, Any]]:
+        """
+        Recherche, décision de passer ou non par le LLM, puis re-classement.
+
+        Returns:
+            (résultats, source de la réponse, réponse si sans LLM, métriques)
+        """
+        # Étape 1: Recherche sémantique (plus de candidats si re-classement)
+        retrieval_start = time.time()
+        candidates = max(k, self.config.get("reranker", {}).get("candidates", 20)) if self.reranker else k
+        results = self.searcher.search(question, k=candidates)
+        retrieval_time = time.time() - retrieval_start
+
+        # Étape 1 bis: Résultat décisif ou hors sujet, réponse sans LLM
+        answer_source, response = self._gate(results)
+        if answer_source == "direct":
+            results = [max(results, key=lambda res: similarity(res.distance))]
+        elif answer_source == "support":
+            results = []
+
+        # Étape 1 ter: Re-classement, seuls les k meilleurs vont au générateur
+        rerank_time, reranked = 0.0, False
+        if self.reranker and answer_source == "llm":
+            rerank_start = time.time()
+            results, reranked = self.reranker.rerank(question, results, k)
+            rerank_time = time.time() - rerank_start
+        metrics = {"retrieval_time": round(retrieval_time, 2), "rerank_time": round(rerank_time, 3),
+                   "reranked": reranked}
+        return results[:k], answer_source, response, metrics
+
+    def _finish(self, question: str, response: str, results: List, answer_source: str,
+                metrics: Dict[str, Any], start_time: float) -> Dict[str, Any]:
+        """Formate la réponse, met à jour les statistiques et le cache."""
+        with self._stats_lock:
+            self.answer_stats[answer_source] += 1
+
+        result = {
+            "question": question,
+            "response": response,
+            "sources": [
+                {
+                    "uid": res.uid,
+                    "logiciel": res.logiciel,
+                    "probleme": res.probleme,
+                    "solution": res.solution,
+                    "distance": res.distance,
+                    "confidence": similarity(res.distance) * 100
+                } for res in results
+            ],
+            "metrics": {
+                "total_time": round(time.time() - start_time, 2),
+                **metrics,
+                "results_count": len(results),
+                "answer_source": answer_source,
+                "llm_skipped": answer_source != "llm"
+            },
+            "success": True,
+            "cached": False
+        }
+        
+        # Stocker dans le cache (pas les renvois au support : la base peut s'enrichir)
+        if self.config["cache_enabled"] and answer_source != "support":
+            self.cache.set(question, result)
+        
+        return result
+
+    def _error_result(self, question: str, error: Exception) -> Dict[str, Any]:
+        logger.error(f"- Erreur lors de la génération: {error}")
+        return {
+            "question": question,
+            "response": f"Erreur: {str(error)}",
+            "sources": [],
+            "metrics": {},
+            "success": False,
+            "cached": False
+        }
+
+    def _gate(self, results: List) -> Tuple[str, Optional[str]]:
+        """
+        Décide si la question doit passer par le LLM, selon la similarité des résultats.
+
+        Returns:
+            ("direct", solution enregistrée) au-dessus du seuil haut,
+            ("support", réponse de renvoi) si aucun résultat n'atteint le seuil bas,
+            ("llm", None) sinon
+        """
+        low, high = self.settings.get("confidence_low"), self.settings.get("confidence_high")
+        best = max(results, key=lambda res: similarity(res.distance), default=None)
+        if best is None or similarity(best.distance) < low:
+            return "support", SUPPORT_RESPONSE
+        if similarity(best.distance) >= high:
+            if not self.config.get("direct_answer_template", True):
+                return "direct", best.solution
+            return "direct", DIRECT_RESPONSE_TEMPLATE.format(logiciel=best.logiciel, probleme=best.probleme,
+                                                             solution=best.solution)
+        return "llm", None
+
+    def gating_stats(self) -> Dict[str, Any]:
+        """Répartition des réponses depuis le démarrage et appels LLM évités."""
+        with self._stats_lock:
+            stats = dict(self.answer_stats)
+        total = sum(stats.values())
+        avoided = stats["direct"] + stats["support"]
+        return {**stats, "llm_calls_avoided": avoided,
+                "avoided_rate": avoided / total * 100 if total else 0.0}
 
     def interactive_chat(self):
         """Mode interactif en ligne de commande"""
@@ -273,7 +273,10 @@ def generate_assistant_response(prompt, chatbot, feedback_system):
 def get_chatbot_response(prompt, chatbot):
     """Obtient la réponse du chatbot"""
     if chatbot:
-        return chatbot.ask(prompt, 3)
+        result = chatbot.ask(prompt, 3)
+        # Alimente le tableau de bord Performance de l'admin (metrics_store.jsonl)
+        st.session_state.performance_monitor.add_metrics(result.get("metrics", {}), result.get("cached", False))
+        return result
     else:
         return {
             "response": "Chatbot non configuré",
@@ -1,22 +1,62 @@
-import sqlite3
+import argparse
 import faiss
-import pickle
-from sentence_transformers import SentenceTransformer
 import os
 from dotenv import load_dotenv
 import logging
-from typing import List, Dict, Tuple
+import time
+from typing import List, Dict, Iterator, Tuple, Optional
+from itertools import islice
 from pathlib import Path
 import numpy as np
+from storage import QAPair, get_storage
+from tombstones import TombstoneBitmap
+from index_snapshots import SnapshotStore
+from embedding_cache import EmbeddingCache
+from encoding_pool import EncodingPool
+from embedding_backend import cache_key, get_backend, load_encoder
+from embedding_scheduler import DEFAULT_TOKEN_BUDGET, encode_bucketed
+from index_factory import build_index, choose_index_spec, is_updatable, needs_training, training_size
+from index_shards import Shard, group_by_shard, shard_key, sharding_enabled
 
 class DocumentEmbedder:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        """Initialize the document embedder with environment setup and model loading."""
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", processes: Optional[int] = None,
+                 backend: Optional[str] = None):
+        """
+        Initialize the document embedder with environment setup (the model is loaded on first use).
+
+        Args:
+            processes: Worker processes for large encodings (ENCODE_PROCESSES, 0 or 1 = in-process)
+            backend: "torch", "onnx" or "onnx-int8" (EMBEDDING_BACKEND, torch by default)
+        """
         self._setup_logging()
         self._load_environment()
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        self.backend = get_backend(backend)
+        self._model = None
+        # Seuls les textes absents du cache sont encodés (clé: modèle/backend + texte normalisé)
+        self.embedding_cache = EmbeddingCache(Path(os.getenv("EMBEDDING_CACHE_DIR", "db/embedding_cache")),
+                                              cache_key(model_name, self.backend))
+        self.processes = processes if processes is not None else int(os.getenv("ENCODE_PROCESSES", "0"))
+        self.threads_per_process = int(os.getenv("ENCODE_THREADS_PER_PROCESS", "1"))
+        # En dessous, le démarrage des workers coûte plus qu'il ne rapporte
+        self.min_parallel_texts = int(os.getenv("ENCODE_MIN_PARALLEL_TEXTS", "5000"))
+        # Reconstruction complète par paquets de lignes (mémoire bornée)
+        self.build_chunk_size = int(os.getenv("INDEX_BUILD_CHUNK_SIZE", "10000"))
+        # Type d'index (flat/hnsw/ivf) choisi selon la taille du corpus, voir index_factory
+        self.index_spec: Dict = {"type": "flat"}
+        # Index par logiciel (mêmes ids que l'index global), voir index_shards
+        self.shards: Dict[str, Shard] = {}
+        # Lots triés par longueur, dimensionnés en tokens plutôt qu'en nombre de textes
+        self.token_budget = DEFAULT_TOKEN_BUDGET
         self.logger.info("Document embedder initialized successfully")
 
+    @property
+    def model(self):
+        """Encoder for the configured backend, loaded lazily so no-op incremental runs stay cheap."""
+        if self._model is None:
+            self._model = load_encoder(self.model_name, self.backend)
+        return self._model
+
     def _setup_logging(self) -> None:
         """Configure logging settings."""
         logging.basicConfig(
@@ -28,79 +68,351 @@ class DocumentEmbedder:
     def _load_environment(self) -> None:
         """Load environment variables."""
         load_dotenv()
-        self.db_path = Path(os.getenv("DB_PATH", "database.db"))
-        self.index_path = Path(os.getenv("INDEX_PATH", "faiss.index"))
-        self.metadata_path = Path(os.getenv("METADATA_PATH", "metadata.pkl"))
+        # Même base que celle alimentée par export_to_sqlite et RAGPipelineUpdater
+        self.storage = get_storage()
+        self.db_path = self.storage.db_path
+        # Instantanés versionnés lus par RAGChatbot (retriever.snapshot_dir)
+        self.snapshots = SnapshotStore(Path(os.getenv("INDEX_DIR", "db/index")))
+        self.tombstone_path = self.snapshots.tombstone_path
+        # Compaction dès que cette proportion de l'index est marquée supprimée
+        self.compaction_ratio = float(os.getenv("TOMBSTONE_COMPACTION_RATIO", "0.2"))
 
-    def _fetch_data_from_db(self) -> List[Tuple]:
-        """Fetch QA pairs from SQLite database."""
+    def _fetch_data_from_db(self, since_uid: Optional[int] = None) -> List[QAPair]:
+        """Fetch QA pairs from SQLite database (only uids above since_uid if given)."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT uid, logiciel, probleme, solution FROM qa_pairs")
-                return cursor.fetchall()
-        except sqlite3.Error as e:
+            return self.storage.fetch_qa_pairs(since_uid=since_uid)
+        except Exception as e:
             self.logger.error(f"Database error: {e}")
             raise
 
-    def _prepare_documents(self, rows: List[Tuple]) -> Tuple[List[str], List[Dict]]:
+    def _prepare_documents(self, rows: List[QAPair]) -> Tuple[List[str], List[Dict]]:
         """Prepare documents and metadata from database rows."""
         problems = []   # ← Stocke uniquement les problèmes
         metadata = []
-        
-        for i, (uid, logiciel, probleme, solution) in enumerate(rows):
-            problems.append(probleme)  # ← Embedding du problème seul
+
+        for row in rows:
+            problems.append(row.probleme)  # ← Embedding du problème seul
             metadata.append({
-                "id": i,
-                "uid": uid,
-                "logiciel": logiciel,
-                "probleme": probleme,
-                "solution": solution
+                "id": row.uid,  # ← id FAISS = qa_pairs.uid (index ID-mappé)
+                "uid": row.uid,
+                "logiciel": row.logiciel,
+                "probleme": row.probleme,
+                "solution": row.solution,
+                "type_probleme": row.type_probleme,  # champs de filtrage (SemanticSearcher.search(filters=...))
+                "created_at": row.created_at
             })
         return problems, metadata
 
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        """Run the model on texts missing from the embedding cache (multi-process for large inputs)."""
+        if self.processes > 1 and len(texts) >= self.min_parallel_texts:
+            with EncodingPool(self.model_name, processes=self.processes,
+                              threads_per_process=self.threads_per_process, backend=self.backend,
+                              token_budget=self.token_budget) as pool:
+                return pool.encode(texts)
+        embeddings = encode_bucketed(self.model, texts, token_budget=self.token_budget)
+        return embeddings.astype(np.float32)  # ← Assurance du type float32
+
+    def _encode(self, problems: List[str]) -> np.ndarray:
+        """Encode texts to float32 embeddings (through the embedding cache) and validate the count."""
+        start = time.perf_counter()
+        misses_before = self.embedding_cache.misses
+        embeddings = self.embedding_cache.encode(problems, self._encode_uncached)
+
+        # Validation des embeddings
+        if len(embeddings) != len(problems):
+            raise ValueError(f"Mismatch embeddings/documents: {len(embeddings)} vs {len(problems)}")
+
+        encoded = self.embedding_cache.misses - misses_before
+        self.logger.info(f"{len(problems)} textes en {time.perf_counter() - start:.3f}s "
+                         f"({len(problems) - encoded} depuis le cache, {encoded} encodés)")
+        return embeddings
+
+    def _exact_vector_blocks(self, metadata: List[Dict]) -> Iterator[np.ndarray]:
+        """float32 vectors aligned with metadata, read back from the embedding cache chunk by chunk."""
+        for start in range(0, len(metadata), self.build_chunk_size):
+            yield self._encode([m["probleme"] for m in metadata[start:start + self.build_chunk_size]])
+
+    def _save(self, index: faiss.Index, metadata: List[Dict]) -> str:
+        """Publish index and metadata as a new versioned snapshot (atomic switch of CURRENT)."""
+        vectors = self._exact_vector_blocks(metadata) if self.index_spec.get("exact_rescoring") else None
+        version = self.snapshots.write(index, metadata, model_name=self.model_name,
+                                       extra={"index_spec": self.index_spec}, vectors=vectors, shards=self.shards)
+        self.logger.info(f"Snapshot {version} saved to {self.snapshots.root}")
+        return version
+
+    @staticmethod
+    def _ids(metadata: List[Dict]) -> np.ndarray:
+        return np.array([m["id"] for m in metadata], dtype=np.int64)
+
+    def _iter_chunks(self) -> Iterator[List[QAPair]]:
+        """Live QA pairs streamed from SQLite in chunks of build_chunk_size rows."""
+        rows = self.storage.iter_qa_pairs(chunk_size=self.build_chunk_size)
+        while True:
+            chunk = list(islice(rows, self.build_chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _new_index(self, count: int, dimension: int,
+                   logiciels: Optional[List[str]] = None) -> Tuple[faiss.Index, Dict]:
+        """
+        Empty index sized for `count` vectors, trained on a random sample when the type requires it.
+
+        Args:
+            logiciels: Restrict the training sample to these software values (per-software shard)
+        """
+        spec = choose_index_spec(count, dimension)
+        training_vectors = None
+        if needs_training(spec):
+            sample = self.storage.sample_problems(training_size(spec), logiciels)
+            self.logger.info(f"Entraînement de l'index {spec['type']} sur {len(sample)} vecteurs")
+            training_vectors = self._encode(sample)
+        self.logger.info(f"Index choisi pour {count} vecteurs{f' ({logiciels})' if logiciels else ''}: {spec}")
+        return build_index(spec, dimension, training_vectors), spec
+
+    def _shard_sizes(self) -> Dict[str, Dict[str, int]]:
+        """Shard key -> {software value as stored: live row count}."""
+        sizes: Dict[str, Dict[str, int]] = {}
+        for logiciel, count in self.storage.count_by_logiciel().items():
+            key = shard_key(logiciel)
+            if key is not None:
+                sizes.setdefault(key, {})[logiciel] = count
+        return sizes
+
+    def _add_to_shards(self, embeddings: np.ndarray, metadata: List[Dict],
+                       shard_sizes: Dict[str, Dict[str, int]]) -> None:
+        """Append a chunk to the per-software shards, creating (and training) a shard on first use."""
+        ids = self._ids(metadata)
+        for key, positions in group_by_shard(m["logiciel"] for m in metadata).items():
+            if key not in self.shards:
+                sizes = shard_sizes.get(key) or {metadata[positions[0]]["logiciel"]: len(positions)}
+                index, spec = self._new_index(sum(sizes.values()), embeddings.shape[1], list(sizes))
+                self.shards[key] = Shard(max(sizes, key=sizes.get), index, spec)
+            self.shards[key].index.add_with_ids(embeddings[positions], ids[positions])
+
     def create_and_save_index(self) -> None:
-        """Main process to create and save FAISS index and metadata."""
+        """
+        Main process to create and save FAISS index and metadata (full rebuild).
+        Streamed chunk by chunk: peak memory stays near one chunk plus the index itself.
+        """
         try:
             self.logger.info("Starting document embedding process")
-            
-            # Fetch and prepare data
-            rows = self._fetch_data_from_db()
-            problems, metadata = self._prepare_documents(rows)
-            
-            # Generate embeddings (seulement sur les problèmes)
-            self.logger.info("Generating embeddings...")
-            embeddings = self.model.encode(problems, show_progress_bar=True, convert_to_numpy=True)
-            
-            # Validation des embeddings
-            if len(embeddings) != len(problems):
-                raise ValueError(f"Mismatch embeddings/documents: {len(embeddings)} vs {len(problems)}")
-            
-            # Create and save FAISS index
-            dimension = embeddings.shape[1]
-            index = faiss.IndexFlatL2(dimension)
-            index.add(embeddings.astype(np.float32))  # ← Assurance du type float32
-            
-            # Save index and metadata
-            faiss.write_index(index, str(self.index_path))
-            with open(self.metadata_path, "wb") as f:
-                pickle.dump(metadata, f)
-            
-            self.logger.info(f"Index saved to {self.index_path}")
-            self.logger.info(f"Metadata saved to {self.metadata_path}")
-            self.logger.info(f"{len(problems)} problèmes indexés avec succès")
-            
+            writer = self.snapshots.begin()
+            count = self.storage.count()
+            shard_sizes = self._shard_sizes() if sharding_enabled() else None
+            self.shards = {}
+            index = None
+            try:
+                for rows in self._iter_chunks():
+                    problems, metadata = self._prepare_documents(rows)
+
+                    # Generate embeddings (seulement sur les problèmes)
+                    embeddings = self._encode(problems)
+
+                    # Create FAISS index keyed by qa_pairs.uid so that later updates can be incremental
+                    if index is None:
+                        index, self.index_spec = self._new_index(count, embeddings.shape[1])
+                    index.add_with_ids(embeddings, self._ids(metadata))
+                    if shard_sizes is not None:
+                        self._add_to_shards(embeddings, metadata, shard_sizes)
+                    writer.append_metadata(metadata)
+                    if self.index_spec.get("exact_rescoring"):
+                        writer.append_vectors(embeddings)
+                    self.logger.info(f"{index.ntotal} problèmes indexés...")
+
+                if index is None:
+                    index, self.index_spec = self._new_index(0, self.model.get_sentence_embedding_dimension())
+            except Exception:
+                writer.abort()
+                raise
+
+            version = writer.commit(index, self.model_name, extra={"index_spec": self.index_spec},
+                                    shards=self.shards)
+            self.logger.info(f"Snapshot {version} saved to {self.snapshots.root}")
+            self.logger.info(f"{index.ntotal} problèmes indexés avec succès "
+                             f"({len(self.shards)} index par logiciel)")
+
+            # Éviction des textes qui ne sont plus dans la base
+            self.embedding_cache.retain(row.probleme for row in self.storage.iter_qa_pairs())
+            self.logger.info(f"Cache d'embeddings: {self.embedding_cache.stats()}")
+
         except Exception as e:
             self.logger.error(f"Error during index creation: {e}")
             raise
 
+    def _load_existing(self) -> Optional[Tuple[faiss.Index, List[Dict]]]:
+        """Load the current snapshot if it can be updated incrementally."""
+        current = self.snapshots.load_current(verify=False)
+        if current is None:
+            self.logger.info("Aucun index existant, reconstruction complète")
+            return None
+
+        version, index, metadata, manifest = current
+        if manifest.get("model_name") != self.model_name:
+            self.logger.info(f"Snapshot {version} construit avec {manifest.get('model_name')}, reconstruction complète")
+            return None
+
+        # Les anciens index (IndexFlatL2 positionnel) n'ont pas d'ids stables
+        if not is_updatable(index):
+            self.logger.info("Index existant non ID-mappé, reconstruction complète")
+            return None
+
+        # Le corpus a changé d'ordre de grandeur : autre type d'index, ou partitions IVF à réentraîner
+        self.index_spec = manifest.get("index_spec") or {"type": "flat"}
+        count = self.storage.count()
+        planned = choose_index_spec(count, index.d)
+        if planned["type"] != self.index_spec["type"] or planned["storage"] != self.index_spec.get("storage", "fp32") or (
+                needs_training(planned) and count > 4 * self.index_spec.get("planned_for", count)):
+            self.logger.info(f"Index {self.index_spec['type']} inadapté à {count} vecteurs "
+                             f"({planned['type']} prévu), reconstruction complète")
+            return None
+        if index.ntotal != len(metadata):
+            self.logger.warning(f"Index/metadata désynchronisés ({index.ntotal} vs {len(metadata)}), reconstruction complète")
+            return None
+        if sharding_enabled() and index.ntotal and "shards" not in manifest:
+            self.logger.info(f"Snapshot {version} sans index par logiciel, reconstruction complète")
+            return None
+        self.shards = self.snapshots.load_shards(version) if sharding_enabled() else {}
+        # La mise à jour incrémentale réécrit toutes les métadonnées : lecture complète ici seulement
+        return index, metadata.to_list()
+
+    def _mark_deleted(self, metadata: List[Dict], tombstones: TombstoneBitmap) -> int:
+        """Tombstone indexed uids whose rows were deleted or replaced in SQLite."""
+        indexed = self._ids(metadata)
+        deleted = np.array(self.storage.deleted_uids(), dtype=np.int64)
+        stale = indexed[np.isin(indexed, deleted) & ~tombstones.contains(indexed)]
+        if stale.size:
+            tombstones.add(stale)
+            tombstones.save()  # visible immédiatement par les SemanticSearcher en cours
+            self.logger.info(f"{stale.size} entrées supprimées/modifiées marquées (tombstones)")
+        return int(stale.size)
+
+    def _remove(self, index: faiss.Index, dead_ids: np.ndarray, live_metadata: List[Dict]) -> faiss.Index:
+        """Index without dead_ids; live_metadata lists exactly the entries that remain in it."""
+        try:
+            # Suppression par uid sur l'index ID-mappé
+            index.remove_ids(dead_ids)
+            return index
+        except RuntimeError:
+            # Type d'index sans remove_ids (HNSW) : réindexation des vecteurs exacts lus dans le cache
+            index = faiss.clone_index(index)
+            index.reset()
+            live_ids = self._ids(live_metadata)
+            start = 0
+            for block in self._exact_vector_blocks(live_metadata):
+                index.add_with_ids(block, live_ids[start:start + len(block)])
+                start += len(block)
+            return index
+
+    def _compact(self, index: faiss.Index, metadata: List[Dict],
+                 tombstones: TombstoneBitmap) -> Tuple[faiss.Index, List[Dict]]:
+        """Physically drop tombstoned vectors (cached embeddings only, nothing is re-encoded)."""
+        ids = self._ids(metadata)
+        dead = tombstones.contains(ids)
+        shard_live: Dict[str, List[Dict]] = {}
+        shard_dead: Dict[str, List[int]] = {}
+        for m, is_dead in zip(metadata, dead):
+            key = shard_key(m["logiciel"])
+            if is_dead:
+                shard_dead.setdefault(key, []).append(m["id"])
+            else:
+                shard_live.setdefault(key, []).append(m)
+        metadata = [m for m, is_dead in zip(metadata, dead) if not is_dead]
+        index = self._remove(index, ids[dead], metadata)
+
+        for key, shard in list(self.shards.items()):
+            if key not in shard_live:
+                del self.shards[key]  # plus aucune entrée pour ce logiciel
+            elif key in shard_dead:
+                shard.index = self._remove(shard.index, np.array(shard_dead[key], dtype=np.int64), shard_live[key])
+        self.logger.info(f"Compaction: {int(dead.sum())} vecteurs retirés (total: {index.ntotal})")
+        self.embedding_cache.retain(m["probleme"] for m in metadata)
+        # Les bits restent posés : les uids ne sont jamais réattribués (AUTOINCREMENT) et un
+        # lecteur qui n'a pas encore rechargé l'index doit continuer à les filtrer.
+        return index, metadata
+
+    def update_index(self) -> int:
+        """
+        Incremental update: tombstone deleted/edited rows, embed only rows above
+        the index high-water mark (max indexed uid) and append them under their uid,
+        then compact once tombstones exceed the configured ratio.
+
+        Returns:
+            Number of newly indexed rows
+        """
+        try:
+            existing = self._load_existing()
+            if existing is None:
+                self.create_and_save_index()
+                return self.storage.count()
+
+            index, metadata = existing
+            tombstones = TombstoneBitmap(self.tombstone_path)
+            changed = False
+
+            # 1. Suppressions et anciennes versions des entrées modifiées
+            self._mark_deleted(metadata, tombstones)
+
+            # 2. Nouvelles lignes (y compris les nouvelles versions des entrées modifiées)
+            indexed = self._ids(metadata)
+            high_water_mark = int(indexed.max()) if metadata else 0
+            rows = self._fetch_data_from_db(since_uid=high_water_mark)
+
+            # Lignes insérées avec un uid explicite inférieur au high-water mark (export_to_sqlite):
+            # rattrapées par différence d'ids, toujours sans réencoder l'existant
+            live_indexed = int((~tombstones.contains(indexed)).sum())
+            if live_indexed + len(rows) != self.storage.count():
+                missing = np.setdiff1d(np.array(self.storage.live_uids(), dtype=np.int64), indexed)
+                rows = self.storage.fetch_by_uids(missing.tolist())
+            if rows:
+                problems, new_metadata = self._prepare_documents(rows)
+                embeddings = self._encode(problems)
+                if embeddings.shape[1] != index.d:
+                    raise ValueError(f"Dimension mismatch: index {index.d} vs embeddings {embeddings.shape[1]}")
+
+                index.add_with_ids(embeddings, self._ids(new_metadata))
+                if sharding_enabled():
+                    self._add_to_shards(embeddings, new_metadata, self._shard_sizes())
+                metadata.extend(new_metadata)
+                changed = True
+                self.logger.info(f"{len(rows)} nouveaux problèmes indexés (total: {index.ntotal})")
+            else:
+                self.logger.info(f"Aucune nouvelle ligne (uid max indexé: {high_water_mark})")
+
+            # 3. Compaction périodique
+            dead_count = int(tombstones.contains(self._ids(metadata)).sum())
+            if index.ntotal and dead_count / index.ntotal >= self.compaction_ratio:
+                index, metadata = self._compact(index, metadata, tombstones)
+                changed = True
+
+            if changed:
+                self._save(index, metadata)
+            return len(rows)
+
+        except Exception as e:
+            self.logger.error(f"Error during incremental indexing: {e}")
+            raise
+
 def main():
+    parser = argparse.ArgumentParser(description="Build or update the FAISS index from qa_pairs")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only embed rows newer than the current index")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="encoding worker processes (default: ENCODE_PROCESSES, 0 = in-process)")
+    parser.add_argument("--backend", choices=["torch", "onnx", "onnx-int8"], default=None,
+                        help="embedding backend (default: EMBEDDING_BACKEND, torch)")
+    args = parser.parse_args()
+
     try:
-        embedder = DocumentEmbedder()
-        embedder.create_and_save_index()
+        embedder = DocumentEmbedder(processes=args.processes, backend=args.backend)
+        if args.incremental:
+            embedder.update_index()
+        else:
+            embedder.create_and_save_index()
     except Exception as e:
         logging.error(f"Application failed: {e}")
         raise
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,256 @@
+"""
+BACKENDS D'ENCODAGE
+- "torch"     : SentenceTransformer fp32 (comportement historique)
+- "onnx"      : même modèle exporté en ONNX, exécuté par onnxruntime sur CPU
+- "onnx-int8" : export ONNX avec quantification dynamique int8 des poids
+
+Les backends ONNX n'importent ni torch ni sentence-transformers à l'exécution
+(tokenizers + onnxruntime seulement ; onnxruntime est une dépendance optionnelle,
+à installer avec `pip install onnxruntime`) : RSS et latence d'encodage des requêtes
+nettement plus faibles. Les vecteurs restent dans l'espace du modèle d'origine,
+donc compatibles avec un index construit en fp32 (voir verify_recall).
+
+Export (une fois, nécessite torch) :
+    python embedding_backend.py export --model all-MiniLM-L6-v2 --verify
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+DEFAULT_ONNX_DIR = Path(__file__).resolve().parent / "db" / "onnx"
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+ENCODER_CONFIG_FILE = "encoder.json"
+
+
+def get_backend(backend: Optional[str] = None) -> str:
+    """Backend demandé, ou EMBEDDING_BACKEND (torch par défaut)."""
+    backend = backend or os.getenv("EMBEDDING_BACKEND", "torch")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+    return backend
+
+
+def onnx_dir_for(model_name: str) -> Path:
+    root = Path(os.getenv("ONNX_MODEL_DIR", str(DEFAULT_ONNX_DIR)))
+    return root / re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+
+
+def cache_key(model_name: str, backend: Optional[str] = None) -> str:
+    """Clé du cache d'embeddings : les vecteurs int8 ne doivent pas se mélanger aux vecteurs fp32."""
+    backend = get_backend(backend)
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def export_onnx(model_name: str, output_dir: Optional[Path] = None, quantize: bool = True) -> Path:
+    """
+    Exporte le transformer d'un SentenceTransformer en ONNX (axes dynamiques),
+    enregistre le tokenizer et la configuration de pooling, puis quantifie en int8.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    output_dir = Path(output_dir or onnx_dir_for(model_name))
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    module_names = [type(module).__name__ for module in model]
+    pooling = model[1] if len(model) > 1 else None
+
+    dummy = tokenizer(["exemple de texte"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            str(output_dir / ONNX_FILE),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    tokenizer.save_pretrained(str(output_dir))
+    config = {
+        "model_name": model_name,
+        "input_names": input_names,
+        "max_seq_length": model.max_seq_length,
+        "pooling": "cls" if pooling is not None and getattr(pooling, "pooling_mode_cls_token", False) else "mean",
+        "normalize": "Normalize" in module_names,
+        "dimension": model.get_sentence_embedding_dimension(),
+    }
+    with open(output_dir / ENCODER_CONFIG_FILE, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(output_dir / ONNX_FILE), str(output_dir / ONNX_INT8_FILE),
+                         weight_type=QuantType.QInt8)
+
+    logger.info(f"Modèle {model_name} exporté en ONNX dans {output_dir}")
+    return output_dir
+
+
+class OnnxEncoder:
+    """Encodeur onnxruntime, avec la même signature encode() que SentenceTransformer."""
+
+    def __init__(self, model_name: str, quantized: bool = True, threads: Optional[int] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        folder = onnx_dir_for(model_name)
+        model_file = folder / (ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if not model_file.exists():
+            logger.info(f"Aucun export ONNX pour {model_name}, export en cours...")
+            export_onnx(model_name, folder, quantize=quantized)
+
+        with open(folder / ENCODER_CONFIG_FILE, "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.model_name = model_name
+        self.backend = "onnx-int8" if quantized else "onnx"
+
+        self.tokenizer = Tokenizer.from_file(str(folder / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(model_file), options, providers=["CPUExecutionProvider"])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: feeds[name] for name in self.config["input_names"]})[0]
+
+        if self.config["pooling"] == "cls":
+            embeddings = hidden[:, 0]
+        else:
+            mask = feeds["attention_mask"][..., None].astype(np.float32)
+            embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.config["normalize"]:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype(np.float32)
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.config["dimension"]), dtype=np.float32)
+        embeddings = np.vstack([self._encode_batch(texts[start:start + batch_size])
+                                for start in range(0, len(texts), batch_size)])
+        return embeddings[0] if single else embeddings
+
+
+def load_encoder(model_name: str, backend: Optional[str] = None, device: Optional[str] = None,
+                 threads: Optional[int] = None):
+    """
+    Encodeur pour le backend choisi ; tous exposent encode(texts, batch_size=..., convert_to_numpy=True).
+
+    Args:
+        backend: "torch", "onnx" ou "onnx-int8" (par défaut: EMBEDDING_BACKEND)
+        device: Périphérique torch (backend torch uniquement ; cuda si disponible par défaut)
+        threads: Threads d'inférence onnxruntime (backends ONNX uniquement)
+    """
+    backend = get_backend(backend)
+    if backend == "torch":
+        import torch
+        from sentence_transformers import SentenceTransformer
+        device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        return SentenceTransformer(model_name, device=device)
+    return OnnxEncoder(model_name, quantized=backend == "onnx-int8", threads=threads)
+
+
+def verify_recall(model_name: str, texts: Sequence[str], queries: Sequence[str],
+                  backend: str = "onnx-int8", k: int = 10) -> dict:
+    """
+    Compare un backend au modèle fp32 : similarité cosinus entre vecteurs et
+    recall@k des requêtes encodées par le backend contre un index construit en fp32.
+    """
+    import faiss
+
+    reference = load_encoder(model_name, "torch", device="cpu")
+    candidate = load_encoder(model_name, backend)
+
+    ref_docs = reference.encode(list(texts), convert_to_numpy=True).astype(np.float32)
+    cand_docs = candidate.encode(list(texts), convert_to_numpy=True)
+    ref_queries = reference.encode(list(queries), convert_to_numpy=True).astype(np.float32)
+
+    start = time.perf_counter()
+    cand_queries = candidate.encode(list(queries), batch_size=1, convert_to_numpy=True)
+    candidate_latency = (time.perf_counter() - start) / len(queries)
+    start = time.perf_counter()
+    reference.encode(list(queries), batch_size=1, convert_to_numpy=True)
+    reference_latency = (time.perf_counter() - start) / len(queries)
+
+    cosine = (ref_docs * cand_docs).sum(axis=1) / (
+        np.linalg.norm(ref_docs, axis=1) * np.linalg.norm(cand_docs, axis=1))
+
+    index = faiss.IndexFlatL2(ref_docs.shape[1])
+    index.add(ref_docs)
+    k = min(k, len(texts))
+    _, expected = index.search(ref_queries, k)
+    _, got = index.search(cand_queries.astype(np.float32), k)
+    recall = np.mean([len(set(e) & set(g)) / k for e, g in zip(expected, got)])
+
+    return {
+        "backend": backend,
+        "cosine_min": float(cosine.min()),
+        "cosine_mean": float(cosine.mean()),
+        f"recall@{k}": float(recall),
+        "query_latency_ms": round(candidate_latency * 1000, 2),
+        "fp32_query_latency_ms": round(reference_latency * 1000, 2),
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export ONNX/int8 du modèle d'embedding")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="exporte et quantifie le modèle")
+    export.add_argument("--model", default="all-MiniLM-L6-v2")
+    export.add_argument("--no-quantize", action="store_true")
+    export.add_argument("--verify", action="store_true", help="contrôle le recall sur les problèmes de la base")
+    args = parser.parse_args()
+
+    export_onnx(args.model, quantize=not args.no_quantize)
+    if args.verify:
+        from storage import get_storage
+        texts = [p.probleme for p in get_storage().iter_qa_pairs()][:5000]
+        if len(texts) < 2:
+            print("Base vide : vérification impossible")
+            return
+        queries = texts[::max(1, len(texts) // 200)]
+        backend = "onnx" if args.no_quantize else "onnx-int8"
+        print(json.dumps(verify_recall(args.model, texts, queries, backend=backend), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+CACHE D'EMBEDDINGS PERSISTANT
+Clé = (nom du modèle, SHA-256 du texte normalisé). Un répertoire par modèle :
+
+    db/embedding_cache/all-MiniLM-L6-v2/
+        keys.db                 (hash -> ligne, métadonnées ; SQLite WAL)
+        vectors.<gen>.f32       (float32 bruts, lus via np.memmap)
+
+Les vecteurs sont écrits avant que leurs clés ne soient validées : un lecteur
+(autre processus) ne voit jamais une clé pointant vers une ligne incomplète.
+Seuls les textes nouveaux ou modifiés sont encodés lors d'une reconstruction.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from storage import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+EncodeFn = Callable[[List[str]], np.ndarray]
+
+
+def normalize_text(text: str) -> str:
+    """Forme canonique d'un texte avant hachage (Unicode NFKC, espaces fusionnés)."""
+    return " ".join(unicodedata.normalize("NFKC", str(text or "")).split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _model_dirname(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+
+
+class EmbeddingCache:
+    """Cache disque des embeddings, partagé par DocumentEmbedder et SemanticSearcher."""
+
+    def __init__(self, root: Path, model_name: str, compaction_ratio: float = 0.3):
+        """
+        Args:
+            root: Répertoire racine du cache (un sous-répertoire par modèle)
+            model_name: Modèle ayant produit les vecteurs
+            compaction_ratio: Proportion de lignes orphelines déclenchant la réécriture du fichier de vecteurs
+        """
+        self.model_name = model_name
+        self.dir = Path(root) / _model_dirname(model_name)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.compaction_ratio = compaction_ratio
+        self._pool = ConnectionPool(self.dir / "keys.db", max_size=2)
+        self._map_lock = threading.Lock()
+        self._vectors: Optional[np.memmap] = None
+        self._mapped: Tuple[int, int] = (-1, 0)     # (génération, nombre de lignes) du memmap ouvert
+        self.hits = 0
+        self.misses = 0
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        with self._pool.connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (hash TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.executemany("INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)",
+                             [("model_name", self.model_name), ("generation", "0"),
+                              ("rows", "0"), ("dimension", "0")])
+
+    @staticmethod
+    def _meta(conn) -> Dict[str, str]:
+        return {row["key"]: row["value"] for row in conn.execute("SELECT key, value FROM meta")}
+
+    def _vectors_path(self, generation: int) -> Path:
+        return self.dir / f"vectors.{generation}.f32"
+
+    def _matrix(self, generation: int, dimension: int, min_rows: int) -> np.memmap:
+        """memmap du fichier de vecteurs, rouvert quand la génération change ou que le fichier a grandi."""
+        with self._map_lock:
+            gen, rows = self._mapped
+            if self._vectors is None or gen != generation or rows < min_rows:
+                path = self._vectors_path(generation)
+                rows = path.stat().st_size // (4 * dimension)
+                self._vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dimension))
+                self._mapped = (generation, rows)
+            return self._vectors
+
+    def _lookup(self, hashes: Sequence[str]) -> Tuple[Dict[str, int], int, int]:
+        """hash -> ligne pour les clés présentes, plus la génération et la dimension lues dans le même instantané."""
+        found: Dict[str, int] = {}
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN")  # lecture cohérente meta/entries pendant une éventuelle compaction
+            meta = self._meta(conn)
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update((row["hash"], row["row"]) for row in conn.execute(
+                    f"SELECT hash, row FROM entries WHERE hash IN ({placeholders})", batch))
+        return found, int(meta["generation"]), int(meta["dimension"])
+
+    def get_many(self, texts: Sequence[str]) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """
+        Returns:
+            (vecteurs (n, d) avec des zéros pour les absents ou None si le cache est vide,
+             masque booléen des textes trouvés)
+        """
+        hashes = [text_hash(t) for t in texts]
+        found, generation, dimension = self._lookup(list(set(hashes)))
+        mask = np.array([h in found for h in hashes], dtype=bool)
+        if not found:
+            return None, mask
+
+        rows = np.array([found.get(h, 0) for h in hashes], dtype=np.int64)
+        matrix = self._matrix(generation, dimension, int(rows.max()) + 1)
+        vectors = np.zeros((len(texts), dimension), dtype=np.float32)
+        vectors[mask] = matrix[rows[mask]]
+        return vectors, mask
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> int:
+        """Ajoute les vecteurs des textes absents du cache ; retourne le nombre de lignes écrites."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(texts) != len(vectors):
+            raise ValueError(f"Mismatch texts/vectors: {len(texts)} vs {len(vectors)}")
+
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")  # un seul rédacteur à la fois, tous processus confondus
+            meta = self._meta(conn)
+            dimension, rows = int(meta["dimension"]), int(meta["rows"])
+            if dimension and dimension != vectors.shape[1]:
+                raise ValueError(f"Dimension mismatch: cache {dimension} vs vectors {vectors.shape[1]}")
+
+            hashes = [text_hash(t) for t in texts]
+            present = set()
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                present.update(row[0] for row in conn.execute(
+                    f"SELECT hash FROM entries WHERE hash IN ({','.join('?' * len(batch))})", batch))
+
+            new: Dict[str, int] = {}
+            for i, h in enumerate(hashes):
+                if h not in present and h not in new:
+                    new[h] = i
+            if not new:
+                return 0
+
+            # Écriture à la position attendue (écrase une éventuelle fin partielle après un crash)
+            path = self._vectors_path(int(meta["generation"]))
+            with open(path, "r+b" if path.exists() else "wb") as f:
+                f.seek(rows * vectors.shape[1] * 4)
+                f.write(vectors[list(new.values())].tobytes())
+                f.truncate()
+
+            conn.executemany("INSERT INTO entries (hash, row) VALUES (?, ?)",
+                             [(h, rows + offset) for offset, h in enumerate(new)])
+            conn.executemany("UPDATE meta SET value = ? WHERE key = ?",
+                             [(str(rows + len(new)), "rows"), (str(vectors.shape[1]), "dimension")])
+        return len(new)
+
+    def encode(self, texts: Sequence[str], encode_fn: EncodeFn, store: bool = True) -> np.ndarray:
+        """
+        Embeddings de tous les textes : lus en bloc dans le cache, seuls les absents
+        passent par encode_fn (en un seul appel, sans doublons).
+
+        Args:
+            store: Écrire les nouveaux vecteurs dans le cache (False pour les requêtes éphémères)
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        vectors, mask = self.get_many(texts)
+        hit_count = int(mask.sum())
+        self.hits += hit_count
+        self.misses += len(texts) - hit_count
+        if hit_count == len(texts):
+            return vectors
+
+        missing: Dict[str, List[int]] = {}
+        for i in np.flatnonzero(~mask):
+            missing.setdefault(normalize_text(texts[i]), []).append(int(i))
+        to_encode = [texts[positions[0]] for positions in missing.values()]
+        encoded = np.asarray(encode_fn(to_encode), dtype=np.float32)
+
+        if vectors is None:
+            vectors = np.zeros((len(texts), encoded.shape[1]), dtype=np.float32)
+        for vector, positions in zip(encoded, missing.values()):
+            vectors[positions] = vector
+
+        if store:
+            self.put_many(to_encode, encoded)
+        return vectors
+
+    def retain(self, texts: Iterable[str]) -> int:
+        """
+        Politique d'éviction : ne garde que les textes encore présents dans la base
+        (les entrées supprimées ou modifiées sont retirées) puis compacte si nécessaire.
+
+        Returns:
+            Nombre d'entrées évincées
+        """
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_hashes (hash TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM keep_hashes")
+            # Consommé en flux : les textes ne sont jamais tous en mémoire
+            conn.executemany("INSERT OR IGNORE INTO keep_hashes (hash) VALUES (?)",
+                             ((text_hash(t),) for t in texts))
+            evicted = conn.execute(
+                "DELETE FROM entries WHERE hash NOT IN (SELECT hash FROM keep_hashes)").rowcount
+            conn.execute("DELETE FROM keep_hashes")
+
+        if evicted:
+            logger.info(f"Cache d'embeddings: {evicted} entrées évincées")
+            self.maybe_compact()
+        return evicted
+
+    def maybe_compact(self) -> bool:
+        """Réécrit le fichier de vecteurs sans les lignes orphelines si elles dépassent compaction_ratio."""
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            meta = self._meta(conn)
+            rows, dimension, generation = int(meta["rows"]), int(meta["dimension"]), int(meta["generation"])
+            live = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            if not rows or (rows - live) / rows < self.compaction_ratio:
+                return False
+
+            entries = conn.execute("SELECT hash, row FROM entries ORDER BY row").fetchall()
+            old = np.memmap(self._vectors_path(generation), dtype=np.float32, mode="r", shape=(rows, dimension))
+            new_generation = generation + 1
+            with open(self._vectors_path(new_generation), "wb") as f:
+                for start in range(0, len(entries), 10000):
+                    chunk = entries[start:start + 10000]
+                    f.write(np.ascontiguousarray(old[[e["row"] for e in chunk]]).tobytes())
+            del old
+
+            conn.executemany("UPDATE entries SET row = ? WHERE hash = ?",
+                             [(i, e["hash"]) for i, e in enumerate(entries)])
+            conn.executemany("UPDATE meta SET value = ? WHERE key = ?",
+                             [(str(len(entries)), "rows"), (str(new_generation), "generation")])
+
+        # La génération précédente reste lisible pour un lecteur qui vient de la consulter
+        for path in self.dir.glob("vectors.*.f32"):
+            if int(path.name.split(".")[1]) < generation:
+                path.unlink(missing_ok=True)
+        logger.info(f"Cache d'embeddings compacté: {rows} -> {len(entries)} lignes")
+        return True
+
+    def stats(self) -> Dict[str, object]:
+        """Taux de succès (depuis la création de l'instance) et occupation disque."""
+        with self._pool.connection() as conn:
+            meta = self._meta(conn)
+            entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        size = sum(p.stat().st_size for p in self.dir.iterdir() if p.is_file())
+        lookups = self.hits + self.misses
+        return {
+            "model_name": self.model_name,
+            "entries": entries,
+            "rows": int(meta["rows"]),
+            "dimension": int(meta["dimension"]),
+            "size_bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,85 @@
+"""
+ORDONNANCEMENT DES LOTS D'ENCODAGE PAR LONGUEUR
+Les textes sont triés par nombre de tokens puis regroupés en lots dont le coût
+(taille du lot x longueur du plus long texte, padding compris) respecte un budget
+de tokens : beaucoup de textes courts par lot, peu de textes longs, presque pas
+de padding. Les embeddings sont remis dans l'ordre d'origine.
+"""
+
+import logging
+import os
+from typing import List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("EMBED_TOKEN_BUDGET", "8192"))
+
+
+def token_lengths(encoder, texts: Sequence[str]) -> np.ndarray:
+    """Nombre de tokens (tokens spéciaux compris, tronqué à max_seq_length) de chaque texte."""
+    texts = list(texts)
+    tokenizer = getattr(encoder, "tokenizer", None)
+    max_length = getattr(encoder, "max_seq_length", None) or getattr(encoder, "config", {}).get("max_seq_length", 512)
+
+    if hasattr(tokenizer, "encode_batch"):
+        # tokenizers.Tokenizer (backends ONNX)
+        lengths = [len(e.ids) for e in tokenizer.encode_batch(texts)]
+    elif tokenizer is not None:
+        # Tokenizer Hugging Face (SentenceTransformer)
+        lengths = [len(ids) for ids in tokenizer(texts, add_special_tokens=True, truncation=True,
+                                                 max_length=max_length)["input_ids"]]
+    else:
+        # Estimation grossière (~1.3 token par mot)
+        lengths = [int(len(t.split()) * 1.3) + 2 for t in texts]
+    return np.minimum(np.array(lengths, dtype=np.int64), max_length)
+
+
+def plan_batches(lengths: np.ndarray, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 max_batch_size: int = 256) -> List[np.ndarray]:
+    """
+    Découpe les indices triés par longueur en lots de coût len(lot) x max(longueur) <= token_budget.
+
+    Returns:
+        Liste d'indices (dans l'ordre d'origine) par lot
+    """
+    order = np.argsort(lengths, kind="stable")
+    batches: List[np.ndarray] = []
+    start = 0
+    while start < len(order):
+        end = start + 1
+        # Triés par ordre croissant : la longueur du dernier texte ajouté fixe le padding du lot
+        while (end < len(order) and end - start < max_batch_size
+               and (end - start + 1) * max(int(lengths[order[end]]), 1) <= token_budget):
+            end += 1
+        batches.append(order[start:end])
+        start = end
+    return batches
+
+
+def padding_ratio(lengths: np.ndarray, batches: List[np.ndarray]) -> float:
+    """Tokens de padding / tokens utiles pour un découpage donné."""
+    useful = int(lengths.sum())
+    padded = sum(len(batch) * int(lengths[batch].max()) for batch in batches)
+    return (padded - useful) / useful if useful else 0.0
+
+
+def encode_bucketed(encoder, texts: Sequence[str], token_budget: int = DEFAULT_TOKEN_BUDGET,
+                    max_batch_size: int = 256) -> np.ndarray:
+    """Encode les textes par lots homogènes en longueur ; la ligne i correspond à texts[i]."""
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    lengths = token_lengths(encoder, texts)
+    batches = plan_batches(lengths, token_budget, max_batch_size)
+    output = None
+    for batch in batches:
+        embeddings = encoder.encode([texts[i] for i in batch], batch_size=len(batch),
+                                    convert_to_numpy=True, show_progress_bar=False)
+        if output is None:
+            output = np.empty((len(texts), embeddings.shape[1]), dtype=np.float32)
+        output[batch] = embeddings
+    logger.debug(f"{len(texts)} textes en {len(batches)} lots (padding {padding_ratio(lengths, batches):.1%})")
+    return output
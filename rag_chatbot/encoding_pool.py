@@ -0,0 +1,118 @@
+"""
+ENCODAGE MULTI-PROCESSUS SUR CPU
+Les textes sont découpés en blocs répartis sur N processus (spawn), chacun avec
+son propre modèle et un nombre de threads PyTorch fixé. Sur CPU, plusieurs
+processus à 1-2 threads passent bien mieux à l'échelle qu'un seul processus
+multithreadé sur de petits lots MiniLM. Les embeddings sont réassemblés dans
+l'ordre d'origine.
+"""
+
+import logging
+import multiprocessing as mp
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from embedding_scheduler import DEFAULT_TOKEN_BUDGET, encode_bucketed
+
+logger = logging.getLogger(__name__)
+
+# Modèle chargé une fois par processus worker
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int, backend: str) -> None:
+    global _worker_model
+    # Avant l'import de torch : évite que chaque worker ouvre autant de threads que de cœurs
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+    from embedding_backend import load_encoder
+
+    if backend == "torch":
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    _worker_model = load_encoder(model_name, backend, device="cpu", threads=threads)
+
+
+def _encode_chunk(args: Tuple[int, List[str], int, int]) -> Tuple[int, np.ndarray]:
+    position, texts, batch_size, token_budget = args
+    embeddings = encode_bucketed(_worker_model, texts, token_budget=token_budget, max_batch_size=batch_size)
+    return position, embeddings.astype(np.float32)
+
+
+def default_processes(threads_per_process: int = 1) -> int:
+    return max(1, (os.cpu_count() or 1) // threads_per_process)
+
+
+class EncodingPool:
+    """
+    Pool de processus d'encodage, à utiliser comme gestionnaire de contexte :
+
+        with EncodingPool("all-MiniLM-L6-v2", processes=8) as pool:
+            embeddings = pool.encode(texts)
+    """
+
+    def __init__(self, model_name: str, processes: Optional[int] = None, threads_per_process: int = 1,
+                 chunk_size: int = 1024, batch_size: int = 256, backend: str = "torch",
+                 token_budget: int = DEFAULT_TOKEN_BUDGET):
+        """
+        Args:
+            processes: Nombre de workers (par défaut: cœurs / threads_per_process)
+            threads_per_process: Threads PyTorch par worker
+            chunk_size: Textes envoyés à un worker par tâche (granularité de la répartition)
+            batch_size: Taille maximale des lots d'encodage dans chaque worker
+            backend: Backend d'encodage des workers (voir embedding_backend)
+            token_budget: Tokens (padding compris) par lot, voir embedding_scheduler
+        """
+        self.model_name = model_name
+        self.threads_per_process = threads_per_process
+        self.processes = processes or default_processes(threads_per_process)
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.backend = backend
+        self.token_budget = token_budget
+        self._pool = None
+
+    def start(self) -> "EncodingPool":
+        if self._pool is None:
+            # spawn : pas de fork d'un processus qui a déjà initialisé torch ou FAISS
+            context = mp.get_context("spawn")
+            self._pool = context.Pool(self.processes, initializer=_init_worker,
+                                      initargs=(self.model_name, self.threads_per_process, self.backend))
+            logger.info(f"Pool d'encodage démarré: {self.processes} processus x {self.threads_per_process} thread(s)")
+        return self
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self) -> "EncodingPool":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Encode les textes en parallèle ; la ligne i du résultat correspond à texts[i]."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        self.start()
+
+        # Blocs découpés après tri par longueur (en caractères) : chaque worker reçoit des textes homogènes
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        sorted_texts = [texts[i] for i in order]
+        tasks = [(start, sorted_texts[start:start + self.chunk_size], self.batch_size, self.token_budget)
+                 for start in range(0, len(texts), self.chunk_size)]
+        output: Optional[np.ndarray] = None
+        # imap_unordered : un worker lent ne bloque pas les autres, la position remet chaque bloc en place
+        for position, embeddings in self._pool.imap_unordered(_encode_chunk, tasks):
+            if output is None:
+                output = np.empty((len(texts), embeddings.shape[1]), dtype=np.float32)
+            output[order[position:position + len(embeddings)]] = embeddings
+        return output
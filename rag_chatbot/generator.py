@@ -1,5 +1,7 @@
 from typing import List
+from concurrent.futures import ThreadPoolExecutor
 from retriever import SearchResult #add rag_chatbot.retriever when use app
+import asyncio
 import logging
 import os
 from openai import OpenAI
@@ -8,13 +10,14 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ResponseGenerator:
-    def __init__(self, model_name: str, device: str = None):
+    def __init__(self, model_name: str, device: str = None, max_concurrent: int = 16):
         """
         Initialise le générateur de réponses via OpenRouter.
         
         Args:
             model_name: identifiant du modèle OpenRouter (ex: meta-llama/llama-3.2-1b-instruct:free)
             device: ignoré ici (géré côté API)
+            max_concurrent: appels API simultanés de agenerate (attente réseau, pas de CPU)
         """
         self.model_name = model_name
         api_key = os.getenv("OPENROUTER_API_KEY")
@@ -25,6 +28,8 @@ class ResponseGenerator:
             base_url="https://openrouter.ai/api/v1",
             api_key=api_key
         )
+        # Le client OpenAI est thread-safe : un seul client partagé par les threads
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="generate")
         logger.info(f" Générateur initialisé avec {model_name} (OpenRouter)")
 
     def _build_prompt(self, query: str, context_results: List[SearchResult]) -> str:
@@ -79,6 +84,11 @@ QUESTION UTILISATEUR:
             logger.error(f"Erreur pendant la génération: {e}")
             return f"Erreur: {str(e)}"
 
+    async def agenerate(self, query: str, context_results: List[SearchResult]) -> str:
+        """generate_response sans bloquer la boucle d'événements pendant l'appel API"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.generate_response, query, context_results)
+
 
 # Exemple d’utilisation rapide
 if __name__ == "__main__":
@@ -88,7 +98,8 @@ if __name__ == "__main__":
         searcher = SemanticSearcher(
             model_name="all-MiniLM-L6-v2",
             index_path="db/faiss_index.index",
-            metadata_path="db/metadata.pkl"
+            metadata_path="db/metadata.pkl",
+            snapshot_dir="db/index"
         )
 
         query = "Comment générer un rapport dans docubase?"
@@ -0,0 +1,215 @@
+"""
+CHOIX DU TYPE D'INDEX FAISS SELON LA TAILLE DU CORPUS
+- flat     : recherche exhaustive exacte (petites bases)
+- hnsw     : graphe HNSW, recall élevé, sous la milliseconde jusqu'à ~1M vecteurs
+- ivf_flat : partitions IVF, vecteurs complets (recall élevé, mémoire ~ flat)
+- ivf_pq   : partitions IVF + quantification produit (millions de vecteurs, mémoire réduite)
+
+Le choix dépend du nombre de vecteurs et de l'objectif (INDEX_TARGET) :
+"balanced", "recall", "latency" ou "memory". INDEX_TYPE force un type.
+INDEX_STORAGE ("fp32", "fp16" ou "sq8") compresse les vecteurs des index
+flat/hnsw/ivf_flat ; avec une compression avec perte (fp16, sq8, pq), les
+vecteurs float32 sont écrits à part et la liste courte est re-classée exactement.
+sq8 s'entraîne : sous MIN_SQ8_TRAINING vecteurs, fp16 est utilisé à la place.
+La spécification retenue est enregistrée dans le manifeste de l'instantané
+(clé "index_spec") et réappliquée par SemanticSearcher au chargement.
+"""
+
+import logging
+import math
+import os
+from typing import Any, Dict, Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+TARGETS = ("balanced", "recall", "latency", "memory")
+STORAGES = ("fp32", "fp16", "sq8")
+
+_SQ_TYPES = {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+
+# Seuils (nombre de vecteurs) : en dessous de flat_max, l'exhaustif reste sous la milliseconde
+_THRESHOLDS = {
+    #             flat_max   hnsw_max
+    "balanced": (10_000,    1_000_000),
+    "recall":   (50_000,    2_000_000),
+    "latency":  (5_000,     1_000_000),
+    "memory":   (10_000,    0),
+}
+
+# Paramètres de recherche par objectif
+_HNSW_PARAMS = {"balanced": (32, 128), "recall": (48, 256), "latency": (32, 64), "memory": (16, 128)}   # (M, efSearch)
+_NPROBE = {"balanced": 16, "recall": 32, "latency": 8, "memory": 16}
+
+# FAISS recommande au moins ~39 points d'entraînement par centroïde
+MIN_POINTS_PER_CENTROID = 39
+# Bits par sous-quantificateur PQ : 2**8 centroïdes à entraîner par sous-espace
+PQ_NBITS = 8
+# sq8 apprend le min/max de chaque composante : en dessous, intervalles peu fiables (ou aucun vecteur)
+MIN_SQ8_TRAINING = 1_000
+
+
+def _nlist(n: int) -> int:
+    nlist = int(4 * math.sqrt(max(n, 1)))
+    return max(1, min(nlist, n // MIN_POINTS_PER_CENTROID))
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    """Plus grand diviseur de la dimension donnant des sous-vecteurs d'au moins 8 composantes."""
+    for m in range(max(1, dimension // 8), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def choose_index_spec(n: int, dimension: int, target: Optional[str] = None,
+                      index_type: Optional[str] = None, storage: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Spécification d'index pour n vecteurs de dimension donnée.
+
+    Args:
+        target: Objectif (INDEX_TARGET, "balanced" par défaut)
+        index_type: Type imposé (INDEX_TYPE, "auto" par défaut)
+        storage: Codage des vecteurs (INDEX_STORAGE, "fp32" par défaut)
+    """
+    target = target or os.getenv("INDEX_TARGET", "balanced")
+    index_type = index_type or os.getenv("INDEX_TYPE", "auto")
+    storage = storage or os.getenv("INDEX_STORAGE", "fp32")
+    if target not in TARGETS:
+        raise ValueError(f"Unknown index target {target!r}, expected one of {TARGETS}")
+    if storage not in STORAGES:
+        raise ValueError(f"Unknown index storage {storage!r}, expected one of {STORAGES}")
+
+    if index_type == "auto":
+        flat_max, hnsw_max = _THRESHOLDS[target]
+        if n <= flat_max:
+            index_type = "flat"
+        elif n <= hnsw_max:
+            index_type = "hnsw"
+        elif target == "recall":
+            index_type = "ivf_flat"
+        else:
+            index_type = "ivf_pq"
+    elif index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+    # Pas assez de points pour entraîner des partitions : exhaustif
+    if index_type.startswith("ivf") and _nlist(n) < 2:
+        index_type = "flat"
+    # Trop peu de points pour les codebooks PQ (petit shard d'un logiciel) : partitions sans PQ
+    if index_type == "ivf_pq" and n < 2 ** PQ_NBITS * MIN_POINTS_PER_CENTROID:
+        index_type = "ivf_flat"
+    # Base vide ou minuscule : fp16, sans entraînement (l'index passe en sq8 à la reconstruction qui suit la croissance)
+    if storage == "sq8" and n < MIN_SQ8_TRAINING:
+        storage = "fp16"
+
+    spec: Dict[str, Any] = {"type": index_type, "target": target, "planned_for": n,
+                            "storage": "pq" if index_type == "ivf_pq" else storage}
+    # Re-classement exact de la liste courte sur les vecteurs float32 si le codage perd de l'information
+    spec["exact_rescoring"] = spec["storage"] != "fp32"
+    if index_type == "hnsw":
+        spec["M"], spec["efSearch"] = _HNSW_PARAMS[target]
+        spec["efConstruction"] = 200
+    elif index_type.startswith("ivf"):
+        spec["nlist"] = _nlist(n)
+        spec["nprobe"] = min(_NPROBE[target], spec["nlist"])
+        if index_type == "ivf_pq":
+            spec["m"] = _pq_subquantizers(dimension)
+            spec["nbits"] = PQ_NBITS
+    return spec
+
+
+def needs_training(spec: Dict[str, Any]) -> bool:
+    # sq8 apprend l'intervalle de chaque composante
+    return spec["type"].startswith("ivf") or spec.get("storage") == "sq8"
+
+
+def training_size(spec: Dict[str, Any]) -> int:
+    """Nombre de vecteurs d'entraînement à échantillonner (0 si l'index ne s'entraîne pas)."""
+    if not needs_training(spec):
+        return 0
+    if not spec["type"].startswith("ivf"):
+        return 20_000
+    return min(spec["nlist"] * 256, max(spec["nlist"] * MIN_POINTS_PER_CENTROID, 100_000))
+
+
+def build_index(spec: Dict[str, Any], dimension: int,
+                training_vectors: Optional[np.ndarray] = None) -> faiss.Index:
+    """
+    Index vide (entraîné si nécessaire) acceptant add_with_ids(qa_pairs.uid).
+    flat/hnsw sont enveloppés dans IndexIDMap2 ; les IVF gèrent les ids nativement.
+    """
+    index_type = spec["type"]
+    sq_type = _SQ_TYPES.get(spec.get("storage", "fp32"))
+
+    if index_type == "flat":
+        base = faiss.IndexFlatL2(dimension) if sq_type is None else faiss.IndexScalarQuantizer(dimension, sq_type)
+    elif index_type == "hnsw":
+        base = (faiss.IndexHNSWFlat(dimension, spec["M"]) if sq_type is None
+                else faiss.IndexHNSWSQ(dimension, sq_type, spec["M"]))
+        base.hnsw.efConstruction = spec["efConstruction"]
+        base.hnsw.efSearch = spec["efSearch"]
+    else:
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_flat":
+            base = (faiss.IndexIVFFlat(quantizer, dimension, spec["nlist"]) if sq_type is None
+                    else faiss.IndexIVFScalarQuantizer(quantizer, dimension, spec["nlist"], sq_type))
+        elif index_type == "ivf_pq":
+            base = faiss.IndexIVFPQ(quantizer, dimension, spec["nlist"], spec["m"], spec["nbits"])
+        else:
+            raise ValueError(f"Unknown index type {index_type!r}")
+
+    if not base.is_trained:
+        if training_vectors is None or len(training_vectors) < spec.get("nlist", 1):
+            raise ValueError(f"{index_type} needs at least {spec.get('nlist', 1)} training vectors")
+        base.train(np.ascontiguousarray(training_vectors, dtype=np.float32))
+
+    if not index_type.startswith("ivf"):
+        return faiss.IndexIDMap2(base)
+    base.nprobe = spec["nprobe"]
+    # Table de hachage id -> position : reconstruct() et remove_ids() par qa_pairs.uid
+    base.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return base
+
+
+def read_index(path, spec: Optional[Dict[str, Any]] = None, mmap: bool = False) -> faiss.Index:
+    """
+    Lit un index ; avec mmap=True, les données restent dans le cache de pages de l'OS
+    (partagées entre processus, chargement quasi instantané, index en lecture seule).
+    """
+    if not mmap:
+        return faiss.read_index(str(path))
+    if spec and spec.get("type", "").startswith("ivf"):
+        io_flag = faiss.IO_FLAG_MMAP                                  # listes inversées sur disque
+    else:
+        io_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)  # codes des index flat
+    try:
+        return faiss.read_index(str(path), io_flag | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError as e:
+        logger.warning(f"Chargement mmap impossible ({e}), lecture complète en mémoire")
+        return faiss.read_index(str(path))
+
+
+def configure_search(index: faiss.Index, spec: Optional[Dict[str, Any]]) -> None:
+    """Réapplique les paramètres de recherche (efSearch, nprobe) d'une spécification à un index chargé."""
+    if not spec:
+        return
+    base = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    if spec["type"] == "hnsw" and isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = spec["efSearch"]
+    elif spec["type"].startswith("ivf"):
+        faiss.extract_index_ivf(index).nprobe = spec["nprobe"]
+
+
+def is_updatable(index: faiss.Index) -> bool:
+    """Index dont les ids sont des qa_pairs.uid (mise à jour incrémentale possible)."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return True
+    try:
+        faiss.extract_index_ivf(index)
+        return True
+    except RuntimeError:
+        return False
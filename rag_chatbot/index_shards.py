@@ -0,0 +1,95 @@
+"""
+INDEX PAR LOGICIEL ET ROUTAGE DES REQUÊTES
+En plus de l'index global (repli), chaque instantané contient un index par
+logiciel (shards/<clé>.faiss) avec les mêmes ids FAISS : les métadonnées et
+les tombstones restent communes. Une question qui mentionne un seul logiciel
+n'est comparée qu'aux entrées de ce logiciel.
+
+La clé d'un logiciel est son nom normalisé (casse, accents, espaces) ; le
+manifeste associe chaque clé à son nom d'origine, à son fichier et à sa
+spécification d'index (clé "shards").
+"""
+
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+import faiss
+
+SHARDS_DIR = "shards"
+
+
+@dataclass
+class Shard:
+    """Index d'un logiciel (ids FAISS = qa_pairs.uid, comme l'index global)."""
+    name: str
+    index: faiss.Index
+    spec: Dict[str, Any] = field(default_factory=lambda: {"type": "flat"})
+
+
+def sharding_enabled() -> bool:
+    """INDEX_SHARDS=0 désactive les index par logiciel (index global seul)."""
+    return os.getenv("INDEX_SHARDS", "1") not in ("0", "false", "no")
+
+
+def _fold(text: str) -> str:
+    """Minuscules sans accents, séparateurs réduits à un espace."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return re.sub(r"[\s_\-/.]+", " ", text).strip()
+
+
+def shard_key(logiciel: Optional[str]) -> Optional[str]:
+    """Clé du shard d'un logiciel (None si le logiciel n'est pas renseigné)."""
+    key = re.sub(r"[^a-z0-9]+", "-", _fold(logiciel or "")).strip("-")
+    return key or None
+
+
+def shard_file(key: str) -> str:
+    return f"{SHARDS_DIR}/{key}.faiss"
+
+
+def _camel_variants(name: str) -> List[str]:
+    """Nom en CamelCase écrit en plusieurs mots ("MariProject" -> "mari project")."""
+    words = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z0-9]+", name or "")
+    return [_fold(" ".join(words))] if len(words) > 1 else []
+
+
+class LogicielRouter:
+    """
+    Détecte le logiciel mentionné dans une question, parmi les logiciels de la base.
+    Correspondance sur mots entiers, insensible à la casse et aux accents, avec ou
+    sans séparateurs ("Mari Project" = "MariProject"). Plusieurs logiciels cités :
+    pas de routage (recherche globale).
+    """
+
+    def __init__(self, names: Dict[str, str]):
+        """
+        Args:
+            names: Clé de shard -> nom du logiciel (manifeste)
+        """
+        self._patterns = []
+        for key, name in names.items():
+            folded = _fold(name)
+            variants = {re.escape(folded), re.escape(folded.replace(" ", ""))}
+            variants |= {re.escape(v) for v in _camel_variants(name)}
+            pattern = re.compile(r"(?<![a-z0-9])(?:" + "|".join(sorted(variants, key=len, reverse=True)) + r")(?![a-z0-9])")
+            self._patterns.append((key, pattern))
+
+    def detect(self, query: str) -> Optional[str]:
+        """Clé du seul logiciel mentionné dans la question, sinon None."""
+        folded = _fold(query)
+        found = {key for key, pattern in self._patterns if pattern.search(folded)}
+        return found.pop() if len(found) == 1 else None
+
+
+def group_by_shard(logiciels: Iterable[Optional[str]]) -> Dict[str, List[int]]:
+    """Clé de shard -> positions des lignes correspondantes (lignes sans logiciel ignorées)."""
+    groups: Dict[str, List[int]] = {}
+    for position, logiciel in enumerate(logiciels):
+        key = shard_key(logiciel)
+        if key is not None:
+            groups.setdefault(key, []).append(position)
+    return groups
@@ -0,0 +1,464 @@
+"""
+INSTANTANÉS VERSIONNÉS DE L'INDEX
+Chaque construction écrit un répertoire complet (index, métadonnées, manifeste)
+puis bascule atomiquement le pointeur CURRENT :
+
+    db/index/
+        CURRENT                     -> "20251007T131824123456"
+        tombstones.npy              (partagé entre versions, voir tombstones.py)
+        leases/<version>.<pid>.<id> (version en cours de lecture : jamais supprimée)
+        versions/20251007T131824123456/
+            index.faiss
+            metadata.db             (métadonnées indexées par id FAISS, voir metadata_store.py)
+            manifest.json           (modèle, dimension, nombre, tailles et sommes de contrôle)
+            VERIFIED                (sommes de contrôle déjà vérifiées une fois, voir load())
+            shards/<logiciel>.faiss (optionnel : index par logiciel, voir index_shards.py)
+            lexical/*.npy           (optionnel : index BM25 probleme + solution, voir lexical_index.py)
+            vectors.f32             (optionnel : float32 alignés sur les métadonnées,
+                                     pour le re-classement exact des index compressés)
+
+Un lecteur ne voit donc jamais un couple index/métadonnées incohérent.
+Les anciennes versions (metadata.pkl) restent lisibles.
+
+Un lecteur (SemanticSearcher) pose un bail sur la version qu'il utilise : ses
+métadonnées SQLite sont ouvertes à la demande dans chaque thread et ses fichiers
+sont mappés en mémoire, la version doit donc survivre aux publications
+suivantes. Le nettoyage ne supprime ni une version sous bail (bail d'un
+processus disparu ignoré), ni une version remplacée depuis moins de
+`grace_period` secondes (lecteur entre la lecture de CURRENT et la pose du bail).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from index_factory import read_index
+from index_shards import Shard, shard_file
+from lexical_index import LexicalIndex, LexicalIndexWriter, lexical_enabled
+from metadata_store import METADATA_DB_FILE, InMemoryMetadata, MetadataStore, MetadataWriter
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.faiss"
+METADATA_FILE = "metadata.pkl"
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f32"
+VERIFIED_FILE = "VERIFIED"
+
+
+def file_checksum(path: Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 d'un fichier, lu par blocs."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_metadata(path: Path) -> List[Dict]:
+    """
+    Lit un fichier de métadonnées : une liste pickle, ou une suite de listes
+    écrites morceau par morceau pendant une construction en flux.
+    """
+    metadata: List[Dict] = []
+    with open(path, "rb") as f:
+        while True:
+            try:
+                metadata.extend(pickle.load(f))
+            except EOFError:
+                return metadata
+
+
+def _fsync_dir(path: Path) -> None:
+    """Force l'écriture de l'entrée de répertoire (rename durable) quand l'OS le permet."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class SnapshotStore:
+    """Écriture/lecture d'instantanés versionnés avec bascule atomique du pointeur CURRENT."""
+
+    def __init__(self, root: Path, keep: int = 3, grace_period: float = 60.0):
+        """
+        Args:
+            keep: Versions les plus récentes toujours conservées
+            grace_period: Âge minimal (s) d'une version avant suppression, bien au-delà
+                de l'intervalle de rechargement des lecteurs
+        """
+        self.root = Path(root)
+        self.versions_dir = self.root / "versions"
+        self.leases_dir = self.root / "leases"
+        self.current_file = self.root / "CURRENT"
+        self.tombstone_path = self.root / "tombstones.npy"
+        self.keep = keep
+        self.grace_period = grace_period
+
+    def version_dir(self, version: str) -> Path:
+        return self.versions_dir / version
+
+    def current_version(self) -> Optional[str]:
+        """Version pointée par CURRENT (None si aucun instantané n'a encore été publié)."""
+        try:
+            version = self.current_file.read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return None
+        return version or None
+
+    def read_manifest(self, version: str) -> Dict[str, Any]:
+        with open(self.version_dir(version) / MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def begin(self) -> "SnapshotWriter":
+        """Ouvre un instantané en préparation (métadonnées écrites au fil de l'eau)."""
+        version = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+        staging = self.versions_dir / f".{version}.tmp"
+        staging.mkdir()
+        return SnapshotWriter(self, version, staging)
+
+    def write(self, index: faiss.Index, metadata: List[Dict], model_name: str,
+              extra: Optional[Dict[str, Any]] = None, vectors: Optional[Iterable[np.ndarray]] = None,
+              shards: Optional[Dict[str, Shard]] = None) -> str:
+        """
+        Écrit un nouvel instantané complet puis le publie.
+
+        Args:
+            vectors: Blocs de vecteurs float32 exacts alignés sur metadata (re-classement exact)
+            shards: Index par logiciel (clé de shard -> Shard)
+
+        Returns:
+            Nom de la version publiée
+        """
+        writer = self.begin()
+        try:
+            writer.append_metadata(metadata)
+            for block in vectors or ():
+                writer.append_vectors(block)
+        except Exception:
+            writer.abort()
+            raise
+        return writer.commit(index, model_name, extra, shards=shards)
+
+    def _publish(self, version: str) -> None:
+        """Bascule atomique du pointeur CURRENT (os.replace)."""
+        tmp = self.root / "CURRENT.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.current_file)
+        _fsync_dir(self.root)
+
+    def acquire(self, version: str) -> Path:
+        """Pose un bail sur une version lue par ce processus ; à libérer avec release()."""
+        self.leases_dir.mkdir(parents=True, exist_ok=True)
+        lease = self.leases_dir / f"{version}.{os.getpid()}.{uuid.uuid4().hex}"
+        lease.touch()
+        return lease
+
+    @staticmethod
+    def release(lease: Optional[Path]) -> None:
+        if lease is not None:
+            try:
+                lease.unlink()
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _process_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            return True  # processus d'un autre utilisateur
+        return True
+
+    def leased_versions(self) -> set:
+        """Versions sous bail d'un processus vivant (les baux orphelins sont supprimés)."""
+        leased = set()
+        if not self.leases_dir.exists():
+            return leased
+        for lease in self.leases_dir.iterdir():
+            version, _, rest = lease.name.partition(".")
+            pid = rest.partition(".")[0]
+            if pid.isdigit() and not self._process_alive(int(pid)):
+                self.release(lease)
+                continue
+            leased.add(version)
+        return leased
+
+    def _prune(self) -> None:
+        """
+        Supprime les plus anciennes versions (les `keep` dernières restent lisibles),
+        sauf celles sous bail ou remplacées depuis moins de grace_period secondes.
+        """
+        current = self.current_version()
+        versions = sorted(p.name for p in self.versions_dir.iterdir()
+                          if p.is_dir() and not p.name.startswith("."))
+        candidates = [(old, successor) for old, successor in zip(versions[:-self.keep], versions[1:])
+                      if old != current]
+        if not candidates:
+            return
+        pinned = self.leased_versions()
+        now = time.time()
+        for old, successor in candidates:
+            # Remplacée depuis la publication de la version suivante (fin de son écriture)
+            superseded = self.version_dir(successor).stat().st_mtime
+            if old in pinned or now - superseded < self.grace_period:
+                continue
+            shutil.rmtree(self.version_dir(old), ignore_errors=True)
+
+    def verify(self, version: str, full: bool = True) -> bool:
+        """
+        Contrôle les fichiers d'une version par rapport au manifeste.
+
+        Args:
+            full: Recalcule les sommes de contrôle (lecture complète des fichiers) ;
+                  sinon compare seulement les tailles enregistrées (coût constant)
+        """
+        manifest = self.read_manifest(version)
+        folder = self.version_dir(version)
+        if not full:
+            return all((folder / name).exists() and (folder / name).stat().st_size == size
+                       for name, size in manifest.get("sizes", {}).items())
+        if not all(file_checksum(folder / name) == checksum
+                   for name, checksum in manifest.get("checksums", {}).items()):
+            return False
+        self._mark_verified(version)
+        return True
+
+    def is_verified(self, version: str) -> bool:
+        """Version dont les sommes de contrôle ont déjà été vérifiées (par ce processus ou un autre)."""
+        return (self.version_dir(version) / VERIFIED_FILE).exists()
+
+    def _mark_verified(self, version: str) -> None:
+        try:
+            (self.version_dir(version) / VERIFIED_FILE).write_text(datetime.now().isoformat(), encoding="utf-8")
+        except OSError as e:
+            # Instantané en lecture seule : la vérification complète sera refaite au prochain chargement
+            logger.warning(f"Vérification de {version} non enregistrée : {e}")
+
+    def load(self, version: str, verify: bool = True,
+             mmap: bool = False) -> Tuple[faiss.Index, Any, Dict[str, Any]]:
+        """
+        Charge index, métadonnées et manifeste d'une version (index mappé en mémoire si mmap).
+        Les métadonnées sont un MetadataStore lu à la demande (InMemoryMetadata pour
+        les anciennes versions). Sans verify, seules les tailles des fichiers sont contrôlées
+        si la version a déjà passé une vérification complète ; au premier chargement,
+        les sommes de contrôle sont recalculées une fois puis la vérification est enregistrée.
+        """
+        folder = self.version_dir(version)
+        manifest = self.read_manifest(version)
+        full = verify or not self.is_verified(version)
+        if full:
+            logger.info(f"Vérification des sommes de contrôle de l'instantané {version}")
+        if not self.verify(version, full=full):
+            raise ValueError(f"Checksum mismatch for snapshot {version}")
+
+        index = read_index(folder / INDEX_FILE, manifest.get("index_spec"), mmap=mmap)
+        if (folder / METADATA_DB_FILE).exists():
+            metadata = MetadataStore(folder)
+        else:
+            metadata = InMemoryMetadata(read_metadata(folder / METADATA_FILE))
+
+        if (index.ntotal != manifest["count"] or index.d != manifest["dimension"]
+                or len(metadata) != manifest["count"]):
+            raise ValueError(f"Snapshot {version} does not match its manifest")
+        return index, metadata, manifest
+
+    def load_current(self, verify: bool = True,
+                     mmap: bool = False) -> Optional[Tuple[str, faiss.Index, Any, Dict[str, Any]]]:
+        version = self.current_version()
+        if version is None:
+            return None
+        return (version, *self.load(version, verify=verify, mmap=mmap))
+
+    def load_shards(self, version: str, mmap: bool = False) -> Dict[str, Shard]:
+        """Index par logiciel d'une version (vide si elle n'en contient pas)."""
+        manifest = self.read_manifest(version)
+        folder = self.version_dir(version)
+        shards = {}
+        for key, entry in manifest.get("shards", {}).items():
+            index = read_index(folder / entry["file"], entry["index_spec"], mmap=mmap)
+            if index.ntotal != entry["count"]:
+                raise ValueError(f"Shard {key} of snapshot {version} does not match its manifest")
+            shards[key] = Shard(entry["name"], index, entry["index_spec"])
+        return shards
+
+    def load_lexical(self, version: str) -> Optional[LexicalIndex]:
+        """Index BM25 d'une version (None si elle n'en contient pas)."""
+        folder = self.version_dir(version)
+        if not LexicalIndex.exists(folder):
+            return None
+        lexical = LexicalIndex(folder)
+        if len(lexical) != self.read_manifest(version)["count"]:
+            raise ValueError(f"Lexical index of snapshot {version} does not match its manifest")
+        return lexical
+
+    def exact_vectors(self, version: str) -> Optional[np.ndarray]:
+        """Vecteurs float32 d'une version (np.memmap, ligne i = métadonnée i), s'ils ont été écrits."""
+        manifest = self.read_manifest(version)
+        path = self.version_dir(version) / VECTORS_FILE
+        if not path.exists():
+            return None
+        return np.memmap(path, dtype=np.float32, mode="r", shape=(manifest["count"], manifest["dimension"]))
+
+
+class SnapshotWriter:
+    """
+    Instantané en cours d'écriture : les métadonnées sont ajoutées par morceaux
+    (mémoire bornée), l'index est écrit et la version publiée par commit().
+    """
+
+    def __init__(self, store: SnapshotStore, version: str, staging: Path):
+        self.store = store
+        self.version = version
+        self.staging = staging
+        self.vector_count = 0
+        self._metadata = MetadataWriter(staging)
+        self._lexical = LexicalIndexWriter(staging) if lexical_enabled() else None
+        self._vectors_file = None
+
+    @property
+    def count(self) -> int:
+        return self._metadata.count
+
+    def append_metadata(self, records: List[Dict]) -> None:
+        self._metadata.append(records)
+        if self._lexical is not None:
+            self._lexical.append(records)
+
+    def append_vectors(self, vectors: np.ndarray) -> None:
+        """Vecteurs float32 exacts, dans le même ordre que les métadonnées."""
+        if self._vectors_file is None:
+            self._vectors_file = open(self.staging / VECTORS_FILE, "wb")
+        self._vectors_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self.vector_count += len(vectors)
+
+    def _close_files(self) -> None:
+        if self._vectors_file is not None:
+            self._vectors_file.close()
+
+    def abort(self) -> None:
+        self._metadata.abort()
+        self._close_files()
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+    def commit(self, index: faiss.Index, model_name: str, extra: Optional[Dict[str, Any]] = None,
+               shards: Optional[Dict[str, Shard]] = None) -> str:
+        """Écrit index (et index par logiciel), manifeste, renomme le répertoire puis bascule CURRENT."""
+        store, staging, version = self.store, self.staging, self.version
+        try:
+            self._metadata.close()
+            if self._lexical is not None:
+                self._lexical.close()
+            self._close_files()
+            if self.count != index.ntotal:
+                raise ValueError(f"Index/metadata mismatch: {index.ntotal} vectors vs {self.count} records")
+            if self._vectors_file is not None and self.vector_count != self.count:
+                raise ValueError(f"Exact vectors/metadata mismatch: {self.vector_count} vs {self.count}")
+            faiss.write_index(index, str(staging / INDEX_FILE))
+            files = [INDEX_FILE, METADATA_DB_FILE]
+            if self._vectors_file is not None:
+                files.append(VECTORS_FILE)
+            if self._lexical is not None:
+                files.extend(LexicalIndexWriter.files())
+            for key, shard in (shards or {}).items():
+                (staging / shard_file(key)).parent.mkdir(exist_ok=True)
+                faiss.write_index(shard.index, str(staging / shard_file(key)))
+                files.append(shard_file(key))
+
+            manifest = {
+                "version": version,
+                "created_at": datetime.now().isoformat(),
+                "model_name": model_name,
+                "dimension": index.d,
+                "count": index.ntotal,
+                "index_type": type(index).__name__,
+                "checksums": {name: file_checksum(staging / name) for name in files},
+                "sizes": {name: (staging / name).stat().st_size for name in files},
+                **(extra or {}),
+            }
+            if shards:
+                manifest["shards"] = {key: {"name": shard.name, "file": shard_file(key),
+                                            "count": shard.index.ntotal, "index_spec": shard.spec}
+                                      for key, shard in shards.items()}
+            with open(staging / MANIFEST_FILE, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.rename(staging, store.version_dir(version))
+            _fsync_dir(store.versions_dir)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        store._publish(version)
+        store._prune()
+        logger.info(f"Instantané {version} publié ({index.ntotal} vecteurs)")
+        return version
+
+
+class ReadWriteLock:
+    """
+    Verrou lecteurs/rédacteur : plusieurs recherches en parallèle, la bascule
+    d'index attend la fin des recherches en cours (priorité au rédacteur).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
@@ -0,0 +1,120 @@
+"""
+Format du fichier knowledge_base.jsonl.
+Le fichier est en ajout seul : chaque ligne est une entrée (ajout) ou une
+opération sur une entrée existante, identifiée par son uid :
+    {"op": "update", "uid": ..., "logiciel": ..., "probleme": ..., "solution": ...}
+    {"op": "delete", "uid": ...}
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+
+def fold_entry_operations(records: Iterable[Dict], keep_deleted: bool = False) -> List[Dict]:
+    """
+    Rejoue les opérations dans l'ordre du fichier et retourne l'état courant de
+    chaque entrée, dans l'ordre de création.
+
+    Args:
+        records: Lignes du fichier, déjà décodées
+        keep_deleted: Conserve les entrées supprimées sous la forme {"uid": ..., "deleted": True}
+                      (utile au pipeline pour propager la suppression)
+    """
+    entries: Dict[str, Dict] = {}
+    for position, record in enumerate(records):
+        op = record.get("op", "add")
+        uid = record.get("uid") or f"line-{position}"
+        fields = {k: v for k, v in record.items() if k != "op"}
+        if op == "delete":
+            entries[uid] = {"uid": uid, "deleted": True}
+        elif op == "update" and uid in entries and not entries[uid].get("deleted"):
+            entries[uid] = {**entries[uid], **fields}
+        else:
+            entries[uid] = fields
+    return [e for e in entries.values() if keep_deleted or not e.get("deleted")]
+
+
+class KnowledgeBaseTail:
+    """
+    Lecteur incrémental de knowledge_base.jsonl.
+    Mémorise le dernier octet traité et ne décode que la fin ajoutée depuis,
+    de sorte que le coût d'ingestion ne dépend que des nouvelles lignes.
+    """
+
+    def __init__(self, path: Path, offset_path: Optional[Path] = None):
+        self.path = Path(path)
+        self.offset_path = Path(offset_path) if offset_path else self.path.with_name(self.path.name + ".offset")
+        self.offset, self._inode = self._load_offset()
+        self._pending: Optional[Tuple[int, int]] = None
+
+    def _load_offset(self) -> Tuple[int, Optional[int]]:
+        try:
+            state = orjson.loads(self.offset_path.read_bytes())
+            return int(state["offset"]), state.get("inode")
+        except FileNotFoundError:
+            return 0, None
+        except Exception as e:
+            logger.warning(f"Offset illisible ({e}), relecture complète de {self.path}")
+            return 0, None
+
+    def _start_position(self, stat: os.stat_result) -> int:
+        """Repart du début si le fichier a été tronqué ou remplacé."""
+        if self._inode is not None and stat.st_ino != self._inode:
+            logger.info(f"{self.path} a été remplacé, relecture complète")
+            return 0
+        if stat.st_size < self.offset:
+            logger.info(f"{self.path} a été tronqué, relecture complète")
+            return 0
+        return self.offset
+
+    def has_new_data(self) -> bool:
+        """Test bon marché (un stat) utilisé par le mode surveillance."""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return False
+        return stat.st_size != self.offset or (self._inode is not None and stat.st_ino != self._inode)
+
+    def read_new(self) -> Iterator[Dict]:
+        """
+        Décode paresseusement les lignes complètes ajoutées depuis le dernier commit().
+        Une dernière ligne sans retour à la ligne (écriture en cours) est laissée pour le prochain passage.
+        """
+        stat = self.path.stat()
+        position = self._start_position(stat)
+        self._pending = (position, stat.st_ino)
+        with open(self.path, "rb") as f:
+            f.seek(position)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                position += len(line)
+                self._pending = (position, stat.st_ino)
+                if not line.strip():
+                    continue
+                try:
+                    yield orjson.loads(line)
+                except orjson.JSONDecodeError as e:
+                    logger.warning(f"Ligne ignorée (JSON invalide à l'octet {position - len(line)}): {e}")
+
+    def commit(self) -> None:
+        """Enregistre la position atteinte par le dernier read_new() (à appeler une fois les données stockées)."""
+        if self._pending is None:
+            return
+        self.offset, self._inode = self._pending
+        self._pending = None
+        self.offset_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.offset_path.with_name(self.offset_path.name + ".tmp")
+        tmp_path.write_bytes(orjson.dumps({"offset": self.offset, "inode": self._inode}))
+        os.replace(tmp_path, self.offset_path)
+
+    def reset(self) -> None:
+        """Oublie la position enregistrée : le prochain read_new() relit tout le fichier."""
+        self.offset, self._inode, self._pending = 0, None, None
+        self.offset_path.unlink(missing_ok=True)
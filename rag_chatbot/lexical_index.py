@@ -0,0 +1,191 @@
+"""
+INDEX LEXICAL BM25 (probleme + solution)
+Les embeddings MiniLM gomment les termes exacts (codes transaction "se38",
+erreurs "404", "JCO initialization failed", notes SAP...) : cet index inversé,
+écrit dans chaque instantané à côté de l'index FAISS, les retrouve tels quels.
+
+    lexical/
+        terms.npy       vocabulaire trié (recherche dichotomique)
+        offsets.npy     début des postings de chaque terme (len = termes + 1)
+        postings.npy    lignes des documents, regroupées par terme
+        tf.npy          fréquence du terme dans chaque document
+        doc_ids.npy     ligne -> id FAISS (qa_pairs.uid)
+        doc_len.npy     ligne -> nombre de tokens
+
+Les fichiers sont ouverts en np.memmap : rien n'est chargé au démarrage.
+"""
+
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+LEXICAL_DIR = "lexical"
+_FILES = ("terms", "offsets", "postings", "tf", "doc_ids", "doc_len")
+
+# Mots vides fréquents dans les questions du support (français + quelques mots anglais)
+STOPWORDS = frozenset("""
+a au aux avec ce ces cette dans de des du elle en et est il ils je la le les leur lors mais me mes mon
+ne nous on ou par pas pour qu que qui sa se ses son sur ta te tes ton tu un une vos votre vous y
+d l j n s c m t the of to in is and or
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[/_.][a-z0-9]+)*")
+
+
+def lexical_enabled() -> bool:
+    """LEXICAL_INDEX=0 désactive l'écriture de l'index BM25 dans les instantanés."""
+    return os.getenv("LEXICAL_INDEX", "1") not in ("0", "false", "no")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokens en minuscules sans accents ; les codes composés ("rdisp/keepalive",
+    "buffer_size", "f.13") sont gardés entiers en plus de leurs parties.
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    tokens = []
+    for match in _TOKEN.findall(text):
+        parts = re.split(r"[/_.]", match)
+        if len(parts) > 1:
+            tokens.append(match)
+        tokens.extend(p for p in parts if p and p not in STOPWORDS)
+    return tokens
+
+
+def document_text(record: Dict) -> str:
+    return f"{record.get('probleme') or ''} {record.get('solution') or ''}"
+
+
+class LexicalIndexWriter:
+    """Construction par morceaux (même ordre que les métadonnées de l'instantané)."""
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder) / LEXICAL_DIR
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._vocabulary: Dict[str, int] = {}
+        self._term_ids: List[np.ndarray] = []
+        self._rows: List[np.ndarray] = []
+        self._tf: List[np.ndarray] = []
+        self._doc_ids: List[int] = []
+        self._doc_len: List[int] = []
+
+    def append(self, records: Sequence[Dict]) -> None:
+        terms, rows, tfs = [], [], []
+        for record in records:
+            row = len(self._doc_ids)
+            tokens = tokenize(document_text(record))
+            counts: Dict[int, int] = {}
+            for token in tokens:
+                term = self._vocabulary.setdefault(token, len(self._vocabulary))
+                counts[term] = counts.get(term, 0) + 1
+            terms.extend(counts.keys())
+            tfs.extend(counts.values())
+            rows.extend([row] * len(counts))
+            self._doc_ids.append(record.get("id", row))
+            self._doc_len.append(len(tokens))
+        self._term_ids.append(np.array(terms, dtype=np.int32))
+        self._rows.append(np.array(rows, dtype=np.int32))
+        self._tf.append(np.array(tfs, dtype=np.float32))
+
+    def close(self) -> None:
+        """Trie les postings par terme (vocabulaire en ordre alphabétique) et écrit les fichiers."""
+        vocabulary = sorted(self._vocabulary, key=self._vocabulary.get)
+        terms = np.array(vocabulary, dtype=str) if vocabulary else np.zeros(0, dtype="<U1")
+        alphabetical = np.argsort(terms, kind="stable")
+        rank = np.empty_like(alphabetical)
+        rank[alphabetical] = np.arange(len(alphabetical))
+
+        term_ids = rank[np.concatenate(self._term_ids)] if self._term_ids else np.zeros(0, dtype=np.int64)
+        rows = np.concatenate(self._rows) if self._rows else np.zeros(0, dtype=np.int32)
+        tf = np.concatenate(self._tf) if self._tf else np.zeros(0, dtype=np.float32)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=offsets[1:])
+
+        arrays = {
+            "terms": terms[alphabetical],
+            "offsets": offsets,
+            "postings": rows[order],
+            "tf": tf[order],
+            "doc_ids": np.array(self._doc_ids, dtype=np.int64),
+            "doc_len": np.array(self._doc_len, dtype=np.float32),
+        }
+        for name, array in arrays.items():
+            np.save(self.folder / f"{name}.npy", array)
+
+    @staticmethod
+    def files() -> List[str]:
+        return [f"{LEXICAL_DIR}/{name}.npy" for name in _FILES]
+
+
+class LexicalIndex:
+    """Recherche BM25 sur l'index lexical d'un instantané (fichiers mappés en mémoire)."""
+
+    def __init__(self, folder: Path, k1: float = 1.2, b: float = 0.75):
+        folder = Path(folder) / LEXICAL_DIR
+        arrays = {name: np.load(folder / f"{name}.npy", mmap_mode="r") for name in _FILES}
+        self.terms = arrays["terms"]
+        self.offsets = arrays["offsets"]
+        self.postings = arrays["postings"]
+        self.tf = arrays["tf"]
+        self.doc_ids = arrays["doc_ids"]
+        self.doc_len = arrays["doc_len"]
+        self.k1, self.b = k1, b
+        self.count = len(self.doc_ids)
+        self._avg_len: Optional[float] = None
+
+    @staticmethod
+    def exists(folder: Path) -> bool:
+        return (Path(folder) / LEXICAL_DIR / "terms.npy").exists()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _term_range(self, token: str) -> Tuple[int, int]:
+        position = int(np.searchsorted(self.terms, token))
+        if position < len(self.terms) and self.terms[position] == token:
+            return int(self.offsets[position]), int(self.offsets[position + 1])
+        return 0, 0
+
+    def search(self, query: str, k: int,
+               allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k ids FAISS par score BM25 décroissant (documents sans aucun terme de la question exclus).
+
+        Args:
+            allowed: Bitmap des ids autorisés (filtres, voir search_filters) ; sans bitmap,
+                les tombstones sont à retirer par l'appelant
+        """
+        if self._avg_len is None:
+            self._avg_len = float(self.doc_len.mean()) if self.count else 1.0
+        rows, scores = [], []
+        for token in set(tokenize(query)):
+            start, end = self._term_range(token)
+            if start == end:
+                continue
+            posting_rows = np.asarray(self.postings[start:end])
+            tf = np.asarray(self.tf[start:end])
+            idf = np.log(1.0 + (self.count - (end - start) + 0.5) / ((end - start) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_len[posting_rows]) / self._avg_len)
+            rows.append(posting_rows)
+            scores.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        rows, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores)).astype(np.float32)
+        ids = np.asarray(self.doc_ids[rows])
+        if allowed is not None:
+            inside = ids // 8 < len(allowed)
+            keep = inside & ((allowed[np.where(inside, ids // 8, 0)] >> (ids % 8)) & 1 == 1)
+            ids, totals = ids[keep], totals[keep]
+        if len(ids) > k:
+            top = np.argpartition(-totals, k)[:k]
+            ids, totals = ids[top], totals[top]
+        order = np.argsort(-totals, kind="stable")
+        return ids[order], totals[order]
@@ -0,0 +1,241 @@
+"""
+MÉTADONNÉES D'INDEX EN ACCÈS DIRECT
+Remplace la liste pickle chargée en entier au démarrage :
+
+    metadata.db     table SQLite (id FAISS = clé primaire, ligne, uid, logiciel, probleme, solution,
+                    type_probleme, created_at ; index sur les champs filtrables)
+
+Rien n'est lu à l'ouverture : une recherche ne charge que les quelques lignes
+renvoyées par FAISS (recherche O(1) par clé primaire). Les fichiers d'un
+instantané ne changent plus une fois publiés, ils sont donc ouverts en
+lecture seule, sans verrou (immutable=1).
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+METADATA_DB_FILE = "metadata.db"
+FIELDS = ("uid", "logiciel", "probleme", "solution")
+# Champs de filtrage (absents des instantanés antérieurs)
+FILTER_FIELDS = ("type_probleme", "created_at")
+
+# Limite prudente du nombre de paramètres d'une requête SQLite
+_MAX_VARIABLES = 500
+
+
+class MetadataWriter:
+    """Écriture par morceaux des métadonnées d'un instantané en préparation."""
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+        self.count = 0
+        self._conn = sqlite3.connect(self.folder / METADATA_DB_FILE)
+        # Fichier de préparation : durabilité assurée par le fsync/rename de l'instantané
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute('''
+            CREATE TABLE metadata (
+                id INTEGER PRIMARY KEY,
+                row INTEGER NOT NULL,
+                uid INTEGER,
+                logiciel TEXT,
+                probleme TEXT,
+                solution TEXT,
+                type_probleme TEXT,
+                created_at TEXT
+            )
+        ''')
+        self._conn.execute("CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def append(self, records: Sequence[Dict]) -> None:
+        if not records:
+            return
+        self._conn.executemany(
+            "INSERT INTO metadata (id, row, uid, logiciel, probleme, solution, type_probleme, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((m.get("id", self.count + i), self.count + i, *(m.get(field) for field in FIELDS + FILTER_FIELDS))
+             for i, m in enumerate(records)),
+        )
+        self.count += len(records)
+
+    def close(self) -> None:
+        # Index créés après le chargement (plus rapide qu'une mise à jour ligne par ligne)
+        for column in ("logiciel",) + FILTER_FIELDS:
+            self._conn.execute(f"CREATE INDEX idx_metadata_{column} ON metadata({column})")
+        self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('count', ?)", (str(self.count),))
+        self._conn.commit()
+        self._conn.close()
+
+    def abort(self) -> None:
+        self._conn.close()
+
+
+class MetadataStore:
+    """Lecture paresseuse des métadonnées d'un instantané (thread-safe, une connexion par thread)."""
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+        self.path = self.folder / METADATA_DB_FILE
+        if not self.path.exists():
+            raise FileNotFoundError(f"No metadata store in {self.folder}")
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self.count = int(self._connection().execute(
+            "SELECT value FROM info WHERE key = 'count'").fetchone()[0])
+        columns = {row["name"] for row in self._connection().execute("PRAGMA table_info(metadata)")}
+        self.fields = FIELDS + tuple(f for f in FILTER_FIELDS if f in columns)
+        self._columns = ", ".join(("id",) + self.fields)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """Ferme les connexions de tous les threads (version remplacée, plus aucune lecture)."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _record(self, row: sqlite3.Row) -> Dict:
+        return {"id": row["id"], **{field: row[field] for field in self.fields}}
+
+    def _select(self, columns: str, ids: Iterable[int]) -> Iterator[sqlite3.Row]:
+        """Lignes dont l'id figure dans ids (requêtes par paquets de _MAX_VARIABLES)."""
+        ids = [int(i) for i in ids]
+        conn = self._connection()
+        for start in range(0, len(ids), _MAX_VARIABLES):
+            batch = ids[start:start + _MAX_VARIABLES]
+            yield from conn.execute(
+                f"SELECT {columns} FROM metadata WHERE id IN ({','.join('?' * len(batch))})", batch)
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, Dict]:
+        """id -> métadonnées pour les ids présents (les autres sont ignorés)."""
+        return {row["id"]: self._record(row) for row in self._select(self._columns, ids)}
+
+    def get(self, id_: int) -> Optional[Dict]:
+        return self.get_many([id_]).get(int(id_))
+
+    def rows(self, ids: Sequence[int]) -> np.ndarray:
+        """Position de chaque id dans l'ordre des lignes (alignée sur les vecteurs exacts)."""
+        found = {row["id"]: row["row"] for row in self._select("id, row", ids)}
+        return np.array([found[int(i)] for i in ids], dtype=np.int64)
+
+    def count_present(self, ids: Iterable[int]) -> int:
+        """Nombre d'ids présents dans l'instantané (ex. tombstones encore indexés)."""
+        return sum(1 for _ in self._select("id", ids))
+
+    def iter_records(self, chunk_size: int = 10000) -> Iterator[List[Dict]]:
+        """Métadonnées dans l'ordre des lignes, par paquets."""
+        cursor = self._connection().execute(f"SELECT {self._columns} FROM metadata ORDER BY row")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [self._record(row) for row in rows]
+
+    def filter_ids(self, logiciels: Optional[Sequence[str]] = None, types: Optional[Sequence[str]] = None,
+                   created_after: Optional[str] = None, created_before: Optional[str] = None) -> np.ndarray:
+        """
+        ids FAISS des entrées qui vérifient toutes les conditions données (requête sur index).
+
+        Args:
+            logiciels, types: Valeurs acceptées (telles qu'enregistrées)
+            created_after, created_before: Bornes ISO de created_at (incluse / exclue)
+        """
+        if (types is not None or created_after or created_before) and self.fields == FIELDS:
+            raise ValueError(f"Snapshot {self.folder.name} has no {FILTER_FIELDS} metadata, rebuild the index")
+        clauses, params = [], []
+        for column, values in (("logiciel", logiciels), ("type_probleme", types)):
+            if values is not None:
+                clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+                params.extend(values)
+        if created_after:
+            clauses.append("created_at >= ?")
+            params.append(created_after)
+        if created_before:
+            clauses.append("created_at < ?")
+            params.append(created_before)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connection().execute(f"SELECT id FROM metadata{where}", params)
+        return np.fromiter((row[0] for row in rows), dtype=np.int64)
+
+    def distinct(self, column: str) -> List[str]:
+        """Valeurs distinctes d'un champ filtrable."""
+        if column not in ("logiciel",) + FILTER_FIELDS:
+            raise ValueError(f"Unknown filter field {column!r}")
+        return [row[0] for row in self._connection().execute(
+            f"SELECT DISTINCT {column} FROM metadata WHERE {column} IS NOT NULL")]
+
+    def head(self, n: int = 5) -> List[Dict]:
+        rows = self._connection().execute(
+            f"SELECT {self._columns} FROM metadata ORDER BY row LIMIT ?", (n,))
+        return [self._record(row) for row in rows]
+
+    def to_list(self) -> List[Dict]:
+        return [record for chunk in self.iter_records() for record in chunk]
+
+
+class InMemoryMetadata:
+    """Même interface que MetadataStore pour les anciennes listes pickle (db/metadata.pkl)."""
+
+    def __init__(self, records: List[Dict]):
+        if not all(isinstance(m, dict) and set(FIELDS) <= m.keys() for m in records):
+            raise ValueError("Invalid metadata format")
+        # Ancien index plat : l'id FAISS est la position
+        self._records = [{**m, "id": m.get("id", i)} for i, m in enumerate(records)]
+        self._by_id = {m["id"]: m for m in self._records}
+        self._rows = {m["id"]: i for i, m in enumerate(self._records)}
+        self.count = len(self._records)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        pass
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, Dict]:
+        return {int(i): self._by_id[int(i)] for i in ids if int(i) in self._by_id}
+
+    def get(self, id_: int) -> Optional[Dict]:
+        return self._by_id.get(int(id_))
+
+    def rows(self, ids: Sequence[int]) -> np.ndarray:
+        return np.array([self._rows[int(i)] for i in ids], dtype=np.int64)
+
+    def count_present(self, ids: Iterable[int]) -> int:
+        return sum(1 for i in ids if int(i) in self._by_id)
+
+    def iter_records(self, chunk_size: int = 10000) -> Iterator[List[Dict]]:
+        for start in range(0, self.count, chunk_size):
+            yield self._records[start:start + chunk_size]
+
+    def filter_ids(self, logiciels: Optional[Sequence[str]] = None, types: Optional[Sequence[str]] = None,
+                   created_after: Optional[str] = None, created_before: Optional[str] = None) -> np.ndarray:
+        if types is not None or created_after or created_before:
+            raise ValueError(f"Legacy metadata has no {FILTER_FIELDS} fields, rebuild the index")
+        return np.array([m["id"] for m in self._records if logiciels is None or m["logiciel"] in logiciels],
+                        dtype=np.int64)
+
+    def distinct(self, column: str) -> List[str]:
+        return sorted({m[column] for m in self._records if m.get(column) is not None})
+
+    def head(self, n: int = 5) -> List[Dict]:
+        return self._records[:n]
+
+    def to_list(self) -> List[Dict]:
+        return list(self._records)
@@ -0,0 +1,139 @@
+"""
+CACHE LRU DES EMBEDDINGS DE REQUÊTES
+Les questions fréquentes du support ("erreur connexion agirh"...) ne repassent
+pas par le modèle : l'embedding est gardé en mémoire, indexé par le texte
+normalisé de la question, dans la limite de max_entries (les moins récemment
+utilisées sont évincées). Le cache est propre à un modèle/backend (cache_key).
+
+Optionnellement sauvegardé dans un fichier .npz (écriture atomique) et rechargé
+au démarrage ; un fichier écrit pour un autre modèle est ignoré.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+EncodeFn = Callable[[List[str]], np.ndarray]
+
+
+class QueryEmbeddingCache:
+    """Cache LRU borné (thread-safe) des embeddings de requêtes pour un modèle donné."""
+
+    def __init__(self, model_key: str, max_entries: int = 10000, path: Optional[Path] = None,
+                 save_interval: float = 60.0):
+        """
+        Args:
+            model_key: Modèle et backend des vecteurs (embedding_backend.cache_key)
+            path: Fichier .npz de persistance (None = mémoire seulement)
+            save_interval: Délai minimal (s) entre deux sauvegardes après de nouvelles entrées
+        """
+        self.model_key = model_key
+        self.max_entries = max_entries
+        self.path = Path(path) if path else None
+        self.save_interval = save_interval
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        if self.path is not None:
+            self._load()
+            atexit.register(self.save)
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model_key"]) != self.model_key:
+                    logger.info(f"Cache de requêtes {self.path} écrit pour {data['model_key']}, ignoré")
+                    return
+                # Les plus récemment utilisées en dernier : on garde la fin si max_entries a diminué
+                keys, vectors = data["keys"][-self.max_entries:], data["vectors"][-self.max_entries:]
+                for key, vector in zip(keys.tolist(), vectors):
+                    self._entries[key] = vector
+        except Exception as e:
+            logger.warning(f"Cache de requêtes illisible ({e}), repart à vide")
+            self._entries.clear()
+            return
+        logger.info(f"{len(self._entries)} embeddings de requêtes rechargés depuis {self.path}")
+
+    def save(self) -> None:
+        """Écrit le cache sur disque (du moins au plus récemment utilisé)."""
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            keys = np.array(list(self._entries.keys()), dtype=str)
+            vectors = (np.stack(list(self._entries.values())) if self._entries
+                       else np.zeros((0, 0), dtype=np.float32))
+            self._dirty = False
+            self._last_save = time.monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp.npz")
+        try:
+            np.savez(tmp, model_key=np.array(self.model_key), keys=keys, vectors=vectors)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Sauvegarde du cache de requêtes impossible: {e}")
+
+    def encode(self, queries: Sequence[str], encode_fn: EncodeFn) -> np.ndarray:
+        """
+        Embeddings des requêtes ; seules les absentes du cache passent par encode_fn
+        (en un seul appel, sans doublons).
+        """
+        queries = list(queries)
+        keys = [normalize_text(q) for q in queries]
+        found: Dict[int, np.ndarray] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[i] = vector
+            self.hits += len(found)
+            self.misses += len(queries) - len(found)
+
+        missing: "OrderedDict[str, List[int]]" = OrderedDict()
+        for i, key in enumerate(keys):
+            if i not in found:
+                missing.setdefault(key, []).append(i)
+        if missing:
+            encoded = np.asarray(encode_fn([queries[positions[0]] for positions in missing.values()]),
+                                 dtype=np.float32)
+            with self._lock:
+                for key, positions, vector in zip(missing.keys(), missing.values(), encoded):
+                    self._entries[key] = vector
+                    self._entries.move_to_end(key)
+                    for i in positions:
+                        found[i] = vector
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self._dirty = True
+            if self.path is not None and time.monotonic() - self._last_save >= self.save_interval:
+                self.save()
+
+        return np.stack([found[i] for i in range(len(queries))]) if queries else np.zeros((0, 0), dtype=np.float32)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits,
+                "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,134 @@
+"""
+RE-CLASSEMENT PAR CROSS-ENCODER (optionnel)
+La recherche renvoie N candidats classés par distance L2 ; un petit
+cross-encoder CPU note chaque paire (question, problème + solution) et seuls
+les k meilleurs sont transmis au générateur : moins de sources, mieux choisies,
+donc un prompt plus court.
+
+Le re-classement a un budget de latence strict : les paires sont notées par
+petits lots et, si le budget est (ou serait) dépassé, l'ordre d'origine est
+conservé. Les scores (question normalisée, uid) sont gardés dans un cache LRU :
+une question répétée ne repasse pas par le modèle.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Multilingue (la base est en français), 384 dimensions : quelques ms par paire sur CPU
+DEFAULT_RERANKER = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+
+def load_cross_encoder(model_name: str, max_length: int = 256):
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name, device="cpu", max_length=max_length)
+
+
+class CrossEncoderReranker:
+    """Re-classement budgété des résultats de SemanticSearcher (thread-safe)."""
+
+    def __init__(self, model_name: str = DEFAULT_RERANKER, budget_ms: float = 150.0,
+                 batch_size: int = 8, cache_size: int = 50000):
+        """
+        Args:
+            budget_ms: Temps maximal de notation par question ; au-delà, ordre d'origine
+            batch_size: Paires notées par appel au modèle (granularité du contrôle du budget)
+            cache_size: Nombre maximal de scores (question, uid) gardés en mémoire
+        """
+        self.model_name = model_name
+        self.budget = budget_ms / 1000
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        # Chargé ici : le premier appel ne doit pas consommer le budget
+        self.model = load_cross_encoder(model_name)
+        self._scores: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.over_budget = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        logger.info(f"Cross-encoder {model_name} chargé (budget {budget_ms:.0f} ms)")
+
+    @staticmethod
+    def _passage(result) -> str:
+        return f"{result.probleme}\n{result.solution}"
+
+    def _cached(self, key: str, uids: Sequence[int]) -> Dict[int, float]:
+        found = {}
+        with self._lock:
+            for uid in uids:
+                score = self._scores.get((key, uid))
+                if score is not None:
+                    self._scores.move_to_end((key, uid))
+                    found[uid] = score
+            self.cache_hits += len(found)
+            self.cache_misses += len(uids) - len(found)
+        return found
+
+    def _store(self, key: str, scores: Dict[int, float]) -> None:
+        with self._lock:
+            for uid, score in scores.items():
+                self._scores[(key, uid)] = score
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    def score(self, query: str, results: Sequence, deadline: Optional[float] = None) -> Optional[Dict[int, float]]:
+        """
+        uid -> score de pertinence des résultats, None si le budget est dépassé
+        (les scores déjà calculés sont tout de même mis en cache).
+        """
+        key = normalize_text(query)
+        scores = self._cached(key, [r.uid for r in results])
+        pending = [r for r in results if r.uid not in scores]
+        computed: Dict[int, float] = {}
+        try:
+            last_batch = 0.0
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                # Lot suivant estimé au coût du précédent : on s'arrête avant de dépasser
+                if deadline is not None and time.perf_counter() + last_batch > deadline:
+                    return None
+                batch_start = time.perf_counter()
+                values = self.model.predict([(query, self._passage(r)) for r in batch],
+                                            batch_size=self.batch_size, show_progress_bar=False)
+                last_batch = time.perf_counter() - batch_start
+                computed.update(zip((r.uid for r in batch), np.asarray(values, dtype=np.float32).tolist()))
+        finally:
+            self._store(key, computed)
+        scores.update(computed)
+        return scores
+
+    def rerank(self, query: str, results: List, k: int) -> Tuple[List, bool]:
+        """
+        Les k meilleurs résultats selon le cross-encoder.
+
+        Returns:
+            (résultats, re-classés) ; en cas de dépassement du budget, les k premiers
+            dans l'ordre de la recherche et False
+        """
+        if len(results) <= 1:
+            return list(results[:k]), False
+        with self._lock:
+            self.calls += 1
+        scores = self.score(query, results, deadline=time.perf_counter() + self.budget)
+        if scores is None:
+            with self._lock:
+                self.over_budget += 1
+            logger.info(f"Budget de re-classement dépassé ({self.budget * 1000:.0f} ms), ordre de la recherche conservé")
+            return list(results[:k]), False
+        # Tri stable : à score égal, l'ordre de la recherche départage
+        ranked = sorted(results, key=lambda r: -scores[r.uid])
+        return ranked[:k], True
+
+    def stats(self) -> Dict[str, float]:
+        total = self.cache_hits + self.cache_misses
+        return {"calls": self.calls, "over_budget": self.over_budget, "cached_scores": len(self._scores),
+                "cache_hit_rate": self.cache_hits / total if total else 0.0}
@@ -0,0 +1,238 @@
+"""
+SERVICE DE RECHERCHE LOCAL (partagé par les interfaces)
+Un seul processus charge le modèle d'embeddings et l'index ; les interfaces
+Streamlit (client, admin, app) l'interrogent en HTTP sur localhost via
+RemoteSearcher, qui expose la même interface que SemanticSearcher. Une seule
+copie du modèle en mémoire, et un redémarrage des interfaces ne recharge rien.
+
+    GET  /health   {"ready": bool, "version": ..., "startup": {...}}
+    POST /search   {"queries": [...], "k": 3, "logiciel": null, "filters": null}
+                   -> {"results": [[{uid, logiciel, probleme, solution, distance}, ...], ...]}
+
+Lancement :
+    python retrieval_server.py --port 8765
+puis RETRIEVAL_SERVER_URL=http://127.0.0.1:8765 (ou "server_url" dans la
+configuration du retriever) pour les interfaces.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from retriever import SearchResult, SemanticSearcher
+from thread_budget import apply_thread_budget, limit_current_thread
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+def _result_dict(result: SearchResult) -> Dict[str, Any]:
+    data = asdict(result)
+    # JSON n'a pas d'infini : distance inconnue -> null
+    data["distance"] = data["distance"] if math.isfinite(data["distance"]) else None
+    return data
+
+
+class RetrievalRequestHandler(BaseHTTPRequestHandler):
+    """Requêtes JSON vers le SemanticSearcher du serveur (un thread par connexion)."""
+
+    server_version = "RetrievalServer/1.0"
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        searcher: SemanticSearcher = self.server.searcher
+        if self.path != "/health":
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+        self._send(200, {"ready": searcher.is_ready, "version": searcher.version,
+                         "startup": searcher.startup_stats})
+
+    def do_POST(self):
+        limit_current_thread()  # un thread par connexion : budget OpenMP à appliquer ici
+        searcher: SemanticSearcher = self.server.searcher
+        if self.path != "/search":
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            queries = request["queries"]
+            if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+                raise ValueError("'queries' must be a list of strings")
+        except (KeyError, ValueError) as e:
+            self._send(400, {"error": f"Invalid request: {e}"})
+            return
+        try:
+            # Au plus `workers` recherches simultanées : les autres connexions attendent
+            # leur tour au lieu de se disputer les cœurs
+            with self.server.search_slots:
+                results = searcher.search_batch(queries, k=int(request.get("k", 3)),
+                                                logiciel=request.get("logiciel"),
+                                                filters=request.get("filters"))
+        except ValueError as e:
+            self._send(400, {"error": str(e)})  # filtre inconnu, etc.
+            return
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+            return
+        self._send(200, {"results": [[_result_dict(r) for r in row] for row in results]})
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class RetrievalServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, searcher: SemanticSearcher, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 workers: int = 4):
+        super().__init__((host, port), RetrievalRequestHandler)
+        self.searcher = searcher
+        self.search_slots = threading.BoundedSemaphore(workers)
+
+
+class RemoteSearcher:
+    """
+    Client léger du service de recherche : même interface que SemanticSearcher
+    (search, search_batch, is_ready, wait_ready, startup_stats), sans modèle ni index.
+    """
+
+    def __init__(self, url: str, timeout: float = 30.0, max_workers: int = 16):
+        """
+        Args:
+            url: Adresse du service (ex. http://127.0.0.1:8765)
+            timeout: Délai maximal (s) d'une requête
+            max_workers: Requêtes HTTP simultanées de asearch / asearch_batch (attente réseau)
+        """
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="remote-search")
+
+    def _request(self, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(f"{self.url}{path}", data=data,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", str(e))
+            except ValueError:
+                message = str(e)
+            # Même type d'erreur que la recherche locale pour une requête invalide
+            raise (ValueError if e.code == 400 else RuntimeError)(message) from e
+
+    def health(self) -> Dict[str, Any]:
+        return self._request("/health")
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.health().get("version")
+
+    @property
+    def is_ready(self) -> bool:
+        try:
+            return bool(self.health().get("ready"))
+        except OSError:
+            return False
+
+    @property
+    def startup_stats(self) -> Dict[str, Any]:
+        return {**self.health().get("startup", {}), "server": self.url}
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        # Le serveur attend lui-même la fin de son démarrage avant de répondre
+        return self.is_ready
+
+    def search_batch(self, queries: List[str], k: int = 3, logiciel: Optional[str] = None,
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[SearchResult]]:
+        if not queries:
+            return []
+        response = self._request("/search", {"queries": list(queries), "k": k,
+                                             "logiciel": logiciel, "filters": filters})
+        return [
+            [SearchResult(**{**r, "distance": r["distance"] if r["distance"] is not None else math.inf})
+             for r in row]
+            for row in response["results"]
+        ]
+
+    def search(self, query: str, k: int = 3, logiciel: Optional[str] = None,
+               filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        return self.search_batch([query], k=k, logiciel=logiciel, filters=filters)[0]
+
+    async def asearch_batch(self, queries: List[str], k: int = 3, logiciel: Optional[str] = None,
+                            filters: Optional[Dict[str, Any]] = None) -> List[List[SearchResult]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor,
+                                          lambda: self.search_batch(queries, k=k, logiciel=logiciel, filters=filters))
+
+    async def asearch(self, query: str, k: int = 3, logiciel: Optional[str] = None,
+                      filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        return (await self.asearch_batch([query], k=k, logiciel=logiciel, filters=filters))[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service de recherche local partagé par les interfaces")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default=None, help="torch, onnx ou onnx-int8")
+    parser.add_argument("--snapshot-dir", default="db/index")
+    parser.add_argument("--embedding-cache-dir", default="db/embedding_cache")
+    parser.add_argument("--query-cache-path", default="db/query_cache.npz")
+    parser.add_argument("--no-mmap", action="store_true", help="Charge l'index en mémoire au lieu de le mapper")
+    parser.add_argument("--no-hybrid", action="store_true", help="Recherche vectorielle seule (sans BM25)")
+    parser.add_argument("--warmup-queries", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Recherches simultanées ; les cœurs sont répartis entre elles")
+    args = parser.parse_args()
+
+    # Avant le chargement du modèle : torch / BLAS lisent leur nombre de threads à l'import
+    budget = apply_thread_budget(args.workers)
+
+    # Chargement en arrière-plan : /health répond pendant le démarrage
+    searcher = SemanticSearcher(
+        args.model, "db/faiss_index.index", "db/metadata.pkl",
+        snapshot_dir=args.snapshot_dir,
+        embedding_cache_dir=args.embedding_cache_dir,
+        embedding_backend=args.backend,
+        mmap_index=not args.no_mmap,
+        query_cache_path=args.query_cache_path,
+        hybrid=not args.no_hybrid,
+        background_load=True,
+        warmup_queries=args.warmup_queries,
+        search_workers=budget.workers,
+        encoder_threads=budget.threads_per_worker,
+    )
+    server = RetrievalServer(searcher, args.host, args.port, workers=budget.workers)
+    logger.info(f"Service de recherche sur http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if searcher.query_cache is not None:
+            searcher.query_cache.save()
+
+
+if __name__ == "__main__":
+    main()
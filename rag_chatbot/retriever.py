@@ -1,12 +1,26 @@
+import asyncio
 import faiss
 import numpy as np
-import torch
-from sentence_transformers import SentenceTransformer
 import pickle
-from typing import List
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 from dataclasses import dataclass
 from pathlib import Path
 import logging
+from tombstones import TombstoneBitmap, tombstone_path_for
+from index_snapshots import ReadWriteLock, SnapshotStore
+from embedding_cache import EmbeddingCache
+from query_cache import QueryEmbeddingCache
+from embedding_backend import cache_key, get_backend, load_encoder
+from embedding_scheduler import encode_bucketed
+from index_factory import configure_search, read_index
+from metadata_store import InMemoryMetadata
+from index_shards import LogicielRouter, Shard, shard_key
+from lexical_index import LexicalIndex
+from search_filters import FilterBitmaps, normalize_filters, search_parameters
+from thread_budget import limit_current_thread
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,56 +34,530 @@ class SearchResult:
     distance: float
 
 class SemanticSearcher:
-    def __init__(self, model_name: str, index_path: str, metadata_path: str):
-        self.model = SentenceTransformer(model_name, device='cuda' if torch.cuda.is_available() else 'cpu')
+    def __init__(self, model_name: str, index_path: str, metadata_path: str,
+                 snapshot_dir: Optional[str] = None, reload_interval: float = 2.0,
+                 embedding_cache_dir: Optional[str] = None, embedding_backend: Optional[str] = None,
+                 mmap_index: bool = False, rerank_factor: int = 4, route_by_logiciel: bool = True,
+                 fallback_distance: float = 1.0, query_cache_size: int = 10000,
+                 query_cache_path: Optional[str] = None, hybrid: bool = True, rrf_k: int = 60,
+                 hybrid_candidates: int = 50, background_load: bool = False,
+                 warmup_queries: Union[int, Sequence[str]] = 8, startup_timeout: Optional[float] = None,
+                 search_workers: int = 4, encoder_threads: Optional[int] = None):
+        """
+        Args:
+            model_name: Sentence-transformers model used to encode queries
+            embedding_backend: "torch", "onnx" or "onnx-int8" (EMBEDDING_BACKEND, torch by default);
+                ONNX backends produce vectors compatible with an index built in fp32
+            index_path, metadata_path: Legacy single-file index (used when no snapshot is published)
+            snapshot_dir: Versioned snapshot root written by DocumentEmbedder; new versions are hot-swapped
+            reload_interval: Minimum delay (s) between two checks of the snapshot CURRENT pointer
+            embedding_cache_dir: Embedding cache shared with DocumentEmbedder (queries matching a KB text skip the model)
+            mmap_index: Memory-map the index (pages shared between processes through the OS cache,
+                near-instant startup)
+            rerank_factor: Shortlist size multiplier for exact re-scoring of compressed indexes (fp16/sq8/pq)
+            route_by_logiciel: Search only the shard of the software named in the query, when the snapshot has one
+            fallback_distance: Routed results whose best L2 distance exceeds this (or fewer than k results)
+                fall back to the global index
+            query_cache_size: In-memory LRU of query embeddings (0 disables it); repeated queries skip the model
+            query_cache_path: Optional .npz file persisting that LRU across restarts
+            hybrid: Also run a BM25 search (exact terms: transaction codes, error messages) on the
+                snapshot's lexical index, concurrently with the query encoding, and merge both rankings
+                by reciprocal-rank fusion (no effect on snapshots without a lexical index)
+            rrf_k: Fusion constant: an entry scores sum(1 / (rrf_k + rank)) over both rankings
+            hybrid_candidates: Depth of each ranking fed to the fusion
+            background_load: Load the model and the index in a background thread and return at once
+                (the UI renders meanwhile); searches wait until startup is complete
+            warmup_queries: Queries encoded and searched before reporting ready (tokenizer, inference
+                and index pages warmed up), or how many knowledge-base problems to use (0 disables it)
+            startup_timeout: Maximum wait (s) of a search for a background startup (None = no limit)
+            search_workers: Size of the bounded executor behind asearch / asearch_batch (concurrent searches)
+            encoder_threads: Inference threads of ONNX encoders (see thread_budget; torch uses its global setting)
+        """
+        self.model_name = model_name
+        self.backend = get_backend(embedding_backend)
+        self.model = None
         self.index_path = Path(index_path)
         self.metadata_path = Path(metadata_path)
-        self._load_resources()
+        self.snapshots = SnapshotStore(Path(snapshot_dir)) if snapshot_dir else None
+        self.reload_interval = reload_interval
+        self.mmap_index = mmap_index
+        self.rerank_factor = rerank_factor
+        self.route_by_logiciel = route_by_logiciel
+        self.fallback_distance = fallback_distance
+        self.hybrid = hybrid
+        self.rrf_k = rrf_k
+        self.hybrid_candidates = hybrid_candidates
+        # One BM25 ranking per concurrent search, so searches never queue behind each other's BM25
+        self._lexical_pool = (ThreadPoolExecutor(max_workers=max(2, search_workers), thread_name_prefix="bm25",
+                                                 initializer=limit_current_thread)
+                              if hybrid else None)
+        # Au-delà, un filtre trop peu sélectif n'a pas besoin du repli exhaustif
+        self.exact_filter_limit = 100_000
+        self.embedding_cache = (EmbeddingCache(Path(embedding_cache_dir), cache_key(model_name, self.backend))
+                                if embedding_cache_dir else None)
+        self.query_cache = (QueryEmbeddingCache(cache_key(model_name, self.backend), query_cache_size,
+                                                Path(query_cache_path) if query_cache_path else None)
+                            if query_cache_size > 0 else None)
+        self.version: Optional[str] = None
+        self.metadata = None
+        # Bail sur la version chargée : le nettoyage des instantanés ne la supprime pas
+        self._lease: Optional[Path] = None
+        self._lock = ReadWriteLock()
+        self._reload_lock = threading.Lock()
+        self._last_reload_check = time.monotonic()
+        self.warmup_queries = warmup_queries
+        self.encoder_threads = encoder_threads
+        self._search_executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="search",
+                                                   initializer=limit_current_thread)
+        self.startup_timeout = startup_timeout
+        self.startup_stats: Dict[str, Any] = {"ready": False, "background": background_load, "model_load": None,
+                                              "index_load": None, "cold_start": None, "warmup": None,
+                                              "first_query": None, "error": None}
+        self._ready = threading.Event()
+        self._startup_error: Optional[BaseException] = None
+        if background_load:
+            threading.Thread(target=self._startup, name="searcher-startup", daemon=True).start()
+        else:
+            self._startup()
+            if self._startup_error is not None:
+                raise self._startup_error
+
+    def _startup(self) -> None:
+        """Load the encoder and the index concurrently, warm them up, then report ready."""
+        start = time.perf_counter()
+        try:
+            def load_index():
+                index_start = time.perf_counter()
+                self._load_resources()
+                self.startup_stats["index_load"] = time.perf_counter() - index_start
+
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-load") as pool:
+                resources = pool.submit(load_index)
+                self.model = load_encoder(self.model_name, self.backend, threads=self.encoder_threads)
+                self.startup_stats["model_load"] = time.perf_counter() - start
+                resources.result()
+            self.startup_stats["cold_start"] = time.perf_counter() - start
+
+            warmup_start = time.perf_counter()
+            self._warm_up()
+            self.startup_stats["warmup"] = time.perf_counter() - warmup_start
+            self.startup_stats["ready"] = True
+            logger.info(f"Searcher ready in {time.perf_counter() - start:.2f}s (cold start "
+                        f"{self.startup_stats['cold_start']:.2f}s, warm-up {self.startup_stats['warmup']:.2f}s)")
+        except Exception as e:
+            self._startup_error = e
+            self.startup_stats["error"] = str(e)
+            logger.error(f"Searcher startup failed: {e}")
+        finally:
+            self._ready.set()
+
+    def _warm_up(self) -> None:
+        """
+        Encode and search a few queries (first inference, tokenizer, index and metadata pages),
+        bypassing the query caches so that the model itself runs.
+        """
+        queries = self.warmup_queries
+        if isinstance(queries, int):
+            queries = [record["probleme"] for record in self.metadata.head(queries) if record.get("probleme")]
+        queries = list(queries)
+        if not queries:
+            return
+        encode_bucketed(self.model, queries[:1])  # chemin d'une question seule, comme la première requête
+        query_vectors = np.asarray(encode_bucketed(self.model, queries), dtype=np.float32)
+        with self._lock.read():
+            found = []
+            for index in [self.index, *(shard.index for shard in self.shards.values())]:
+                ids, _ = self._search_index(index, query_vectors, 3)
+                found.append(ids[ids >= 0])
+            self.metadata.get_many(np.unique(np.concatenate(found)).tolist())
+            if self.lexical is not None:
+                for query in queries:
+                    self.lexical.search(query, self.hybrid_candidates)
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set() and self._startup_error is None
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the startup sequence; False on timeout, raises if startup failed."""
+        if not self._ready.wait(timeout):
+            return False
+        if self._startup_error is not None:
+            raise RuntimeError(f"Searcher startup failed: {self._startup_error}") from self._startup_error
+        return True
+
+    def _use_snapshots(self) -> bool:
+        return self.snapshots is not None and self.snapshots.current_version() is not None
+
+    def _read_resources(self) -> Tuple[Optional[str], faiss.Index, object, Optional[np.ndarray],
+                                       Dict[str, Shard], Optional[LexicalIndex], Optional[Path]]:
+        """
+        Read the current snapshot (with its exact float32 vectors, if any), or the legacy index/metadata files.
+        Snapshot metadata is read on demand. Checksums are verified the first time a version is loaded
+        (by any process); later loads only check the file sizes recorded in the manifest.
+        The snapshot is leased before it is read; the lease is returned with the resources.
+        """
+        if self._use_snapshots():
+            version = self.snapshots.current_version()
+            lease = self.snapshots.acquire(version)
+            try:
+                index, metadata, manifest = self.snapshots.load(version, verify=False, mmap=self.mmap_index)
+                if manifest.get("model_name") != self.model_name:
+                    raise ValueError(f"Snapshot {version} built with {manifest.get('model_name')}, "
+                                     f"not {self.model_name}")
+                configure_search(index, manifest.get("index_spec"))
+                exact_vectors = (self.snapshots.exact_vectors(version)
+                                 if manifest.get("index_spec", {}).get("exact_rescoring") else None)
+                shards = self.snapshots.load_shards(version, mmap=self.mmap_index) if self.route_by_logiciel else {}
+                for shard in shards.values():
+                    configure_search(shard.index, shard.spec)
+                lexical = self.snapshots.load_lexical(version) if self.hybrid else None
+            except Exception:
+                self.snapshots.release(lease)
+                raise
+            return version, index, metadata, exact_vectors, shards, lexical, lease
+
+        if not all(p.exists() for p in [self.index_path, self.metadata_path]):
+            raise FileNotFoundError("Required files not found")
+        index = read_index(self.index_path, mmap=self.mmap_index)
+        with open(self.metadata_path, "rb") as f:
+            metadata = InMemoryMetadata(pickle.load(f))
+        if len(metadata) != index.ntotal:
+            raise ValueError("Invalid metadata format")
+        return None, index, metadata, None, {}, None, None
 
     def _load_resources(self) -> None:
-        """Load and validate all required resources."""
+        """Load, validate and install all required resources."""
         try:
-            if not all(p.exists() for p in [self.index_path, self.metadata_path]):
-                raise FileNotFoundError("Required files not found")
-            
-            self.index = faiss.read_index(str(self.index_path))
-            with open(self.metadata_path, "rb") as f:
-                self.metadata = pickle.load(f)
-
-            if not (isinstance(self.metadata, list) and 
-                   len(self.metadata) == self.index.ntotal and
-                   all(isinstance(m, dict) and {'uid', 'logiciel', 'probleme', 'solution'} <= m.keys() 
-                       for m in self.metadata)):
-                raise ValueError("Invalid metadata format")
+            version, index, metadata, exact_vectors, shards, lexical, lease = self._read_resources()
+            try:
+                router = LogicielRouter({key: shard.name for key, shard in shards.items()})
+                tombstones = TombstoneBitmap(
+                    self.snapshots.tombstone_path if version else tombstone_path_for(self.index_path)
+                )
+            except Exception:
+                SnapshotStore.release(lease)
+                raise
+
+            # Bascule: attend la fin des recherches en cours, les suivantes voient la nouvelle version
+            with self._lock.write():
+                previous_metadata, previous_lease = self.metadata, self._lease
+                self._lease = lease
+                self.version = version
+                self.index = index
+                # Index ID-mappé: FAISS renvoie qa_pairs.uid ; ancien index plat: la position
+                self.metadata = metadata
+                self._exact_vectors = exact_vectors
+                self.shards = shards
+                self.router = router
+                self.lexical = lexical
+                self.filter_bitmaps = FilterBitmaps(metadata)
+                self.tombstones = tombstones
+                self._refresh_tombstones()
+
+            # Plus aucune recherche sur l'ancienne version : connexions fermées, bail rendu
+            # (ses fichiers mappés sont libérés avec les derniers objets qui les référencent)
+            if previous_metadata is not None:
+                previous_metadata.close()
+            SnapshotStore.release(previous_lease)
+
+            if version:
+                logger.info(f"Index snapshot {version} loaded ({index.ntotal} vectors, {len(shards)} software shards"
+                            f"{', BM25 index' if lexical is not None else ''})")
 
         except Exception as e:
             logger.error(f"Initialization error: {e}")
             raise
 
-    def search(self, query: str, k: int = 3) -> List[SearchResult]:
-        """Perform semantic search."""
+    def _background_reload(self) -> None:
+        try:
+            self._load_resources()
+        except Exception as e:
+            logger.error(f"Hot reload failed, keeping version {self.version}: {e}")
+        finally:
+            self._reload_lock.release()
+
+    def maybe_reload(self) -> bool:
+        """
+        Check (at most every reload_interval seconds) whether a newer snapshot was published
+        and load it in a background thread; queries keep using the current version meanwhile.
+        """
+        if self.snapshots is None:
+            return False
+        now = time.monotonic()
+        if now - self._last_reload_check < self.reload_interval:
+            return False
+        self._last_reload_check = now
+
+        current = self.snapshots.current_version()
+        if current is None or current == self.version:
+            return False
+        if not self._reload_lock.acquire(blocking=False):
+            return False  # déjà en cours de chargement
+        logger.info(f"New index snapshot detected: {current}")
+        threading.Thread(target=self._background_reload, name="index-reload", daemon=True).start()
+        return True
+
+    def _refresh_tombstones(self, force: bool = True) -> None:
+        """Reload the tombstone bitmap if it changed and count how many indexed ids it hides."""
+        if self.tombstones.reload_if_changed() or force:
+            dead = self.tombstones.ids()
+            self._dead_count = self.metadata.count_present(dead)
+            self.filter_bitmaps.set_dead(dead)
+
+    def _encode_uncached(self, queries: List[str]) -> np.ndarray:
+        encode = lambda texts: encode_bucketed(self.model, texts)
+        if self.embedding_cache is None:
+            return encode(queries)
+        # Lecture seule : les requêtes ne doivent pas remplir le cache des textes de la base
+        return self.embedding_cache.encode(queries, encode, store=False)
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Query embeddings: recent queries from the LRU, then texts of the knowledge base
+        from the embedding cache; only the remaining ones are encoded, together in length-sorted batches.
+        """
+        if self.query_cache is None:
+            return self._encode_uncached(queries)
+        return self.query_cache.encode(queries, self._encode_uncached)
+
+    def _rescore(self, query_vectors: np.ndarray, indices: np.ndarray, dead: np.ndarray) -> np.ndarray:
+        """Exact L2 distances of each query's shortlist against the float32 vectors (dead entries left at 0)."""
+        rows = np.zeros(indices.shape, dtype=np.int64)
+        rows[~dead] = self.metadata.rows(indices[~dead])
+        vectors = self._exact_vectors[rows.ravel()].reshape(*indices.shape, -1)
+        return ((vectors - query_vectors[:, None, :]) ** 2).sum(axis=2)
+
+    def _search_index(self, index: faiss.Index, query_vectors: np.ndarray, k: int,
+                      allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k live ids and distances of one index for a matrix of queries, best first,
+        padded with -1 / inf (caller holds the read lock).
+
+        Args:
+            allowed: Bitmap of the ids FAISS may return (filters, tombstones already removed);
+                by default the live ids when tombstones hide indexed entries
+        """
+        if allowed is None and self._dead_count:
+            # Tombstones écartées dans FAISS : le coût ne dépend pas de leur nombre
+            allowed = self.filter_bitmaps.live()
+        params = search_parameters(index, allowed) if allowed is not None else None
+        fetch_k = k
+        if self._exact_vectors is not None:
+            fetch_k *= self.rerank_factor  # liste courte re-classée sur les vecteurs exacts
+        fetch_k = max(1, min(fetch_k, index.ntotal))
+        distances, indices = index.search(query_vectors, fetch_k, params=params)
+
+        dead = (indices < 0) | self.tombstones.contains(indices)
+        if self._exact_vectors is not None and not dead.all():
+            distances = self._rescore(query_vectors, indices, dead)
+        distances = np.where(dead, np.inf, distances)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        indices = np.take_along_axis(indices, order, axis=1)
+        distances = np.take_along_axis(distances, order, axis=1)
+        indices[np.isinf(distances)] = -1
+        return indices, distances
+
+    def _exact_filtered(self, query_vectors: np.ndarray, allowed: np.ndarray,
+                        k: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Brute-force top-k over the ids of a (small) filter bitmap, for queries where the
+        approximate index (HNSW graph, IVF probes) returned fewer than k filtered hits.
+        """
+        ids = np.flatnonzero(np.unpackbits(allowed, bitorder="little")).astype(np.int64)
+        if not ids.size or ids.size > self.exact_filter_limit:
+            return None
+        vectors = self._stored_vectors(ids)
+        if vectors is None:
+            return None
+        distances, positions = faiss.knn(query_vectors, vectors, min(k, ids.size))
+        return ids[positions], distances
+
+    def _stored_vectors(self, ids: np.ndarray) -> Optional[np.ndarray]:
+        """Float32 vectors of indexed ids (exact vectors if written, else reconstructed; None if unavailable)."""
+        try:
+            vectors = (self._exact_vectors[self.metadata.rows(ids)] if self._exact_vectors is not None
+                       else np.vstack([self.index.reconstruct(int(i)) for i in ids]))
+        except RuntimeError:
+            return None  # index sans reconstruct(), ou id absent
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def _lexical_search(self, lexical: LexicalIndex, queries: List[str], n: int,
+                        allowed: Optional[np.ndarray]) -> List[np.ndarray]:
+        """BM25 ranking (ids, best first) of each query; runs in the bm25 pool."""
+        return [lexical.search(query, n, allowed)[0] for query in queries]
+
+    def _fuse(self, query_vectors: np.ndarray, indices: np.ndarray, distances: np.ndarray,
+              lexical_ids: List[np.ndarray], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reciprocal-rank fusion of the vector and BM25 rankings, top-k by fused score.
+        Distances stay L2 distances: entries found by BM25 alone are scored against their stored vector.
+        """
+        fused_ids = np.full((len(indices), k), -1, dtype=np.int64)
+        fused_distances = np.full((len(indices), k), np.inf, dtype=np.float32)
+        for row, (vector_ids, lexical_row) in enumerate(zip(indices, lexical_ids)):
+            scores: Dict[int, float] = {}
+            known = {}
+            for rank, idx in enumerate(vector_ids[vector_ids >= 0].tolist()):
+                scores[idx] = 1.0 / (self.rrf_k + rank + 1)
+                known[idx] = float(distances[row, rank])
+            lexical_row = lexical_row[~self.tombstones.contains(lexical_row)] if lexical_row.size else lexical_row
+            for rank, idx in enumerate(lexical_row.tolist()):
+                scores[idx] = scores.get(idx, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+            missing = np.array([idx for idx in scores if idx not in known], dtype=np.int64)
+            if missing.size:
+                vectors = self._stored_vectors(missing)
+                if vectors is not None:
+                    known.update(zip(missing.tolist(),
+                                     ((vectors - query_vectors[row]) ** 2).sum(axis=1).tolist()))
+            # Score de fusion décroissant, distance croissante à égalité
+            ranked = sorted(scores, key=lambda idx: (-scores[idx], known.get(idx, np.inf)))[:k]
+            fused_ids[row, :len(ranked)] = ranked
+            fused_distances[row, :len(ranked)] = [known.get(idx, np.inf) for idx in ranked]
+        return fused_ids, fused_distances
+
+    def search_batch(self, queries: List[str], k: int = 3, logiciel: Optional[str] = None,
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[SearchResult]]:
+        """
+        Semantic search for several queries at once: one batched encoding, one FAISS
+        search per index (the global index and each routed software shard). In hybrid
+        mode the BM25 rankings are computed meanwhile and fused with the vector ones.
+
+        Args:
+            filters: Restrict results to {"logiciel": ..., "type_probleme": ... (value or list),
+                "created_after": ..., "created_before": ... (ISO dates)}; applied inside FAISS
+                through an id bitmap, so k matching results are returned whenever k exist
+
+        Returns:
+            One result list per query, in the order of `queries`
+        """
         try:
-            query_vector = self.model.encode([query], convert_to_numpy=True, show_progress_bar=False)
-            distances, indices = self.index.search(query_vector.astype(np.float32), k)
-            
+            if not self.wait_ready(self.startup_timeout):
+                raise TimeoutError(f"Searcher not ready after {self.startup_timeout}s")
+            # Threads OpenMP de FAISS : réglage propre au thread appelant (Streamlit, HTTP, exécuteurs)
+            limit_current_thread()
+            first_query = self.startup_stats["first_query"] is None
+            search_start = time.perf_counter()
+            self.maybe_reload()
+            if not queries:
+                return []
+            filter_key = normalize_filters(filters)
+
+            # Recherche BM25 lancée avant l'encodage des questions (les deux se recouvrent)
+            lexical_future: Optional[Future] = None
+            with self._lock.read():
+                lexical = self.lexical if self.hybrid else None
+                if lexical is not None:
+                    if filter_key is not None:
+                        allowed = self.filter_bitmaps.get(filter_key)[0]
+                    else:
+                        allowed = self.filter_bitmaps.live() if self._dead_count else None
+                    lexical_future = self._lexical_pool.submit(self._lexical_search, lexical, list(queries),
+                                                               self.hybrid_candidates, allowed)
+
+            query_vectors = self._encode_queries(list(queries)).astype(np.float32)
+
+            with self._lock.read():
+                self._refresh_tombstones(force=False)
+                # Classement vectoriel plus profond quand il est fusionné au classement BM25
+                depth = max(k, self.hybrid_candidates) if lexical_future is not None else k
+                indices = np.full((len(queries), depth), -1, dtype=np.int64)
+                distances = np.full((len(queries), depth), np.inf, dtype=np.float32)
+                allowed, expected = None, min(k, self.index.ntotal - self._dead_count)
+                if filter_key is not None:
+                    allowed, matching = self.filter_bitmaps.get(filter_key)
+                    expected = min(k, matching)
+                    if not matching:
+                        return [[] for _ in queries]
+                    # Un seul logiciel demandé : son shard d'abord
+                    if not logiciel and filter_key[0] is not None and len(filter_key[0]) == 1:
+                        logiciel = filter_key[0][0]
+
+                # Routage : chaque question citant un seul logiciel cherche d'abord dans son shard
+                keys = np.array([shard_key(logiciel) if logiciel else self.router.detect(q) for q in queries],
+                                dtype=object)
+                pending = np.ones(len(queries), dtype=bool)
+                for key in set(keys.tolist()) & self.shards.keys():
+                    rows = np.flatnonzero(keys == key)
+                    ids, dist = self._search_index(self.shards[key].index, query_vectors[rows], depth, allowed)
+                    # Résultats faibles ou trop peu nombreux : repli sur l'index global
+                    weak = ((ids >= 0).sum(axis=1) < expected) | (dist[:, 0] > self.fallback_distance)
+                    if weak.any():
+                        logger.debug(f"{int(weak.sum())} weak result lists in shard {key!r}, falling back to global search")
+                    kept = rows[~weak]
+                    indices[kept, :ids.shape[1]] = ids[~weak]
+                    distances[kept, :ids.shape[1]] = dist[~weak]
+                    pending[kept] = False
+
+                if pending.any():
+                    ids, dist = self._search_index(self.index, query_vectors[pending], depth, allowed)
+                    rows = np.flatnonzero(pending)
+                    indices[rows, :ids.shape[1]] = ids
+                    distances[rows, :ids.shape[1]] = dist
+                    # Filtre très sélectif : le graphe HNSW ou les partitions IVF sondées peuvent
+                    # en manquer, recherche exacte sur les seuls ids autorisés
+                    short = rows[(ids >= 0).sum(axis=1) < expected]
+                    if allowed is not None and short.size:
+                        exact = self._exact_filtered(query_vectors[short], allowed, depth)
+                        if exact is not None:
+                            indices[short, :exact[0].shape[1]] = exact[0]
+                            distances[short, :exact[1].shape[1]] = exact[1]
+
+                if lexical_future is not None:
+                    indices, distances = self._fuse(query_vectors, indices, distances,
+                                                    lexical_future.result(), k)
+
+                records = self.metadata.get_many(np.unique(indices[indices >= 0]).tolist())
+
+            if first_query:
+                self.startup_stats["first_query"] = time.perf_counter() - search_start
+
             return [
-                SearchResult(
-                    **{k: self.metadata[idx][k] for k in ['uid', 'logiciel', 'probleme', 'solution']},
-                    distance=float(dist)
-                )
-                for idx, dist in zip(indices[0], distances[0])
-                if 0 <= idx < len(self.metadata)
+                [
+                    SearchResult(
+                        **{field: records[idx][field] for field in ['uid', 'logiciel', 'probleme', 'solution']},
+                        distance=float(dist)
+                    )
+                    for idx, dist in zip(row_ids, row_distances)
+                    if idx in records
+                ]
+                for row_ids, row_distances in zip(indices.tolist(), distances.tolist())
             ]
         except Exception as e:
             logger.error(f"Search error: {e}")
             raise
 
+    def search(self, query: str, k: int = 3, logiciel: Optional[str] = None,
+               filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        """
+        Perform semantic search (entries deleted or edited since the last build are filtered out).
+        A query naming one software (or an explicit `logiciel`) only searches that
+        software's shard, and falls back to the global index when the routed results are weak.
+        `filters` restricts results by logiciel, type_probleme and creation date (see search_batch).
+        """
+        return self.search_batch([query], k=k, logiciel=logiciel, filters=filters)[0]
+
+    async def asearch_batch(self, queries: List[str], k: int = 3, logiciel: Optional[str] = None,
+                            filters: Optional[Dict[str, Any]] = None) -> List[List[SearchResult]]:
+        """search_batch on the bounded search executor (at most search_workers searches run at once)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._search_executor,
+                                          lambda: self.search_batch(queries, k=k, logiciel=logiciel, filters=filters))
+
+    async def asearch(self, query: str, k: int = 3, logiciel: Optional[str] = None,
+                      filters: Optional[Dict[str, Any]] = None) -> List[SearchResult]:
+        """Non-blocking search(): the event loop keeps serving other sessions meanwhile."""
+        return (await self.asearch_batch([query], k=k, logiciel=logiciel, filters=filters))[0]
+
 def main():
     try:
         searcher = SemanticSearcher(
             "all-MiniLM-L6-v2",
             "db/faiss_index.index",
-            "db/metadata.pkl"
+            "db/metadata.pkl",
+            snapshot_dir="db/index",
+            embedding_cache_dir="db/embedding_cache"
         )
         
         results = searcher.search("Comment générer un rapport")
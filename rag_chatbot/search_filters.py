@@ -0,0 +1,143 @@
+"""
+FILTRES DE RECHERCHE APPLIQUÉS DANS FAISS
+Un filtre ({"logiciel": ..., "type_probleme": ..., "created_after": ..., "created_before": ...})
+devient un bitmap d'un bit par id FAISS (qa_pairs.uid), calculé une fois par
+instantané à partir des index de metadata.db puis gardé en cache. Les tombstones
+en sont retirées et le bitmap est passé à FAISS (IDSelectorBitmap) : les entrées
+exclues ne sont jamais classées, sans sur-échantillonnage ni filtrage Python.
+Sans filtre, le bitmap des seules entrées vivantes (live) écarte les tombstones
+de la même façon.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from index_shards import shard_key
+
+FILTER_KEYS = ("logiciel", "type_probleme", "created_after", "created_before")
+
+FilterKey = Tuple[Optional[Tuple[str, ...]], Optional[Tuple[str, ...]], Optional[str], Optional[str]]
+
+
+def _values(value: Any) -> Optional[Tuple[str, ...]]:
+    if value is None:
+        return None
+    values = [value] if isinstance(value, str) else list(value)
+    return tuple(sorted({str(v) for v in values}))
+
+
+def _iso(value: Any) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    return value.isoformat() if isinstance(value, (date, datetime)) else str(value)
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Optional[FilterKey]:
+    """
+    Forme canonique (hashable) d'un filtre, None si aucun critère.
+
+    Args:
+        filters: logiciel / type_probleme (valeur ou liste), created_after (inclus) /
+            created_before (exclu) en date ISO
+    """
+    if not filters:
+        return None
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown search filters {sorted(unknown)}, expected {FILTER_KEYS}")
+    key = (_values(filters.get("logiciel")), _values(filters.get("type_probleme")),
+           _iso(filters.get("created_after")), _iso(filters.get("created_before")))
+    return key if any(part is not None for part in key) else None
+
+
+def ids_to_bitmap(ids: np.ndarray) -> np.ndarray:
+    """Bitmap (ordre des bits little-endian, comme IDSelectorBitmap) des ids donnés."""
+    ids = np.asarray(ids, dtype=np.int64)
+    bits = np.zeros(int(ids.max()) // 8 + 1 if ids.size else 0, dtype=np.uint8)
+    np.bitwise_or.at(bits, ids // 8, (1 << (ids % 8)).astype(np.uint8))
+    return bits
+
+
+def search_parameters(index: faiss.Index, bitmap: np.ndarray) -> faiss.SearchParameters:
+    """Paramètres de recherche limitant FAISS aux ids du bitmap (nprobe de l'index conservé pour les IVF)."""
+    selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+    try:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(index).nprobe)
+    except RuntimeError:
+        # flat / HNSW : l'efSearch de l'index s'applique
+        params = faiss.SearchParameters(sel=selector)
+    params.referenced_objects = [selector, bitmap]  # le bitmap doit survivre à la recherche
+    return params
+
+
+class FilterBitmaps:
+    """Bitmaps des filtres déjà demandés pour une version d'instantané (LRU, tombstones retirées)."""
+
+    def __init__(self, metadata, max_entries: int = 64):
+        self.metadata = metadata
+        self.max_entries = max_entries
+        self._bitmaps: "OrderedDict[FilterKey, Tuple[np.ndarray, int]]" = OrderedDict()
+        self._dead = np.zeros(0, dtype=np.int64)
+        self._live: Optional[np.ndarray] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def set_dead(self, dead_ids: np.ndarray) -> None:
+        """Nouvelles tombstones : les bitmaps en cache sont recalculés à la demande."""
+        with self._lock:
+            self._dead = np.asarray(dead_ids, dtype=np.int64)
+            self._live = None
+            self._generation += 1
+            self._bitmaps.clear()
+
+    def live(self) -> Optional[np.ndarray]:
+        """Bitmap de toutes les entrées vivantes (tombstones seules retirées), None sans tombstone."""
+        with self._lock:
+            if self._live is not None or not self._dead.size:
+                return self._live
+            dead, generation = self._dead, self._generation
+
+        ids = self.metadata.filter_ids()
+        bitmap = ids_to_bitmap(ids[~np.isin(ids, dead)])
+        with self._lock:
+            if generation == self._generation:
+                self._live = bitmap
+        return bitmap
+
+    def _matching_ids(self, key: FilterKey) -> np.ndarray:
+        logiciels, types, created_after, created_before = key
+        if logiciels is not None:
+            # Même normalisation que le routage : "sap", "SAP " et "Sap" désignent le même logiciel
+            wanted = {shard_key(v) for v in logiciels}
+            logiciels = [v for v in self.metadata.distinct("logiciel") if shard_key(v) in wanted]
+        if types is not None:
+            wanted = {v.casefold().strip() for v in types}
+            types = [v for v in self.metadata.distinct("type_probleme") if v.casefold().strip() in wanted]
+        if (logiciels is not None and not logiciels) or (types is not None and not types):
+            return np.zeros(0, dtype=np.int64)
+        return self.metadata.filter_ids(logiciels, types, created_after, created_before)
+
+    def get(self, key: FilterKey) -> Tuple[np.ndarray, int]:
+        """Bitmap des entrées vivantes qui vérifient le filtre, et leur nombre."""
+        with self._lock:
+            cached = self._bitmaps.get(key)
+            if cached is not None:
+                self._bitmaps.move_to_end(key)
+                return cached
+            dead, generation = self._dead, self._generation
+
+        ids = self._matching_ids(key)
+        ids = ids[~np.isin(ids, dead)]
+        entry = (ids_to_bitmap(ids), int(ids.size))
+        with self._lock:
+            if generation != self._generation:
+                return entry  # tombstones changées pendant le calcul : pas de mise en cache
+            self._bitmaps[key] = entry
+            while len(self._bitmaps) > self.max_entries:
+                self._bitmaps.popitem(last=False)
+        return entry
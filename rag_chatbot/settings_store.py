@@ -0,0 +1,75 @@
+"""
+PARAMÈTRES MODIFIABLES DEPUIS L'ADMINISTRATION
+Petit fichier JSON partagé entre l'interface admin (écriture) et les
+processus qui répondent aux questions (lecture) : une modification est prise
+en compte à la question suivante, sans redémarrage (relecture quand la date
+de modification du fichier change). Écriture atomique (os.replace).
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS_PATH = "db/chatbot_settings.json"
+
+DEFAULT_SETTINGS: Dict[str, Any] = {
+    # Similarité cosinus (1 - distance L2² / 2) du meilleur résultat. Valeurs de départ
+    # non calibrées : les recalculer sur la base réelle avec benchmarks/calibrate_confidence.py --save
+    "confidence_low": 0.30,   # en dessous : réponse "contacter le support", sans LLM
+    "confidence_high": 0.90,  # au-dessus : solution enregistrée renvoyée directement, sans LLM
+}
+
+
+class SettingsStore:
+    """Lecture (avec rechargement à chaud) et mise à jour des paramètres persistés."""
+
+    def __init__(self, path: str = DEFAULT_SETTINGS_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._settings = dict(DEFAULT_SETTINGS)
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Paramètres illisibles ({self.path}): {e}, valeurs précédentes conservées")
+            return
+        self._settings = {**DEFAULT_SETTINGS, **stored}
+        self._mtime = mtime
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            self._reload_if_changed()
+            return self._settings.get(key, DEFAULT_SETTINGS.get(key))
+
+    def all(self) -> Dict[str, Any]:
+        with self._lock:
+            self._reload_if_changed()
+            return dict(self._settings)
+
+    def update(self, **values: Any) -> None:
+        """Enregistre les valeurs données (les autres paramètres sont conservés)."""
+        with self._lock:
+            self._reload_if_changed()
+            settings = {**self._settings, **values}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(settings, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+            self._settings = settings
+            self._mtime = self.path.stat().st_mtime_ns
+        logger.info(f"Paramètres enregistrés: {values}")
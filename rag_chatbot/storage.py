@@ -0,0 +1,467 @@
+"""
+COUCHE DE STOCKAGE SQLITE PARTAGÉE
+Point d'accès unique à la base qa_pairs pour export_to_sqlite, RAGPipelineUpdater
+et DocumentEmbedder :
+1. Un seul chemin configuré (variable d'environnement DB_PATH)
+2. Un pool de connexions thread-safe avec PRAGMAs de performance
+3. Des migrations de schéma versionnées (PRAGMA user_version)
+4. Des helpers typés de lecture/écriture par lots
+"""
+
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parent / "db" / "qa_database.db"
+
+# PRAGMAs appliqués à chaque nouvelle connexion
+PERFORMANCE_PRAGMAS = {
+    "journal_mode": "WAL",          # lecteurs non bloqués pendant l'écriture
+    "synchronous": "NORMAL",        # sûr en WAL, beaucoup moins de fsync
+    "cache_size": -20000,           # ~20 Mo de cache de pages
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,         # 256 Mo lus via mmap
+    "busy_timeout": 5000,
+}
+
+
+def get_db_path() -> Path:
+    """Retourne le chemin configuré de la base (DB_PATH ou db/qa_database.db)."""
+    return Path(os.getenv("DB_PATH", str(DEFAULT_DB_PATH)))
+
+
+def content_hash(logiciel: str, probleme: str, solution: str) -> str:
+    """Empreinte du contenu d'une paire Q/R, utilisée pour le dédoublonnage."""
+    payload = "\x1f".join(str(v or "").strip() for v in (logiciel, probleme, solution))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class QAPair:
+    """Ligne de la table qa_pairs"""
+    logiciel: str
+    probleme: str
+    solution: str
+    type_probleme: str = "Général"
+    uid: Optional[int] = None
+    hash: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    kb_uid: Optional[str] = None    # uid de l'entrée knowledge_base.jsonl d'origine
+    deleted: int = 0                # suppression logique (ligne retirée de l'index)
+
+    def __post_init__(self):
+        if not self.hash:
+            self.hash = content_hash(self.logiciel, self.probleme, self.solution)
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "QAPair":
+        return cls(**{key: row[key] for key in row.keys()})
+
+
+class ConnectionPool:
+    """Pool de connexions SQLite thread-safe (une connexion n'est utilisée que par un thread à la fois)."""
+
+    def __init__(self, db_path: Path, max_size: int = 4):
+        self.db_path = Path(db_path)
+        self.max_size = max_size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create_connection(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma, value in PERFORMANCE_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma}={value}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                return self._create_connection()
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Emprunte une connexion ; commit si tout s'est bien passé, rollback sinon."""
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close_all(self) -> None:
+        """Ferme les connexions inactives du pool."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+# ---------------------------------------------------------------------------
+# Migrations (appliquées dans l'ordre, suivies par PRAGMA user_version)
+# ---------------------------------------------------------------------------
+
+def _columns(conn: sqlite3.Connection, table: str) -> Set[str]:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _migration_1_create_table(conn: sqlite3.Connection) -> None:
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS qa_pairs (
+            uid INTEGER PRIMARY KEY AUTOINCREMENT,
+            logiciel TEXT,
+            probleme TEXT,
+            solution TEXT,
+            type_probleme TEXT
+        )
+    ''')
+
+
+def _migration_2_hash_and_timestamps(conn: sqlite3.Connection) -> None:
+    existing = _columns(conn, "qa_pairs")
+    for column in ("hash", "created_at", "updated_at"):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE qa_pairs ADD COLUMN {column} TEXT")
+
+    # Remplir les colonnes pour les lignes déjà présentes
+    now = datetime.now().isoformat()
+    rows = conn.execute(
+        "SELECT uid, logiciel, probleme, solution FROM qa_pairs WHERE hash IS NULL"
+    ).fetchall()
+    conn.executemany(
+        "UPDATE qa_pairs SET hash = ? WHERE uid = ?",
+        [(content_hash(r[1], r[2], r[3]), r[0]) for r in rows]
+    )
+    conn.execute("UPDATE qa_pairs SET created_at = ? WHERE created_at IS NULL", (now,))
+    conn.execute("UPDATE qa_pairs SET updated_at = created_at WHERE updated_at IS NULL")
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_qa_pairs_hash ON qa_pairs(hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_qa_pairs_logiciel ON qa_pairs(logiciel)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_qa_pairs_updated_at ON qa_pairs(updated_at)")
+
+
+def _migration_3_kb_uid_and_soft_delete(conn: sqlite3.Connection) -> None:
+    existing = _columns(conn, "qa_pairs")
+    if "kb_uid" not in existing:
+        conn.execute("ALTER TABLE qa_pairs ADD COLUMN kb_uid TEXT")
+    if "deleted" not in existing:
+        conn.execute("ALTER TABLE qa_pairs ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_qa_pairs_kb_uid ON qa_pairs(kb_uid)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_qa_pairs_deleted ON qa_pairs(deleted)")
+
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migration_1_create_table,
+    _migration_2_hash_and_timestamps,
+    _migration_3_kb_uid_and_soft_delete,
+]
+
+
+class QAStorage:
+    """Accès typé à la table qa_pairs"""
+
+    COLUMNS = ("uid, logiciel, probleme, solution, type_probleme, hash, "
+               "created_at, updated_at, kb_uid, deleted")
+
+    def __init__(self, db_path: Optional[Path] = None, pool_size: int = 4):
+        self.db_path = Path(db_path) if db_path else get_db_path()
+        self.pool = ConnectionPool(self.db_path, max_size=pool_size)
+        self._migrated = False
+        self._migrate_lock = threading.Lock()
+
+    def init_db(self) -> None:
+        """Crée la base si besoin et applique les migrations manquantes."""
+        with self._migrate_lock:
+            if self._migrated:
+                return
+            with self.pool.connection() as conn:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for number, migration in enumerate(MIGRATIONS, start=1):
+                    if number <= version:
+                        continue
+                    migration(conn)
+                    conn.execute(f"PRAGMA user_version={number}")
+                    logger.info(f"Migration {number} appliquée sur {self.db_path}")
+            self._migrated = True
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Connexion du pool sur une base à jour."""
+        self.init_db()
+        with self.pool.connection() as conn:
+            yield conn
+
+    # --- Lecture -----------------------------------------------------------
+
+    def max_uid(self) -> int:
+        """Plus grand uid attribué (lignes supprimées comprises)."""
+        with self.connection() as conn:
+            result = conn.execute("SELECT MAX(uid) FROM qa_pairs").fetchone()[0]
+        return result if result is not None else 0
+
+    def count(self) -> int:
+        """Nombre de lignes actives."""
+        with self.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM qa_pairs WHERE deleted = 0").fetchone()[0]
+
+    def fingerprint(self) -> str:
+        """Empreinte bon marché du contenu : change à chaque ajout, modification ou suppression."""
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), MAX(uid), MAX(updated_at), SUM(deleted) FROM qa_pairs"
+            ).fetchone()
+        return ":".join(str(value) for value in row)
+
+    def existing_hashes(self, hashes: Iterable[str], batch_size: int = 500) -> Set[str]:
+        """Retourne le sous-ensemble des empreintes déjà présentes en base (lignes actives)."""
+        return set(self.kb_uids_by_hash(hashes, batch_size))
+
+    def kb_uids_by_hash(self, hashes: Iterable[str], batch_size: int = 500) -> Dict[str, Optional[str]]:
+        """Entrée knowledge_base propriétaire (ou None) de chaque empreinte déjà présente (lignes actives)."""
+        with self.connection() as conn:
+            return self._kb_uids_by_hash(conn, hashes, batch_size)
+
+    @staticmethod
+    def _kb_uids_by_hash(conn: sqlite3.Connection, hashes: Iterable[str],
+                         batch_size: int = 500) -> Dict[str, Optional[str]]:
+        hashes = list(hashes)
+        found: Dict[str, Optional[str]] = {}
+        for start in range(0, len(hashes), batch_size):
+            batch = hashes[start:start + batch_size]
+            placeholders = ",".join("?" * len(batch))
+            found.update(
+                (row[0], row[1]) for row in conn.execute(
+                    f"SELECT hash, kb_uid FROM qa_pairs WHERE deleted = 0 AND hash IN ({placeholders})",
+                    batch
+                )
+            )
+        return found
+
+    def exists(self, logiciel: str, probleme: str, solution: str) -> bool:
+        return bool(self.existing_hashes([content_hash(logiciel, probleme, solution)]))
+
+    def live_hashes_by_kb_uid(self, kb_uids: Iterable[str], batch_size: int = 500) -> Dict[str, str]:
+        """Empreinte de la version active de chaque entrée knowledge_base connue."""
+        kb_uids = list(kb_uids)
+        found: Dict[str, str] = {}
+        with self.connection() as conn:
+            for start in range(0, len(kb_uids), batch_size):
+                batch = kb_uids[start:start + batch_size]
+                placeholders = ",".join("?" * len(batch))
+                found.update(
+                    (row[0], row[1]) for row in conn.execute(
+                        f"SELECT kb_uid, hash FROM qa_pairs "
+                        f"WHERE deleted = 0 AND kb_uid IN ({placeholders})", batch
+                    )
+                )
+        return found
+
+    def deleted_uids(self) -> List[int]:
+        """uids des lignes supprimées logiquement (à retirer de l'index)."""
+        with self.connection() as conn:
+            return [row[0] for row in conn.execute("SELECT uid FROM qa_pairs WHERE deleted = 1")]
+
+    def live_uids(self) -> List[int]:
+        """uids de toutes les lignes actives (lecture de l'index de clé primaire seulement)."""
+        with self.connection() as conn:
+            return [row[0] for row in conn.execute("SELECT uid FROM qa_pairs WHERE deleted = 0")]
+
+    def fetch_by_uids(self, uids: Iterable[int], batch_size: int = 500) -> List[QAPair]:
+        """Charge les paires actives dont l'uid est donné, dans l'ordre des uid."""
+        uids = list(uids)
+        pairs: List[QAPair] = []
+        with self.connection() as conn:
+            for start in range(0, len(uids), batch_size):
+                batch = uids[start:start + batch_size]
+                placeholders = ",".join("?" * len(batch))
+                pairs.extend(
+                    QAPair.from_row(row) for row in conn.execute(
+                        f"SELECT {self.COLUMNS} FROM qa_pairs "
+                        f"WHERE deleted = 0 AND uid IN ({placeholders})", batch
+                    )
+                )
+        return sorted(pairs, key=lambda p: p.uid)
+
+    def sample_problems(self, size: int, logiciels: Optional[Iterable[str]] = None) -> List[str]:
+        """Échantillon aléatoire de problèmes actifs (entraînement des index IVF), éventuellement par logiciel."""
+        query, params = "SELECT probleme FROM qa_pairs WHERE deleted = 0", []
+        if logiciels is not None:
+            logiciels = list(logiciels)
+            query += f" AND logiciel IN ({','.join('?' * len(logiciels))})"
+            params.extend(logiciels)
+        with self.connection() as conn:
+            return [row[0] for row in conn.execute(query + " ORDER BY RANDOM() LIMIT ?", (*params, size))]
+
+    def count_by_logiciel(self) -> Dict[str, int]:
+        """Nombre de lignes actives par valeur de logiciel."""
+        with self.connection() as conn:
+            return dict(conn.execute("SELECT COALESCE(logiciel, ''), COUNT(*) FROM qa_pairs "
+                                     "WHERE deleted = 0 GROUP BY COALESCE(logiciel, '')").fetchall())
+
+    def fetch_qa_pairs(self, since_uid: Optional[int] = None) -> List[QAPair]:
+        """Charge toutes les paires actives (ou celles dont l'uid dépasse since_uid)."""
+        return list(self.iter_qa_pairs(since_uid=since_uid))
+
+    def iter_qa_pairs(self, since_uid: Optional[int] = None,
+                      chunk_size: int = 1000) -> Iterator[QAPair]:
+        """Parcourt les paires actives par paquets de chunk_size, dans l'ordre des uid."""
+        query = f"SELECT {self.COLUMNS} FROM qa_pairs WHERE deleted = 0"
+        params: tuple = ()
+        if since_uid is not None:
+            query += " AND uid > ?"
+            params = (since_uid,)
+        query += " ORDER BY uid"
+
+        with self.connection() as conn:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield QAPair.from_row(row)
+
+    # --- Écriture ----------------------------------------------------------
+
+    def insert_qa_pairs(self, pairs: Iterable[QAPair], batch_size: int = 500) -> int:
+        """
+        Insère les paires par lots en ignorant les doublons de contenu.
+
+        Returns:
+            Nombre de lignes réellement insérées
+        """
+        inserted = 0
+        batch: List[QAPair] = []
+        for pair in pairs:
+            batch.append(pair)
+            if len(batch) >= batch_size:
+                with self.connection() as conn:
+                    inserted += self._insert_batch(conn, batch)
+                batch = []
+        if batch:
+            with self.connection() as conn:
+                inserted += self._insert_batch(conn, batch)
+        return inserted
+
+    def _insert_batch(self, conn: sqlite3.Connection, batch: List[QAPair]) -> int:
+        known = self._kb_uids_by_hash(conn, (p.hash for p in batch))
+        now = datetime.now().isoformat()
+        rows: Dict[str, tuple] = {}
+        for p in batch:
+            if p.hash in known or p.hash in rows:
+                continue
+            rows[p.hash] = (
+                p.uid, p.logiciel, p.probleme, p.solution, p.type_probleme,
+                p.hash, p.created_at or now, p.updated_at or now, p.kb_uid, 0
+            )
+        if not rows:
+            return 0
+
+        before = conn.total_changes
+        conn.executemany(
+            f"INSERT OR IGNORE INTO qa_pairs ({self.COLUMNS}) "
+            f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            list(rows.values())
+        )
+        return conn.total_changes - before
+
+    def delete_by_kb_uid(self, kb_uids: Iterable[str]) -> int:
+        """Supprime logiquement les versions actives des entrées données."""
+        with self.connection() as conn:
+            return self._delete_by_kb_uid(conn, kb_uids)
+
+    @staticmethod
+    def _delete_by_kb_uid(conn: sqlite3.Connection, kb_uids: Iterable[str]) -> int:
+        now = datetime.now().isoformat()
+        before = conn.total_changes
+        conn.executemany(
+            "UPDATE qa_pairs SET deleted = 1, updated_at = ? WHERE kb_uid = ? AND deleted = 0",
+            [(now, kb_uid) for kb_uid in kb_uids]
+        )
+        return conn.total_changes - before
+
+    def replace_by_kb_uid(self, pairs: Iterable[QAPair]) -> int:
+        """
+        Remplace la version active d'entrées modifiées.
+        L'ancienne ligne est supprimée logiquement et la nouvelle version reçoit
+        un nouvel uid : l'index retire l'ancien vecteur et ajoute le nouveau.
+        Suppression et insertion forment une seule transaction : une erreur entre
+        les deux ne laisse pas l'entrée sans version active.
+        """
+        pairs = [p for p in pairs if p.kb_uid]
+        if not pairs:
+            return 0
+        with self.connection() as conn:
+            self._delete_by_kb_uid(conn, (p.kb_uid for p in pairs))
+            return self._insert_batch(conn, pairs)
+
+    def merge_by_kb_uid(self, pairs: Iterable[QAPair]) -> int:
+        """
+        Entrées dont le nouveau contenu existe déjà dans une autre ligne active
+        (même empreinte) : leur ancienne version est supprimée logiquement, et la
+        ligne existante leur est rattachée si elle n'appartient à aucune entrée.
+        Sinon le contenu reste à l'entrée qui le possède (fusion).
+
+        Returns:
+            Nombre de lignes supprimées ou rattachées
+        """
+        pairs = [p for p in pairs if p.kb_uid]
+        if not pairs:
+            return 0
+        now = datetime.now().isoformat()
+        with self.connection() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "UPDATE qa_pairs SET deleted = 1, updated_at = ? "
+                "WHERE kb_uid = ? AND hash != ? AND deleted = 0",
+                [(now, p.kb_uid, p.hash) for p in pairs]
+            )
+            conn.executemany(
+                "UPDATE qa_pairs SET kb_uid = ?, updated_at = ? "
+                "WHERE hash = ? AND kb_uid IS NULL AND deleted = 0",
+                [(p.kb_uid, now, p.hash) for p in pairs]
+            )
+            return conn.total_changes - before
+
+
+_storages: Dict[Path, QAStorage] = {}
+_storages_lock = threading.Lock()
+
+
+def get_storage(db_path: Optional[Path] = None) -> QAStorage:
+    """Retourne l'instance partagée de QAStorage pour ce chemin (DB_PATH par défaut)."""
+    path = (Path(db_path) if db_path else get_db_path()).resolve()
+    with _storages_lock:
+        if path not in _storages:
+            _storages[path] = QAStorage(path)
+        return _storages[path]
@@ -0,0 +1,102 @@
+"""
+BUDGET DE THREADS CPU DU CHEMIN DE REQUÊTE
+Par défaut torch (intra-op), FAISS (OpenMP), onnxruntime et BLAS ouvrent
+chacun autant de threads que de cœurs. Avec plusieurs sessions qui cherchent
+en même temps, ces pools se disputent les cœurs (sur-souscription) et la
+latence de queue explose. Le budget répartit les cœurs entre les requêtes
+simultanées : `workers` requêtes en parallèle (taille des exécuteurs bornés),
+chacune avec cœurs / workers threads de calcul.
+
+Les variables d'environnement ne s'appliquent qu'aux bibliothèques pas encore
+chargées (torch, importé par le backend d'encodage, et les sous-processus).
+Le réglage OpenMP de FAISS (et d'un BLAS OpenMP) est propre à chaque thread :
+limit_current_thread() l'applique dans le thread qui cherche, en initialiseur
+des exécuteurs et au début de chaque recherche (threads Streamlit, serveur HTTP).
+"""
+
+import logging
+import os
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_current: Optional["ThreadBudget"] = None
+_local = threading.local()
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+@dataclass(frozen=True)
+class ThreadBudget:
+    """Requêtes simultanées et threads de calcul accordés à chacune."""
+    workers: int
+    threads_per_worker: int
+    cores: int
+
+
+def available_cores() -> int:
+    """Cœurs utilisables par le processus (affinité CPU / quotas de conteneur compris)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def plan_thread_budget(workers: int, cores: Optional[int] = None) -> ThreadBudget:
+    cores = cores or available_cores()
+    workers = max(1, workers)
+    return ThreadBudget(workers=workers, threads_per_worker=max(1, cores // workers), cores=cores)
+
+
+def _limit_openmp(threads: int) -> None:
+    import faiss
+    faiss.omp_set_num_threads(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)  # BLAS de numpy déjà chargé
+    except ImportError:
+        pass
+    _local.threads = threads
+
+
+def limit_current_thread() -> None:
+    """
+    Applique le budget courant au thread appelant (OpenMP de FAISS et du BLAS),
+    une seule fois par thread. Sans budget appliqué, ne fait rien.
+    """
+    budget = _current
+    if budget is not None and getattr(_local, "threads", None) != budget.threads_per_worker:
+        _limit_openmp(budget.threads_per_worker)
+
+
+def apply_thread_budget(workers: int, cores: Optional[int] = None) -> ThreadBudget:
+    """
+    Fixe les threads de torch, FAISS et BLAS pour `workers` requêtes simultanées.
+
+    Args:
+        workers: Requêtes traitées en parallèle (les suivantes attendent dans l'exécuteur)
+        cores: Cœurs à partager (par défaut: ceux disponibles pour le processus)
+
+    Returns:
+        Le budget appliqué (threads_per_worker à passer aux encodeurs ONNX)
+    """
+    budget = plan_thread_budget(workers, cores)
+    threads = budget.threads_per_worker
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+
+    # torch n'est importé que par le backend torch : réglé à chaud s'il est déjà chargé,
+    # sinon il lit OMP_NUM_THREADS à l'import
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+    global _current
+    _current = budget
+    # Thread appelant ; les autres appliquent le budget via limit_current_thread()
+    _limit_openmp(threads)
+
+    logger.info(f"Budget de threads: {budget.workers} requêtes simultanées x {threads} threads "
+                f"({budget.cores} cœurs)")
+    return budget
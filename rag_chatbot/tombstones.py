@@ -0,0 +1,95 @@
+"""
+Bitmap de « pierres tombales » pour l'index FAISS.
+Un uid marqué ici est supprimé ou remplacé : il reste physiquement dans l'index
+jusqu'à la prochaine compaction, mais il est filtré au moment de la recherche.
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def tombstone_path_for(index_path: Path) -> Path:
+    """Fichier de tombstones associé à un index (db/faiss_index.index -> db/faiss_index.index.tombstones.npy)."""
+    index_path = Path(index_path)
+    return index_path.with_name(index_path.name + ".tombstones.npy")
+
+
+class TombstoneBitmap:
+    """Bitmap compacte (1 bit par uid) persistée en .npy, rechargée à chaud par les lecteurs."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._bits = np.zeros(0, dtype=np.uint8)
+        self._mtime: Optional[float] = None
+        self.load()
+
+    def load(self) -> None:
+        """(Re)charge la bitmap depuis le disque (vide si le fichier n'existe pas)."""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            self._bits = np.zeros(0, dtype=np.uint8)
+            self._mtime = None
+            return
+        self._bits = np.load(self.path)
+        self._mtime = stat.st_mtime
+
+    def reload_if_changed(self) -> bool:
+        """Recharge si le fichier a été réécrit par un autre processus (un simple stat)."""
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self.load()
+        return True
+
+    def save(self) -> None:
+        """Écriture atomique : les lecteurs voient l'ancienne ou la nouvelle version, jamais un mélange."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, self._bits)
+        os.replace(tmp_path, self.path)
+        self._mtime = self.path.stat().st_mtime
+
+    def add(self, ids: Iterable[int]) -> None:
+        ids = np.fromiter(ids, dtype=np.int64)
+        if ids.size == 0:
+            return
+        needed = int(ids.max()) // 8 + 1
+        if needed > self._bits.size:
+            self._bits = np.concatenate([self._bits, np.zeros(needed - self._bits.size, dtype=np.uint8)])
+        np.bitwise_or.at(self._bits, ids // 8, (1 << (ids % 8)).astype(np.uint8))
+
+    def discard(self, ids: Iterable[int]) -> None:
+        ids = np.fromiter(ids, dtype=np.int64)
+        ids = ids[(ids >= 0) & (ids // 8 < self._bits.size)]
+        if ids.size:
+            np.bitwise_and.at(self._bits, ids // 8, (~(1 << (ids % 8))).astype(np.uint8))
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        """Masque booléen vectorisé : True pour les uids marqués."""
+        ids = np.asarray(ids, dtype=np.int64)
+        mask = np.zeros(ids.shape, dtype=bool)
+        inside = (ids >= 0) & (ids // 8 < self._bits.size)
+        valid = ids[inside]
+        mask[inside] = (self._bits[valid // 8] >> (valid % 8)) & 1 == 1
+        return mask
+
+    def ids(self) -> np.ndarray:
+        """uids marqués, triés."""
+        return np.flatnonzero(np.unpackbits(self._bits, bitorder="little")).astype(np.int64)
+
+    def clear(self) -> None:
+        self._bits = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return int(np.unpackbits(self._bits).sum()) if self._bits.size else 0
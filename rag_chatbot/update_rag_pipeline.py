@@ -1,17 +1,19 @@
 #!/usr/bin/env python3
 """
 SCRIPT DE MISE À JOUR RAG
-1. Prend les données de knowledge_base.jsonl
-2. Les stocke dans la base SQLite qa_database.db (en respectant le schéma existant)
-3. Appelle la fonction d'indexation de embe_index.py
+1. Prend les nouvelles lignes de knowledge_base.jsonl (lecture incrémentale par offset)
+2. Les stocke dans la base SQLite partagée (storage.py, variable DB_PATH)
+3. Met à jour l'index FAISS (incrémental par défaut) via embed_and_index.py
 """
 
-import json
-import sqlite3
+import argparse
 import logging
 import sys
+import time
 from pathlib import Path
-from datetime import datetime
+
+from knowledge_base import KnowledgeBaseTail, fold_entry_operations
+from storage import QAPair, get_storage
 
 # Configuration du logging
 logging.basicConfig(
@@ -21,48 +23,34 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class RAGPipelineUpdater:
-    def __init__(self):
-        self.knowledge_base_path = "knowledge_base.jsonl"
-        # Utiliser la même base de données que l'ancienne structure
-        self.database_path = "db/qa_database_updated.db"
+    def __init__(self, knowledge_base_path="knowledge_base.jsonl"):
+        self.knowledge_base_path = knowledge_base_path
+        # Base partagée avec export_to_sqlite et DocumentEmbedder (voir storage.py)
+        self.storage = get_storage()
+        self.database_path = self.storage.db_path
+        # Position du dernier octet traité, conservée à côté de la base
+        self.kb_tail = KnowledgeBaseTail(
+            self.knowledge_base_path,
+            offset_path=Path(self.database_path).with_name("knowledge_base.offset.json")
+        )
         
     def load_knowledge_base(self):
-        """Charge les données de knowledge_base.jsonl"""
-        logger.info(f"Chargement de {self.knowledge_base_path}...")
+        """
+        Retourne un itérateur paresseux sur les lignes ajoutées à knowledge_base.jsonl
+        depuis le dernier passage réussi (None si le fichier est absent).
+        """
+        logger.info(f"Chargement de {self.knowledge_base_path} à partir de l'octet {self.kb_tail.offset}...")
         
-        try:
-            with open(self.knowledge_base_path, 'r', encoding='utf-8') as f:
-                data = [json.loads(line.strip()) for line in f if line.strip()]
-            
-            logger.info(f"{len(data)} entrées chargées")
-            return data
-        except Exception as e:
-            logger.error(f"Erreur lors du chargement: {e}")
+        if not Path(self.knowledge_base_path).exists():
+            logger.error(f"Erreur lors du chargement: {self.knowledge_base_path} introuvable")
             return None
+        return self.kb_tail.read_new()
     
     def init_database(self):
-        """Initialise la base de données SQLite avec le schéma existant"""
+        """Initialise la base de données SQLite et applique les migrations"""
         try:
-            # Créer le dossier db s'il n'existe pas
-            Path("db").mkdir(exist_ok=True)
-            
-            conn = sqlite3.connect(self.database_path)
-            cursor = conn.cursor()
-            
-            # Créer la table avec le schéma existant (AUTOINCREMENT)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS qa_pairs (
-                    uid INTEGER PRIMARY KEY AUTOINCREMENT,
-                    logiciel TEXT,
-                    probleme TEXT,
-                    solution TEXT,
-                    type_probleme TEXT
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            logger.info("Base de données initialisée avec le schéma AUTOINCREMENT")
+            self.storage.init_db()
+            logger.info(f"Base de données initialisée: {self.database_path}")
             return True
             
         except Exception as e:
@@ -72,14 +60,7 @@ class RAGPipelineUpdater:
     def get_max_existing_uid(self):
         """Récupère le UID maximum existant dans la base"""
         try:
-            conn = sqlite3.connect(self.database_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT MAX(uid) FROM qa_pairs")
-            result = cursor.fetchone()
-            max_uid = result[0] if result[0] is not None else 0
-            
-            conn.close()
+            max_uid = self.storage.max_uid()
             logger.info(f"UID maximum existant: {max_uid}")
             return max_uid
             
@@ -90,113 +71,121 @@ class RAGPipelineUpdater:
     def entry_exists(self, logiciel, probleme, solution):
         """Vérifie si une entrée existe déjà basée sur le contenu (pour éviter les doublons)"""
         try:
-            conn = sqlite3.connect(self.database_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT uid FROM qa_pairs 
-                WHERE logiciel = ? AND probleme = ? AND solution = ?
-            ''', (logiciel, probleme, solution))
-            
-            exists = cursor.fetchone()
-            conn.close()
-            return exists is not None
+            return self.storage.exists(logiciel, probleme, solution)
             
         except Exception as e:
             logger.error(f"Erreur vérification existence entrée: {e}")
             return False
     
     def validate_and_clean_data(self, data):
-        """Valide et nettoie les données avant insertion"""
-        cleaned_data = []
+        """
+        Valide et nettoie les données avant insertion.
+
+        Returns:
+            (nouvelles entrées, entrées dont le contenu existe déjà sous une autre entrée)
+        """
+        candidates = []
         
         for item in data:
             # Nettoyer les champs
-            cleaned_item = {
-                'logiciel': str(item.get('logiciel', '')).strip(),
-                'probleme': str(item.get('probleme', '')).strip(),
-                'solution': str(item.get('solution', '')).strip(),
-                'type_probleme': str(item.get('type_probleme', 'Général')).strip()
-            }
+            cleaned_item = QAPair(
+                logiciel=str(item.get('logiciel', '')).strip(),
+                probleme=str(item.get('probleme', '')).strip(),
+                solution=str(item.get('solution', '')).strip(),
+                type_probleme=str(item.get('type_probleme', 'Général')).strip(),
+                kb_uid=item.get('uid')
+            )
             
             # Vérifier que les champs obligatoires ne sont pas vides
-            if not cleaned_item['logiciel'] or not cleaned_item['probleme'] or not cleaned_item['solution']:
+            if not cleaned_item.logiciel or not cleaned_item.probleme or not cleaned_item.solution:
                 logger.warning(f"Entrée ignorée - champs obligatoires manquants: {cleaned_item}")
                 continue
             
-            # Vérifier si l'entrée existe déjà
-            if self.entry_exists(cleaned_item['logiciel'], cleaned_item['probleme'], cleaned_item['solution']):
-                logger.info(f"Entrée déjà existante ignorée: {cleaned_item['logiciel']} - {cleaned_item['probleme'][:50]}...")
+            candidates.append(cleaned_item)
+        
+        # Vérifier en une seule passe les entrées déjà existantes (par empreinte de contenu)
+        owners = self.storage.kb_uids_by_hash(item.hash for item in candidates)
+        # Contenus que leur entrée quitte dans ce même lot (échange de contenu entre deux entrées)
+        new_hashes = {item.kb_uid: item.hash for item in candidates if item.kb_uid}
+        released = {h for h, owner in owners.items() if owner in new_hashes and new_hashes[owner] != h}
+        cleaned_data, merges = [], []
+        for item in candidates:
+            if item.hash in owners and item.hash not in released:
+                owner = owners[item.hash]
+                if item.kb_uid and owner != item.kb_uid:
+                    # Modification (ou nouvel uid) dont le contenu est celui d'une autre ligne
+                    logger.info(f"Entrée {item.kb_uid} fusionnée avec la ligne existante "
+                                f"({owner or 'sans entrée'}): {item.logiciel} - {item.probleme[:50]}...")
+                    merges.append(item)
+                else:
+                    logger.info(f"Entrée déjà existante ignorée: {item.logiciel} - {item.probleme[:50]}...")
                 continue
-            
-            cleaned_data.append(cleaned_item)
+            owners[item.hash] = item.kb_uid
+            released.discard(item.hash)
+            cleaned_data.append(item)
         
-        logger.info(f"Données validées: {len(cleaned_data)} nouvelles entrées après nettoyage")
-        return cleaned_data
+        logger.info(f"Données validées: {len(cleaned_data)} nouvelles entrées après nettoyage, "
+                    f"{len(merges)} fusionnées")
+        return cleaned_data, merges
     
     def insert_into_database(self, data):
-        """Insère les données dans la base SQLite en respectant AUTOINCREMENT"""
+        """
+        Insère les données dans la base SQLite en respectant AUTOINCREMENT.
+        Les erreurs SQLite (base verrouillée, etc.) sont propagées : l'appelant
+        ne doit pas avancer l'offset sur des lignes non écrites.
+        """
         logger.info("Insertion des données dans la base...")
         
-        try:
-            # Nettoyer et valider les données
-            cleaned_data = self.validate_and_clean_data(data)
-            if not cleaned_data:
-                logger.warning("Aucune nouvelle donnée à insérer après validation")
-                return 0
-            
-            conn = sqlite3.connect(self.database_path)
-            cursor = conn.cursor()
-            
-            inserted_count = 0
-            error_count = 0
-            
-            for item in cleaned_data:
-                try:
-                    # Insertion sans spécifier l'uid (géré par AUTOINCREMENT)
-                    cursor.execute('''
-                        INSERT INTO qa_pairs (logiciel, probleme, solution, type_probleme)
-                        VALUES (?, ?, ?, ?)
-                    ''', (
-                        item['logiciel'], 
-                        item['probleme'], 
-                        item['solution'], 
-                        item['type_probleme']
-                    ))
-                    inserted_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Erreur insertion entrée: {e}")
-                    error_count += 1
-                    continue
-            
-            conn.commit()
-            
-            # Récupérer le nombre total d'entrées
-            cursor.execute("SELECT COUNT(*) FROM qa_pairs")
-            total_count = cursor.fetchone()[0]
-            
-            conn.close()
-            
-            logger.info(f"Insertion terminée: {inserted_count} nouvelles entrées, {error_count} erreurs")
-            logger.info(f"Total d'entrées dans la base: {total_count}")
-            
-            return inserted_count
-            
-        except Exception as e:
-            logger.error(f"Erreur insertion base de données: {e}")
+        # Nettoyer et valider les données
+        cleaned_data, merges = self.validate_and_clean_data(data)
+        merged_count = self.storage.merge_by_kb_uid(merges)
+        if not cleaned_data:
+            logger.warning("Aucune nouvelle donnée à insérer après validation")
+            return merged_count
+        
+        # Entrées déjà connues (même uid knowledge_base) au contenu modifié: nouvelle version
+        current = self.storage.live_hashes_by_kb_uid(item.kb_uid for item in cleaned_data if item.kb_uid)
+        replacements = [item for item in cleaned_data if item.kb_uid in current]
+        additions = [item for item in cleaned_data if item.kb_uid not in current]
+        
+        # Insertion par lots sans spécifier l'uid (géré par AUTOINCREMENT)
+        replaced_count = self.storage.replace_by_kb_uid(replacements)
+        inserted_count = self.storage.insert_qa_pairs(additions)
+        total_count = self.storage.count()
+        
+        logger.info(f"Insertion terminée: {inserted_count} nouvelles entrées, {replaced_count} entrées modifiées, "
+                    f"{merged_count} fusionnées")
+        logger.info(f"Total d'entrées dans la base: {total_count}")
+        
+        return inserted_count + replaced_count + merged_count
+    
+    def delete_from_database(self, kb_uids):
+        """Supprime (logiquement) les entrées retirées de knowledge_base.jsonl (erreurs propagées)"""
+        if not kb_uids:
             return 0
+        deleted_count = self.storage.delete_by_kb_uid(kb_uids)
+        logger.info(f"Suppression terminée: {deleted_count} entrées retirées")
+        return deleted_count
     
-    def run_indexation(self):
-        """Exécute la fonction d'indexation de embe_index.py"""
+    def run_indexation(self, incremental=True, embedder=None):
+        """
+        Exécute l'indexation de embed_and_index.py.
+        En mode incrémental, seules les lignes plus récentes que l'index sont encodées.
+
+        Args:
+            embedder: DocumentEmbedder déjà construit (réutilisé par watch), sinon un nouveau
+        """
         logger.info("Lancement de l'indexation FAISS...")
         
         try:
             # Import dynamique pour éviter les problèmes de circular imports
             from embed_and_index import DocumentEmbedder
             
-            embedder = DocumentEmbedder()
-            embedder.create_and_save_index()
+            embedder = embedder or DocumentEmbedder()
+            if incremental:
+                embedder.update_index()
+            else:
+                embedder.create_and_save_index()
             
             logger.info("Indexation terminée avec succès")
             return True
@@ -205,13 +194,16 @@ class RAGPipelineUpdater:
             logger.error(f"Erreur lors de l'indexation: {e}")
             return False
     
-    def run(self):
-        """Exécute le pipeline complet"""
+    def run(self, incremental=True, index=True, embedder=None):
+        """
+        Exécute le pipeline complet (index=False: s'arrête après l'écriture en base).
+        L'offset n'avance que si les lignes lues ont été écrites (et indexées).
+        """
         logger.info("DÉBUT DU PIPELINE RAG")
         
-        # 1. Charger les données
+        # 1. Charger les nouvelles lignes
         data = self.load_knowledge_base()
-        if not data:
+        if data is None:
             logger.error("Échec du chargement des données")
             return False
         
@@ -223,24 +215,68 @@ class RAGPipelineUpdater:
         # 3. Récupérer le UID max actuel (pour information)
         current_max_uid = self.get_max_existing_uid()
         
-        # 4. Insérer les nouvelles données
-        count = self.insert_into_database(data)
-        if count == 0:
+        # 4. Rejouer les ajouts, modifications et suppressions des nouvelles lignes
+        entries = fold_entry_operations(data, keep_deleted=True)
+        logger.info(f"{len(entries)} entrées nouvelles ou modifiées chargées")
+        if not entries and incremental:
+            self.kb_tail.commit()
+            logger.info("Aucune nouvelle ligne dans la base de connaissances")
+            return True
+        
+        try:
+            deleted = self.delete_from_database([e['uid'] for e in entries if e.get('deleted')])
+            count = self.insert_into_database([e for e in entries if not e.get('deleted')])
+        except Exception as e:
+            # Offset conservé : les mêmes lignes seront relues au prochain passage
+            logger.error(f"Erreur écriture base de données: {e}")
+            return False
+        if count == 0 and deleted == 0:
             logger.warning("Aucune nouvelle donnée insérée (peut-être que toutes existent déjà)")
             # Continuer quand même le processus
         
-        # 5. Lancer l'indexation (décommenter si nécessaire)
-        # if not self.run_indexation():
-        #     logger.error("Échec de l'indexation")
-        #     return False
+        # 5. Lancer l'indexation (incrémentale: seules les nouvelles lignes sont encodées)
+        if index and not self.run_indexation(incremental=incremental, embedder=embedder):
+            logger.error("Échec de l'indexation")
+            return False
+        
+        # 6. Les lignes sont stockées et indexées : on peut avancer l'offset
+        self.kb_tail.commit()
         
         logger.info("PIPELINE TERMINÉ AVEC SUCCÈS")
         return True
+    
+    def watch(self, interval=0.5):
+        """Mode surveillance : traite les nouvelles lignes dès qu'elles apparaissent"""
+        logger.info(f"Surveillance de {self.knowledge_base_path} (toutes les {interval}s, Ctrl+C pour arrêter)")
+        from embed_and_index import DocumentEmbedder
+        # Un seul embedder (modèle chargé une fois) pour toute la surveillance
+        embedder = DocumentEmbedder()
+        try:
+            while True:
+                if self.kb_tail.has_new_data() and not self.run(embedder=embedder):
+                    logger.warning("Passage en échec, nouvelles tentatives au prochain intervalle")
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            logger.info("Surveillance arrêtée")
 
 def main():
     """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Mise à jour de la base RAG depuis knowledge_base.jsonl")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="reconstruit tout l'index FAISS au lieu de l'indexation incrémentale")
+    parser.add_argument("--from-start", action="store_true",
+                        help="oublie l'offset enregistré et relit tout knowledge_base.jsonl")
+    parser.add_argument("--watch", action="store_true",
+                        help="reste actif et ingère les nouvelles lignes en continu")
+    args = parser.parse_args()
+    
     updater = RAGPipelineUpdater()
-    success = updater.run()
+    if args.from_start:
+        updater.kb_tail.reset()
+    if args.watch:
+        updater.watch()
+        return
+    success = updater.run(incremental=not args.full_rebuild)
     sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
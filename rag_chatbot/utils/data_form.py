@@ -6,6 +6,7 @@ from typing import List, Optional, Tuple, Dict
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+from knowledge_base import fold_entry_operations
 
 class DataEntryForm:
     """Formulaire de saisie de données pour l'admin"""
@@ -33,17 +34,58 @@ class DataEntryForm:
         except Exception as e:
             return False, f"Erreur lors de la sauvegarde: {str(e)}"
     
+    def _append_record(self, record: Dict) -> None:
+        """Ajoute un enregistrement au fichier (le fichier reste en ajout seul)"""
+        with open(self.data_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    
+    def update_entry(self, uid: str, logiciel: str, probleme: str, solution: str,
+                     type_probleme: Optional[str] = None) -> Tuple[bool, str]:
+        """Enregistre une correction d'entrée (opération 'update' rejouée par le pipeline RAG)"""
+        try:
+            if type_probleme is None:
+                # Le pipeline ne relit que les nouvelles lignes : le type doit accompagner la correction
+                current = next((e for e in self.get_all_entries() if e.get('uid') == uid), {})
+                type_probleme = current.get('type_probleme')
+            record = {
+                "op": "update",
+                "uid": uid,
+                "logiciel": logiciel.strip(),
+                "probleme": probleme.strip(),
+                "solution": solution.strip(),
+                "updated_at": datetime.now().isoformat()
+            }
+            if type_probleme:
+                record["type_probleme"] = type_probleme
+            self._append_record(record)
+            return True, "Entrée mise à jour avec succès!"
+        except Exception as e:
+            return False, f"Erreur lors de la mise à jour: {str(e)}"
+    
+    def delete_entry(self, uid: str) -> Tuple[bool, str]:
+        """Enregistre la suppression d'une entrée (opération 'delete' rejouée par le pipeline RAG)"""
+        try:
+            self._append_record({
+                "op": "delete",
+                "uid": uid,
+                "updated_at": datetime.now().isoformat()
+            })
+            return True, "Entrée supprimée avec succès!"
+        except Exception as e:
+            return False, f"Erreur lors de la suppression: {str(e)}"
+    
     def get_all_entries(self) -> List[Dict]:
-        """Récupère toutes les entrées de la base de connaissances"""
-        entries = []
+        """Récupère toutes les entrées de la base de connaissances (modifications et suppressions appliquées)"""
+        records = []
         if self.data_file.exists():
             try:
                 with open(self.data_file, "r", encoding="utf-8") as f:
                     for line in f:
-                        entries.append(json.loads(line))
+                        if line.strip():
+                            records.append(json.loads(line))
             except:
                 pass
-        return entries
+        return fold_entry_operations(records)
     
     def get_entries_by_software(self, software: str) -> List[Dict]:
         """Récupère les entrées pour un logiciel spécifique"""
@@ -122,6 +164,27 @@ def render_data_entry_form(data_form):
                     st.write(f"**Problème:** {entry['probleme']}")
                     st.write(f"**Solution:** {entry['solution']}")
                 with col2:
-                    st.caption(f"**Créé le:** {entry['created_at'][:10]}")
+                    st.caption(f"**Créé le:** {entry.get('created_at', '')[:10]}")
+                    if entry.get('uid') and st.button("Supprimer", key=f"delete_{entry['uid']}"):
+                        success, message = data_form.delete_entry(entry['uid'])
+                        if success:
+                            st.success(message)
+                            st.rerun()
+                        else:
+                            st.error(message)
+                
+                if entry.get('uid'):
+                    with st.form(f"edit_{entry['uid']}"):
+                        new_probleme = st.text_area("Problème", value=entry['probleme'], key=f"pb_{entry['uid']}")
+                        new_solution = st.text_area("Solution", value=entry['solution'], key=f"sol_{entry['uid']}")
+                        if st.form_submit_button("Mettre à jour"):
+                            success, message = data_form.update_entry(
+                                entry['uid'], entry['logiciel'], new_probleme, new_solution
+                            )
+                            if success:
+                                st.success(message)
+                                st.rerun()
+                            else:
+                                st.error(message)
     else:
         st.info(" Aucune entrée dans la base de connaissances. Commencez par en ajouter une ci-dessus.")
\ No newline at end of file
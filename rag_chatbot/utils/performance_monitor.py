@@ -65,6 +65,11 @@ class PerformanceMonitor:
         def mean_safe(col):
             return float(df[col].mean()) if col in df.columns and len(df[col].dropna()) > 0 else 0.0
 
+        # Réponses données sans appel au LLM (seuils de confiance, voir RAGChatbot._gate)
+        answered = df[~df["cached"].astype(bool)] if "cached" in df.columns else df
+        sources = answered["answer_source"].value_counts() if "answer_source" in answered.columns else {}
+        llm_calls_avoided = int(sources.get("direct", 0) + sources.get("support", 0))
+
         return {
             "avg_total_time": mean_safe("total_time"),
             "avg_retrieval_time": mean_safe("retrieval_time"),
@@ -72,7 +77,11 @@ class PerformanceMonitor:
             "cache_hit_rate": cache_hit_rate,
             "total_requests": total_requests,
             "cached_requests": cached_requests,
-            "uncached_requests": total_requests - cached_requests
+            "uncached_requests": total_requests - cached_requests,
+            "direct_answers": int(sources.get("direct", 0)),
+            "support_answers": int(sources.get("support", 0)),
+            "llm_calls_avoided": llm_calls_avoided,
+            "llm_calls": total_requests - cached_requests - llm_calls_avoided
         }
 
     def get_recent_metrics(self, limit: int = 50) -> List[Dict]:
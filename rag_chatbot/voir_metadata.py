@@ -1,13 +1,24 @@
-import pickle
+from pathlib import Path
 
-with open("db/metadata.pkl", "rb") as f:
-    metadata = pickle.load(f)
+from index_snapshots import METADATA_FILE, SnapshotStore, read_metadata
+from metadata_store import METADATA_DB_FILE, InMemoryMetadata, MetadataStore
+
+# Instantané courant si l'index est versionné, sinon l'ancien fichier
+store = SnapshotStore("db/index")
+version = store.current_version()
+folder = store.version_dir(version) if version else Path("db")
+
+# Base indexée : seules les lignes affichées sont lues
+if (folder / METADATA_DB_FILE).exists():
+    metadata = MetadataStore(folder)
+else:
+    metadata = InMemoryMetadata(read_metadata(folder / METADATA_FILE))
 
 # Affiche le nombre d'éléments
-print(f"Nombre de documents indexés : {len(metadata)}")
+print(f"Nombre de documents indexés : {len(metadata)}" + (f" (version {version})" if version else ""))
 
 # Affiche les 5 premiers éléments
-for i in range(min(5, len(metadata))):
+for i, document in enumerate(metadata.head(5)):
     print(f"\nDocument {i} :")
-    for key, value in metadata[i].items():
+    for key, value in document.items():
         print(f"  {key}: {value}")